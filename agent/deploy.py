@@ -7,6 +7,13 @@ from vertexai.preview import reasoning_engines
 from root_agent.agent import root_agent
 
 DISPLAY_NAME = "gemini_agent"
+# Keep in step with pyproject.toml: map/mcp_pool.py and map/tool_cache.py use
+# private parts of google-adk 1.2, and talk to the MCP servers with mcp.
+REQUIREMENTS = [
+    "google-cloud-aiplatform[adk,agent_engines]",
+    "google-adk>=1.2.1,<1.3",
+    "mcp>=1.8.0",
+]
 
 load_dotenv()
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
@@ -44,9 +51,7 @@ if len(remote_apps) == 0:
     remote_app = agent_engines.create(
         display_name=DISPLAY_NAME,
         agent_engine=root_agent,
-        requirements=[
-            "google-cloud-aiplatform[adk,agent_engines]"
-        ],
+        requirements=REQUIREMENTS,
         extra_packages=[
             "root_agent",
             "map",
@@ -58,9 +63,7 @@ else:
     remote_app = remote_apps[0].update(
         display_name=DISPLAY_NAME,
         agent_engine=root_agent,
-        requirements=[
-            "google-cloud-aiplatform[adk,agent_engines]"
-        ],
+        requirements=REQUIREMENTS,
         extra_packages=[
             "root_agent",
             "map",
@@ -3,31 +3,28 @@
 import os
 from dotenv import load_dotenv
 from google.adk.agents.llm_agent import LlmAgent
-from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
+from .mcp_pool import MCPServerPool, PooledMCPToolset, server_parameters
+from .tool_cache import tool_result_cache
 
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 MODEL = "gemini-2.0-flash"
 
+# Server processes kept across queries, instead of one `npx -y` per query.
+# Pass the API key as an environment variable to the server process.
+# This is how the MCP server for Google Maps expects the key.
+map_server_pool = MCPServerPool(server_parameters(env={"GOOGLE_MAPS_API_KEY": API_KEY}))
+
 
 root_agent = LlmAgent(
     name='maps_assistant_agent',
     model=MODEL,
     instruction='Help the user with mapping, directions, and finding places using Google Maps tools.',
     tools=[
-        MCPToolset(
-            connection_params=StdioServerParameters(
-                command='npx',
-                args=[
-                    "-y",
-                    "@modelcontextprotocol/server-google-maps",
-                ],
-                # Pass the API key as an environment variable to the npx process
-                # This is how the MCP server for Google Maps expects the key.
-                env={
-                    "GOOGLE_MAPS_API_KEY": API_KEY,
-                }
-            ),
+        PooledMCPToolset(
+            pool=map_server_pool,
+            # Repeated geocoding, place and route lookups are answered from the cache.
+            cache=tool_result_cache,
             # You can filter for specific Maps tools if needed:
             # tool_filter=['get_directions', 'find_place_by_id']
         )
@@ -0,0 +1,299 @@
+"""Pool of Google Maps MCP server processes shared by every query of the map agent.
+
+Agent Engine runs each query on a new event loop, and an MCP stdio session
+belongs to the loop that started it. MCPToolset therefore started a new
+`npx -y @modelcontextprotocol/server-google-maps`, resolving the package and
+booting Node, for most queries that used a map tool. MCPServerPool keeps the
+server processes on an event loop of its own, in a background thread, and
+every query calls them through it:
+
+- up to MAP_MCP_POOL_SIZE processes, each serving MAP_MCP_MAX_CONCURRENCY
+  calls at once; callers wait for a free one beyond that.
+- MAP_MCP_POOL_MIN_SIZE processes are kept warm once the pool is used.
+- processes idle for MAP_MCP_HEALTH_INTERVAL seconds are pinged, and broken
+  ones are replaced; calls that fail on a broken process are tried once more.
+- processes are replaced after MAP_MCP_MAX_LIFETIME seconds, once idle.
+
+MAP_MCP_SERVER_COMMAND runs a pre-installed server instead of `npx -y`, e.g.
+the `mcp-server-google-maps` binary of
+`npm install -g @modelcontextprotocol/server-google-maps@<version>`.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import shlex
+import threading
+import time
+from datetime import timedelta
+
+from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
+from mcp import ClientSession
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+
+from .tool_cache import CachedMCPTool, ToolResultCache
+
+MCP_SERVER_PACKAGE = os.getenv("MAP_MCP_SERVER_PACKAGE", "@modelcontextprotocol/server-google-maps")
+# A pre-installed server to run instead of fetching MCP_SERVER_PACKAGE with npx -y.
+MCP_SERVER_COMMAND = os.getenv("MAP_MCP_SERVER_COMMAND")
+MCP_POOL_SIZE = int(os.getenv("MAP_MCP_POOL_SIZE", "2"))
+MCP_POOL_MIN_SIZE = int(os.getenv("MAP_MCP_POOL_MIN_SIZE", "1"))
+MCP_MAX_CONCURRENCY = int(os.getenv("MAP_MCP_MAX_CONCURRENCY", "4"))
+MCP_MAX_LIFETIME = float(os.getenv("MAP_MCP_MAX_LIFETIME", "3600"))
+MCP_HEALTH_INTERVAL = float(os.getenv("MAP_MCP_HEALTH_INTERVAL", "30"))
+MCP_CALL_TIMEOUT = float(os.getenv("MAP_MCP_CALL_TIMEOUT", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+def server_parameters(env: dict | None = None) -> StdioServerParameters:
+    """How to start the Google Maps MCP server: the pinned binary, or npx."""
+    if MCP_SERVER_COMMAND:
+        command, *args = shlex.split(MCP_SERVER_COMMAND)
+        return StdioServerParameters(command=command, args=args, env=env)
+    return StdioServerParameters(command="npx", args=["-y", MCP_SERVER_PACKAGE], env=env)
+
+
+class _Server:
+    """One server process and its session, owned by a task on the pool loop."""
+
+    def __init__(self, params: StdioServerParameters, timeout: float):
+        self.session = None
+        self.started_at = self.used_at = time.monotonic()
+        self.active = 0  # calls in progress
+        self.broken = False
+        self._error = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        # anyio requires the process to be stopped by the task that started it.
+        self._task = asyncio.create_task(self._run(params, timeout))
+
+    async def _run(self, params: StdioServerParameters, timeout: float):
+        try:
+            async with stdio_client(params) as (read, write), ClientSession(
+                read, write, read_timeout_seconds=timedelta(seconds=timeout)
+            ) as session:
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            logger.warning("MCP server stopped: %r", e)
+        finally:
+            self.broken = True
+            self._ready.set()
+
+    async def ready(self) -> ClientSession:
+        """The session, once the server has started."""
+        await self._ready.wait()
+        if self.broken:
+            raise RuntimeError("MCP server is not running") from self._error
+        return self.session
+
+    def expired(self, max_lifetime: float) -> bool:
+        return self.broken or time.monotonic() - self.started_at > max_lifetime
+
+    async def close(self):
+        self._stop.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class MCPServerPool:
+    """MCP server processes kept warm on a background event loop."""
+
+    def __init__(
+        self,
+        params: StdioServerParameters,
+        size: int = MCP_POOL_SIZE,
+        min_size: int = MCP_POOL_MIN_SIZE,
+        max_concurrency: int = MCP_MAX_CONCURRENCY,
+        max_lifetime: float = MCP_MAX_LIFETIME,
+        health_interval: float = MCP_HEALTH_INTERVAL,
+        call_timeout: float = MCP_CALL_TIMEOUT,
+    ):
+        self.params = params
+        self.size = max(1, size)
+        self.min_size = min(min_size, self.size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_lifetime = max_lifetime
+        self.health_interval = health_interval
+        self.call_timeout = call_timeout
+        self._reset()
+
+    def _reset(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._servers = []
+        self._changed = asyncio.Condition()  # bound to the pool loop on first use
+        self._tools = None
+
+    # The agent is pickled to be deployed to Agent Engine; only the settings travel.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_loop", "_lock", "_servers", "_changed", "_tools"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    async def list_tools(self):
+        """The tools of the server, listed once."""
+        if self._tools is None:
+            self._tools = await self._submit("list_tools")
+        return self._tools
+
+    async def call_tool(self, name: str, arguments: dict | None = None):
+        """Call a tool on a free server process."""
+        return await self._submit("call_tool", name, arguments=arguments)
+
+    async def _submit(self, method: str, *args, **kwargs):
+        """Run a session method on the pool loop, from the event loop of any query."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._call(method, *args, **kwargs), self._start()
+        )
+        return await asyncio.wrap_future(future)
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="mcp-server-pool", daemon=True
+                ).start()
+                asyncio.run_coroutine_threadsafe(self._maintain(), loop)
+                atexit.register(self.close)
+                self._loop = loop
+            return self._loop
+
+    async def _call(self, method: str, *args, **kwargs):
+        # A call that failed on a broken process is retried once on another one.
+        for attempt in range(2):
+            server = await self._acquire()
+            try:
+                session = await server.ready()
+                return await getattr(session, method)(*args, **kwargs)
+            except McpError:
+                # An error answered by the server, which is still working.
+                raise
+            except Exception:
+                server.broken = True
+                if attempt:
+                    raise
+                logger.warning("MCP %s failed on a broken server, retrying", method)
+            finally:
+                await self._release(server)
+
+    async def _acquire(self) -> _Server:
+        """A server with room for another call, started if there is none."""
+        async with self._changed:
+            while True:
+                self._retire_idle()
+                candidates = [
+                    s for s in self._servers
+                    if s.active < self.max_concurrency and not s.expired(self.max_lifetime)
+                ]
+                if candidates:
+                    server = min(candidates, key=lambda s: s.active)
+                elif len(self._servers) < self.size:
+                    server = self._spawn()
+                else:
+                    await self._changed.wait()
+                    continue
+                server.active += 1
+                break
+        if server.session is not None and time.monotonic() - server.used_at > self.health_interval:
+            await self._check(server)
+        return server
+
+    async def _release(self, server: _Server):
+        async with self._changed:
+            server.active -= 1
+            server.used_at = time.monotonic()
+            self._retire_idle()
+            self._changed.notify_all()
+
+    async def _check(self, server: _Server):
+        """Ping a server, marking it broken if it does not answer."""
+        try:
+            await asyncio.wait_for(server.session.send_ping(), self.call_timeout)
+        except Exception as e:
+            logger.warning("MCP server failed the health check: %r", e)
+            server.broken = True
+
+    def _spawn(self) -> _Server:
+        server = _Server(self.params, self.call_timeout)
+        self._servers.append(server)
+        logger.info("starting MCP server %s (%d/%d)", self.params.command, len(self._servers), self.size)
+        return server
+
+    def _retire_idle(self):
+        """Stop idle servers that are broken or too old."""
+        for server in [s for s in self._servers if not s.active and s.expired(self.max_lifetime)]:
+            self._servers.remove(server)
+            asyncio.create_task(server.close())
+
+    async def _maintain(self):
+        """Check idle servers and keep min_size of them warm."""
+        while True:
+            for server in list(self._servers):
+                idle = time.monotonic() - server.used_at
+                if server.session is not None and not server.active and idle > self.health_interval:
+                    await self._check(server)
+            async with self._changed:
+                self._retire_idle()
+                while len(self._servers) < self.min_size:
+                    self._spawn()
+                self._changed.notify_all()
+            await asyncio.sleep(self.health_interval)
+
+    def close(self, timeout: float = 5):
+        """Stop every server process."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+
+        async def stop():
+            servers, self._servers = self._servers, []
+            await asyncio.gather(*(server.close() for server in servers))
+
+        try:
+            asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout)
+        except Exception:
+            logger.exception("failed to stop the MCP servers")
+
+
+class _PoolSessionManager:
+    """Stands in for MCPSessionManager, handing out the pool instead of one session."""
+
+    def __init__(self, pool: MCPServerPool):
+        self._pool = pool
+
+    async def create_session(self) -> MCPServerPool:
+        return self._pool
+
+    async def close(self):
+        # The pool serves every query, so it outlives the runner closing it.
+        pass
+
+
+class PooledMCPToolset(MCPToolset):
+    """MCPToolset whose tools call the server processes of an MCPServerPool.
+
+    With a cache, repeated calls are answered from it.
+    """
+
+    def __init__(self, *, pool: MCPServerPool, tool_filter=None, cache: ToolResultCache | None = None):
+        super().__init__(connection_params=pool.params, tool_filter=tool_filter)
+        self.pool = pool
+        self.cache = cache
+        self._mcp_session_manager = _PoolSessionManager(pool)
+
+    async def get_tools(self, readonly_context=None):
+        tools = await super().get_tools(readonly_context)
+        if self.cache is None:
+            return tools
+        return [CachedMCPTool(tool, self.cache) for tool in tools]
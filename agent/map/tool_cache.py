@@ -0,0 +1,166 @@
+"""Cache of Google Maps tool results, shared by every query of the map agent.
+
+Questions often ask about the same offices, stations and routes again. The
+cache keys a tool call on the tool name and its arguments, normalized so that
+case, spacing and key order do not matter, and keeps the result for a time
+that depends on the tool: long for geocoding and place details, short for
+directions and distances that follow the traffic. Tools without a TTL are not
+cached, nor are error results. The number of entries is bounded, the least
+recently used going first.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from google.adk.tools.mcp_tool.mcp_tool import MCPTool
+
+
+def _parse_ttls(value: str) -> dict[str, float]:
+    """Parse "maps_geocode=86400,maps_directions=300" into {tool: seconds}."""
+    ttls = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+# Seconds a result is kept, by tool. Tools not listed are not cached.
+TOOL_CACHE_TTLS = _parse_ttls(os.getenv(
+    "MAP_TOOL_CACHE_TTLS",
+    "maps_geocode=86400,maps_reverse_geocode=86400,maps_place_details=86400,"
+    "maps_elevation=86400,maps_search_places=3600,"
+    "maps_distance_matrix=300,maps_directions=300",
+))
+TOOL_CACHE_MAXSIZE = int(os.getenv("MAP_TOOL_CACHE_MAXSIZE", "1000"))
+# Log the hit rate every this many lookups.
+STATS_LOG_INTERVAL = 100
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_arguments(value):
+    """Arguments with the differences that do not change the answer removed."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, float):
+        # About 10 cm, finer than any place the tools tell apart.
+        return round(value, 6)
+    if isinstance(value, dict):
+        return {key: normalize_arguments(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_arguments(item) for item in value]
+    return value
+
+
+def cache_key(tool_name: str, arguments: dict | None) -> str:
+    return tool_name + ":" + json.dumps(
+        normalize_arguments(arguments or {}), sort_keys=True, ensure_ascii=False
+    )
+
+
+class ToolResultCache:
+    """LRU cache of tool results with a TTL per tool."""
+
+    def __init__(self, ttls: dict[str, float], maxsize: int, timer=time.monotonic):
+        self.ttls = ttls
+        self.maxsize = maxsize
+        self._timer = timer
+        self._reset()
+
+    def _reset(self):
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Like MCPServerPool, only the settings are pickled with the agent.
+    def __getstate__(self):
+        return {"ttls": self.ttls, "maxsize": self.maxsize, "_timer": self._timer}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cacheable(self, tool_name: str) -> bool:
+        return self.ttls.get(tool_name, 0) > 0 and self.maxsize > 0
+
+    def get(self, tool_name: str, arguments: dict | None):
+        """The cached result of the call, or None."""
+        key = cache_key(tool_name, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._timer():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            lookups = self.hits + self.misses
+        if lookups % STATS_LOG_INTERVAL == 0:
+            logger.info("map tool cache: %s", self.stats())
+        return None if entry is None else _copy(entry[1])
+
+    def set(self, tool_name: str, arguments: dict | None, result):
+        """Keep the result of a successful call for the TTL of the tool."""
+        if not self.cacheable(tool_name) or getattr(result, "isError", False):
+            return
+        key = cache_key(tool_name, arguments)
+        with self._lock:
+            self._entries[key] = (self._timer() + self.ttls[tool_name], _copy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _copy(result):
+    # The agent may change the result it is given; the cached one must not change.
+    model_copy = getattr(result, "model_copy", None)
+    return model_copy(deep=True) if model_copy else result
+
+
+class CachedMCPTool(MCPTool):
+    """MCPTool that answers repeated calls from a ToolResultCache."""
+
+    def __init__(self, tool: MCPTool, cache: ToolResultCache):
+        super().__init__(
+            mcp_tool=tool._mcp_tool,
+            mcp_session_manager=tool._mcp_session_manager,
+            auth_scheme=tool._auth_scheme,
+            auth_credential=tool._auth_credential,
+        )
+        self._cache = cache
+
+    async def run_async(self, *, args, tool_context):
+        if not self._cache.cacheable(self.name):
+            return await super().run_async(args=args, tool_context=tool_context)
+        result = self._cache.get(self.name, args)
+        if result is None:
+            result = await super().run_async(args=args, tool_context=tool_context)
+            self._cache.set(self.name, args, result)
+        return result
+
+
+tool_result_cache = ToolResultCache(TOOL_CACHE_TTLS, TOOL_CACHE_MAXSIZE)
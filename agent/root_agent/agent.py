@@ -1,9 +1,15 @@
 """Client agent for the Gemini model, combining whole agents."""
+import os
 from google.adk.tools import agent_tool
 from google.adk.agents import Agent
 from map.agent import root_agent as map_agent
 from google_search.agent import root_agent as google_search_agent
+from .compaction import HistoryCompactor
+from .fanout import FanOutAgent
+from .router import RouterAgent
 MODEL = "gemini-2.0-flash"
+# Send messages that clearly need one agent straight to it, without delegating.
+ROOT_ROUTER = os.getenv("ROOT_ROUTER", "true").lower() == "true"
 
 
 tools = [
@@ -11,8 +17,8 @@ tools = [
     agent_tool.AgentTool(agent=map_agent)
 ]
 
-root_agent = Agent(
-    name="root_agent",
+delegating_agent = Agent(
+    name="delegating_agent",
     description="(Japanese)Agent to answer questions about anything, combining other tools/agents",
     model=MODEL,
     instruction=(
@@ -23,3 +29,48 @@ root_agent = Agent(
     ),
     tools=tools
 )
+
+chat_agent = Agent(
+    name="chat_agent",
+    description="(Japanese)Agent to reply to greetings and small talk",
+    model=MODEL,
+    instruction="You are a helpful agent. Reply briefly and kindly to the user's greeting or small talk.",
+)
+
+merge_agent = Agent(
+    name="merge_agent",
+    description="(Japanese)Agent to answer with the results of the other agents",
+    model=MODEL,
+    instruction=(
+        "You are a helpful agent who answers the user's question with the results"
+        " the other agents returned for it, combining them into one answer."
+        "\nWhen a result is an error, answer with the others and tell the user"
+        " which part could not be answered."
+    ),
+)
+
+fanout_agent = FanOutAgent(
+    name="fanout_agent",
+    description="Asks google_search and Map at the same time and merges their answers",
+    branches=[google_search_agent, map_agent],
+    sub_agents=[merge_agent],
+)
+
+if ROOT_ROUTER:
+    root_agent = RouterAgent(
+        name="root_agent",
+        description="Routes each message to the agent that answers it",
+        # The first sub-agent answers the messages no rule routes.
+        sub_agents=[delegating_agent, map_agent, google_search_agent, chat_agent, fanout_agent],
+        routes={
+            "map": map_agent.name,
+            "search": google_search_agent.name,
+            "both": fanout_agent.name,
+            "chat": chat_agent.name,
+        },
+    )
+else:
+    root_agent = delegating_agent
+
+# Long threads send a summary of their older turns instead of the turns themselves.
+HistoryCompactor().install(root_agent)
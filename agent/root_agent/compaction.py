@@ -0,0 +1,183 @@
+"""Compaction of the conversation history of long Slack threads.
+
+The bot keeps one session per Slack thread, and every model call of an agent
+sends the whole thread again, so the prompt, its latency and its cost grow with
+the thread. HistoryCompactor runs before each model call: once the turns not
+summarized yet exceed ROOT_HISTORY_MAX_TURNS, or about ROOT_HISTORY_MAX_TOKENS
+tokens, the older of them are folded into a rolling summary kept in session
+state, and only the last ROOT_HISTORY_KEEP_TURNS turns are sent as they are,
+the summary going into the system instruction.
+
+A turn starts with a message of the user. The session itself is not changed;
+the summary only replaces the summarized turns in what is sent to the model.
+The summary is kept with the id of its session: an AgentTool runs its agent in
+a new session with a copy of the state, whose turns it does not cover.
+The tokens of every model call are logged with the number of turns
+summarized, which shows the effect.
+"""
+import json
+import logging
+import os
+
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+
+HISTORY_MAX_TURNS = int(os.getenv("ROOT_HISTORY_MAX_TURNS", "20"))
+HISTORY_MAX_TOKENS = int(os.getenv("ROOT_HISTORY_MAX_TOKENS", "8000"))
+HISTORY_KEEP_TURNS = int(os.getenv("ROOT_HISTORY_KEEP_TURNS", "6"))
+SUMMARY_MODEL = os.getenv("ROOT_HISTORY_SUMMARY_MODEL", "gemini-2.0-flash")
+# Gemini counts about one token per Japanese character and four English
+# characters per token; the estimate takes the middle.
+CHARS_PER_TOKEN = 2
+# Tool results are cut to this many characters in the text to summarize.
+SUMMARY_RESULT_CHARS = 500
+
+SUMMARY_KEY = "history_summary"
+SUMMARIZED_TURNS_KEY = "history_summarized_turns"
+SUMMARY_SESSION_KEY = "history_summary_session"
+
+SUMMARY_INSTRUCTION = (
+    "Summarize the conversation below for an assistant that continues it."
+    " Keep the names, places, dates, figures and decisions, and the questions"
+    " still open. Start from the earlier summary when there is one."
+    " Write in the language of the conversation."
+)
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(contents: list[types.Content]) -> int:
+    return sum(len(_part_text(part)) for content in contents for part in content.parts or []) // CHARS_PER_TOKEN
+
+
+def _part_text(part: types.Part, limit: int | None = None) -> str:
+    if part.text:
+        return part.text
+    if part.function_call:
+        return f"called {part.function_call.name}({json.dumps(part.function_call.args, ensure_ascii=False)})"
+    if part.function_response:
+        result = json.dumps(part.function_response.response, ensure_ascii=False, default=str)
+        if limit is not None and len(result) > limit:
+            result = result[:limit] + "..."
+        return f"{part.function_response.name} returned: {result}"
+    return ""
+
+
+def transcript(contents: list[types.Content]) -> str:
+    """The contents as "role: text" lines, for the summary model."""
+    lines = []
+    for content in contents:
+        for part in content.parts or []:
+            text = _part_text(part, SUMMARY_RESULT_CHARS)
+            if text:
+                lines.append(f"{content.role}: {text}")
+    return "\n".join(lines)
+
+
+async def summarize_with_model(summary: str, contents: list[types.Content]) -> str:
+    """A summary of the contents that follow the earlier summary, written by SUMMARY_MODEL."""
+    text = transcript(contents)
+    if summary:
+        text = f"Earlier summary:\n{summary}\n\nConversation:\n{text}"
+    request = LlmRequest(
+        model=SUMMARY_MODEL,
+        contents=[types.Content(role="user", parts=[types.Part(text=text)])],
+        config=types.GenerateContentConfig(system_instruction=SUMMARY_INSTRUCTION),
+    )
+    answer = ""
+    async for response in LLMRegistry.new_llm(SUMMARY_MODEL).generate_content_async(request):
+        if response.content and response.content.parts:
+            answer += "".join(part.text or "" for part in response.content.parts)
+    return answer.strip()
+
+
+class HistoryCompactor:
+    """Before and after model callbacks that keep the history of a thread short."""
+
+    def __init__(
+        self,
+        max_turns: int = HISTORY_MAX_TURNS,
+        max_tokens: int = HISTORY_MAX_TOKENS,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        summarize=summarize_with_model,
+    ):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.summarize = summarize
+
+    def install(self, agent):
+        """Add the callbacks to the LLM agents under agent that have none."""
+        if getattr(agent, "before_model_callback", True) is None:
+            agent.before_model_callback = self.before_model
+        if getattr(agent, "after_model_callback", True) is None:
+            agent.after_model_callback = self.after_model
+        for sub_agent in agent.sub_agents:
+            self.install(sub_agent)
+
+    async def before_model(self, callback_context, llm_request: LlmRequest):
+        contents = llm_request.contents
+        starts = _turn_starts(callback_context, contents)
+        turns = len(starts)
+        starts.append(len(contents))  # the end of the last turn
+        state = callback_context.state
+        summary, summarized = _stored_summary(callback_context)
+        summarized = min(summarized, turns)
+
+        fold_to = turns - self.keep_turns
+        over_budget = (
+            turns - summarized > self.max_turns
+            or estimate_tokens(contents[starts[summarized]:]) > self.max_tokens
+        )
+        if over_budget and fold_to > summarized:
+            try:
+                summary = await self.summarize(summary, contents[starts[summarized]:starts[fold_to]])
+            except Exception:
+                # The answer goes on with the history as it is.
+                logger.exception("failed to summarize the history")
+            else:
+                logger.info(
+                    "summarized turns %d-%d of %d, estimated tokens %d -> %d",
+                    summarized + 1, fold_to, turns, estimate_tokens(contents),
+                    estimate_tokens(contents[starts[fold_to]:]) + len(summary) // CHARS_PER_TOKEN,
+                )
+                summarized = fold_to
+                state[SUMMARY_KEY] = summary
+                state[SUMMARIZED_TURNS_KEY] = summarized
+                state[SUMMARY_SESSION_KEY] = _session_of(callback_context).id
+
+        if summarized:
+            llm_request.contents = contents[:starts[0]] + contents[starts[summarized]:]
+            llm_request.append_instructions([f"Summary of the earlier conversation in this thread:\n{summary}"])
+        return None
+
+    async def after_model(self, callback_context, llm_response):
+        usage = llm_response.usage_metadata
+        if usage is not None and not llm_response.partial:
+            logger.info(
+                "agent=%s prompt_tokens=%s candidates_tokens=%s summarized_turns=%d",
+                callback_context.agent_name, usage.prompt_token_count,
+                usage.candidates_token_count, _stored_summary(callback_context)[1],
+            )
+        return None
+
+
+def _session_of(callback_context):
+    return callback_context._invocation_context.session
+
+
+def _stored_summary(callback_context) -> tuple[str, int]:
+    """The summary in state and the number of turns it replaces, if it is of this session."""
+    state = callback_context.state
+    if state.get(SUMMARY_SESSION_KEY) != _session_of(callback_context).id:
+        return "", 0
+    return state.get(SUMMARY_KEY, ""), state.get(SUMMARIZED_TURNS_KEY, 0)
+
+
+def _turn_starts(callback_context, contents: list[types.Content]) -> list[int]:
+    """Indexes of the contents that are messages of the user."""
+    # The contents are copies of the events, so the user's events tell which they are.
+    session = _session_of(callback_context)
+    messages = [event.content for event in session.events if event.author == "user" and event.content]
+    return [i for i, content in enumerate(contents) if content.role == "user" and content in messages]
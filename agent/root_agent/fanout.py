@@ -0,0 +1,112 @@
+"""Asking several sub-agents at once for questions that need all of them.
+
+A question like "渋谷の天気と、駅からオフィスまでの経路" needs both the search
+agent and the map agent. The delegating agent calls its AgentTools one after
+the other, so the answer waits for the sum of their latencies. FanOutAgent
+calls every branch agent at the same time, each with a timeout of its own,
+and hands their results to a merge agent that writes the answer, so the
+branches take as long as the slowest one.
+
+A branch that fails or runs out of time does not fail the question: its
+result says so, and the merge agent answers with the results there are.
+
+The calls and their results are yielded as function call and response events,
+the same as the delegating agent's tool calls, which is how the merge agent
+sees them.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import AsyncGenerator
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.tools import agent_tool
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+from .router import _text_of
+
+# Seconds a branch may take before the answer is written without it.
+FANOUT_TIMEOUT = float(os.getenv("ROOT_FANOUT_TIMEOUT", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class FanOutAgent(BaseAgent):
+    """Calls the branch agents concurrently; the sub-agent merges their results."""
+
+    # Agents asked about every message, through an AgentTool like the delegating agent's.
+    branches: list[BaseAgent] = []
+    timeout: float = FANOUT_TIMEOUT
+    # branch name -> seconds, for branches that need another timeout
+    timeouts: dict[str, float] = {}
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        request = _text_of(ctx.user_content)
+        calls = [
+            types.FunctionCall(id=f"adk-{uuid.uuid4()}", name=branch.name, args={"request": request})
+            for branch in self.branches
+        ]
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(function_call=call) for call in calls]),
+        )
+
+        start = time.perf_counter()
+        tool_contexts = [ToolContext(ctx, function_call_id=call.id) for call in calls]
+        results = await asyncio.gather(*(
+            self._call_branch(branch, request, tool_context)
+            for branch, tool_context in zip(self.branches, tool_contexts)
+        ))
+        logger.info(
+            "fan-out seconds=%.3f branches=%s", time.perf_counter() - start,
+            {
+                branch.name: f"{outcome} {seconds:.3f}"
+                for branch, (_, outcome, seconds) in zip(self.branches, results)
+            },
+        )
+
+        # State the branches changed is kept, as AgentTool does for the delegating agent.
+        state_delta = {}
+        for tool_context in tool_contexts:
+            state_delta.update(tool_context.actions.state_delta)
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="user", parts=[
+                types.Part(function_response=types.FunctionResponse(
+                    id=call.id, name=call.name, response=response,
+                ))
+                for call, (response, _, _) in zip(calls, results)
+            ]),
+            actions=EventActions(state_delta=state_delta),
+        )
+
+        async for event in self.sub_agents[0].run_async(ctx):
+            yield event
+
+    async def _call_branch(self, branch: BaseAgent, request: str, tool_context: ToolContext):
+        """The response of one branch, whether it answered, and the seconds it took."""
+        timeout = self.timeouts.get(branch.name, self.timeout)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                agent_tool.AgentTool(agent=branch).run_async(
+                    args={"request": request}, tool_context=tool_context
+                ),
+                timeout,
+            )
+            response, outcome = {"result": result}, "ok"
+        except asyncio.TimeoutError:
+            response, outcome = {"error": f"no answer within {timeout:g} seconds"}, "timeout"
+        except Exception as e:
+            logger.exception("fan-out branch %s failed", branch.name)
+            response, outcome = {"error": f"failed: {type(e).__name__}"}, "error"
+        return response, outcome, time.perf_counter() - start
@@ -0,0 +1,151 @@
+"""Rule-based routing in front of the delegating root agent.
+
+Delegating through an AgentTool costs an LLM round trip for the root agent to
+pick the tool, the sub-agent's own round trips, and another one for the root
+agent to write the answer again. RouterAgent sends messages that clearly need
+one sub-agent straight to it, ones that need both to an agent that asks them
+at once (see fanout.py), and small talk to an agent without tools. Other
+messages go to the delegating agent as before.
+
+Every decision is logged with its reason, the time the route took and the
+model responses and tool calls it streamed, and summed up by RouteStats.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import AsyncGenerator
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+
+# Messages longer than this are not routed by keywords, which could be quoted text.
+ROUTER_MAX_CHARS = int(os.getenv("ROOT_ROUTER_MAX_CHARS", "200"))
+# Log the summary of the routes every this many decisions.
+STATS_LOG_INTERVAL = 100
+
+# Japanese keywords match anywhere in the message, ASCII ones only as whole words.
+# Single English words such as "map" or "distance" also mean other things
+# (Python's map(), edit distance), so only phrases that ask for a place are listed.
+MAP_KEYWORDS = (
+    "経路", "道順", "行き方", "ルート", "地図", "乗り換え", "乗換", "最寄り", "徒歩",
+    "所要時間", "何分かか", "距離", "住所", "近くの", "周辺の",
+    "directions to", "directions from", "route to", "route from", "map of", "on a map",
+    "nearby", "near me", "how far", "how to get to", "distance from",
+)
+SEARCH_KEYWORDS = (
+    "天気", "気温", "予報", "ニュース", "最新", "速報", "株価", "為替", "試合結果",
+    "weather", "forecast", "news", "latest", "stock price", "exchange rate",
+)
+SMALL_TALK = re.compile(
+    r"^(こんにちは|こんばんは|おはよう(ございます)?|ありがとう(ございます)?|よろしく(お願いします)?"
+    r"|お疲れ(様|さま)(です)?|はじめまして|hi|hello|hey|thanks|thank you|good (morning|evening))"
+    r"[\s!！。.、~〜]*$",
+    re.IGNORECASE,
+)
+
+DELEGATE = "delegate"
+
+logger = logging.getLogger(__name__)
+
+
+def classify(text: str) -> tuple[str, str]:
+    """The route of a message, "map", "search", "both", "chat" or "delegate", and why."""
+    text = " ".join(text.split()).casefold()
+    if SMALL_TALK.match(text):
+        return "chat", "small talk"
+    if len(text) > ROUTER_MAX_CHARS:
+        return DELEGATE, "long message"
+    map_hit = _MAP_PATTERN.search(text)
+    search_hit = _SEARCH_PATTERN.search(text)
+    if map_hit and search_hit:
+        return "both", f"map and search keywords: {map_hit[0]}, {search_hit[0]}"
+    if map_hit:
+        return "map", f"keyword: {map_hit[0]}"
+    if search_hit:
+        return "search", f"keyword: {search_hit[0]}"
+    return DELEGATE, "no rule"
+
+
+def _keyword_pattern(keywords) -> re.Pattern:
+    # Japanese has no spaces between words, and \b would treat the kana next to an
+    # English word as part of it, so only ASCII letters and digits end a word.
+    return re.compile("|".join(
+        rf"(?<![a-z0-9]){re.escape(keyword)}(?![a-z0-9])" if keyword.isascii() else re.escape(keyword)
+        for keyword in keywords
+    ))
+
+
+_MAP_PATTERN = _keyword_pattern(MAP_KEYWORDS)
+_SEARCH_PATTERN = _keyword_pattern(SEARCH_KEYWORDS)
+
+
+class RouteStats:
+    """Number of messages and time taken per route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}  # route -> [count, seconds, model responses]
+
+    def record(self, route: str, seconds: float, model_responses: int) -> int:
+        """Add a routed message. Returns the number of messages routed so far."""
+        with self._lock:
+            totals = self._routes.setdefault(route, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += model_responses
+            return sum(count for count, _, _ in self._routes.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    "count": count,
+                    "seconds_avg": seconds / count,
+                    "model_responses_avg": responses / count,
+                }
+                for route, (count, seconds, responses) in self._routes.items()
+            }
+
+
+route_stats = RouteStats()
+
+
+class RouterAgent(BaseAgent):
+    """Runs the sub-agent a message is routed to; the first sub-agent takes the rest."""
+
+    # route -> name of the sub-agent that answers it
+    routes: dict[str, str] = {}
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        route, reason = classify(_text_of(ctx.user_content))
+        agent = self.find_sub_agent(self.routes.get(route, "")) or self.sub_agents[0]
+        if agent is self.sub_agents[0]:
+            route = DELEGATE
+
+        start = time.perf_counter()
+        model_responses = tool_calls = 0
+        async for event in agent.run_async(ctx):
+            # The bot logs the route of each event it receives.
+            event.custom_metadata = {**(event.custom_metadata or {}), "route": route}
+            if event.content and event.content.role == "model" and not event.partial:
+                model_responses += 1
+                tool_calls += len(event.get_function_calls())
+            yield event
+
+        seconds = time.perf_counter() - start
+        routed = route_stats.record(route, seconds, model_responses)
+        logger.info(
+            "route=%s agent=%s reason=%r seconds=%.3f model_responses=%d tool_calls=%d",
+            route, agent.name, reason, seconds, model_responses, tool_calls,
+        )
+        if routed % STATS_LOG_INTERVAL == 0:
+            logger.info("routes: %s", route_stats.stats())
+
+
+def _text_of(content) -> str:
+    if content is None or not content.parts:
+        return ""
+    return "\n".join(part.text for part in content.parts if part.text)
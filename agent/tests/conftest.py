@@ -0,0 +1,33 @@
+"""Pytest configuration and shared fixtures."""
+import os
+import sys
+
+import pytest
+from mcp import StdioServerParameters
+
+# map.agent reads the API key on import, so give it one before the tests import it.
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "test-key")
+
+STUB_SERVER = os.path.join(os.path.dirname(__file__), "stub_maps_server.py")
+
+
+@pytest.fixture
+def stub_server_params():
+    """Parameters that start the stand-in Google Maps MCP server."""
+    return StdioServerParameters(command=sys.executable, args=[STUB_SERVER])
+
+
+class FakeClock:
+    """A clock moved by hand, standing in for time.monotonic or time.time."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A FakeClock to pass as the timer or clock of the object under test."""
+    return FakeClock()
@@ -0,0 +1,40 @@
+"""
+Stand-in for the Google Maps MCP server, answering over stdio without the Maps API.
+
+Every answer carries the process id and the number of calls the process has
+served, so tests can tell which process answered and whether it was called.
+"""
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+server = FastMCP("stub-google-maps")
+calls = 0
+
+
+def _answer(text: str) -> str:
+    global calls
+    calls += 1
+    return f"{text} (pid={os.getpid()} call={calls})"
+
+
+@server.tool()
+def maps_geocode(address: str) -> str:
+    """Geocode an address."""
+    return _answer(f"geocode {address}")
+
+
+@server.tool()
+def maps_directions(origin: str, destination: str, mode: str = "driving") -> str:
+    """Get directions between two places."""
+    return _answer(f"directions {origin} -> {destination} by {mode}")
+
+
+@server.tool()
+def maps_fail(reason: str) -> str:
+    """Always fail."""
+    raise ValueError(reason)
+
+
+if __name__ == "__main__":
+    server.run()
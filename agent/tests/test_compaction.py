@@ -0,0 +1,224 @@
+"""Tests for root_agent/compaction.py history compaction."""
+import logging
+
+import pytest
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+from root_agent.compaction import (
+    SUMMARIZED_TURNS_KEY, SUMMARY_KEY, SUMMARY_SESSION_KEY, HistoryCompactor, transcript,
+)
+from tests.test_router import ask
+
+
+class RecordingLlm(BaseLlm):
+    """Model that records its requests and answers "answer N"."""
+
+    requests: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.requests.append(llm_request.model_copy(deep=True))
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=f"answer {len(self.requests)}")]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(llm_request.contents), candidates_token_count=2,
+            ),
+        )
+
+
+class DelegatingLlm(RecordingLlm):
+    """Model that calls the helper tool when asked to, and otherwise answers like RecordingLlm."""
+
+    async def generate_content_async(self, llm_request, stream=False):
+        if llm_request.contents[-1].parts[0].text == "ask the helper":
+            self.requests.append(llm_request.model_copy(deep=True))
+            call = types.FunctionCall(name="helper", args={"request": "sub question"})
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=call)]))
+            return
+        async for response in super().generate_content_async(llm_request, stream):
+            yield response
+
+
+class FakeSummarizer:
+    """Summarizer that records what it is given."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, summary, contents):
+        self.calls.append((summary, [content.parts[0].text for content in contents]))
+        if self.fail:
+            raise RuntimeError("summary failed")
+        return f"summary {len(self.calls)}"
+
+
+def build(summarizer, **kwargs):
+    llm = RecordingLlm(model="recording")
+    agent = Agent(name="assistant", model=llm, instruction="Answer.")
+    HistoryCompactor(summarize=summarizer, **kwargs).install(agent)
+    return InMemoryRunner(agent), llm
+
+
+async def state_of(runner):
+    session = await runner.session_service.get_session(app_name=runner.app_name, user_id="u1", session_id="s1")
+    return session.state
+
+
+class TestHistoryCompactor:
+    """Tests for HistoryCompactor."""
+
+    @pytest.mark.asyncio
+    async def test_short_thread_unchanged(self):
+        """Test that a thread within the budget is sent as it is."""
+        summarizer = FakeSummarizer()
+        runner, llm = build(summarizer, max_turns=4, keep_turns=2)
+
+        for i in range(4):
+            await ask(runner, f"question {i + 1}")
+
+        assert summarizer.calls == []
+        assert len(llm.requests[-1].contents) == 7
+        assert "Summary" not in llm.requests[-1].config.system_instruction
+
+    @pytest.mark.asyncio
+    async def test_turn_budget(self):
+        """Test that older turns are replaced by a summary once there are too many."""
+        summarizer = FakeSummarizer()
+        runner, llm = build(summarizer, max_turns=4, keep_turns=2)
+
+        for i in range(5):
+            await ask(runner, f"question {i + 1}")
+
+        assert summarizer.calls == [("", [
+            "question 1", "answer 1", "question 2", "answer 2", "question 3", "answer 3",
+        ])]
+        request = llm.requests[-1]
+        assert [content.parts[0].text for content in request.contents] == [
+            "question 4", "answer 4", "question 5",
+        ]
+        assert request.config.system_instruction.endswith(
+            "Summary of the earlier conversation in this thread:\nsummary 1"
+        )
+        assert await state_of(runner) == {
+            SUMMARY_KEY: "summary 1", SUMMARIZED_TURNS_KEY: 3, SUMMARY_SESSION_KEY: "s1",
+        }
+
+    @pytest.mark.asyncio
+    async def test_rolling_summary(self):
+        """Test that the summary is kept and extended from the turns after it."""
+        summarizer = FakeSummarizer()
+        runner, llm = build(summarizer, max_turns=4, keep_turns=2)
+
+        for i in range(10):
+            await ask(runner, f"question {i + 1}")
+
+        assert len(summarizer.calls) == 2
+        assert summarizer.calls[1] == ("summary 1", [
+            "question 4", "answer 4", "question 5", "answer 5", "question 6", "answer 6",
+        ])
+        # Between summaries, the turns since the last one are sent with it.
+        assert llm.requests[6].contents[0].parts[0].text == "question 4"
+        assert llm.requests[7].contents[0].parts[0].text == "question 7"
+        assert llm.requests[9].contents[0].parts[0].text == "question 7"
+        assert llm.requests[9].config.system_instruction.endswith("summary 2")
+
+    @pytest.mark.asyncio
+    async def test_token_budget(self):
+        """Test that long turns are summarized before there are many of them."""
+        summarizer = FakeSummarizer()
+        runner, llm = build(summarizer, max_tokens=100, keep_turns=1)
+
+        await ask(runner, "x" * 300)
+        await ask(runner, "short question")
+
+        assert len(summarizer.calls) == 1
+        assert [content.parts[0].text for content in llm.requests[-1].contents] == ["short question"]
+
+    @pytest.mark.asyncio
+    async def test_failed_summary(self):
+        """Test that the history is sent as it is when it cannot be summarized."""
+        summarizer = FakeSummarizer(fail=True)
+        runner, llm = build(summarizer, max_turns=1, keep_turns=1)
+
+        await ask(runner, "question 1")
+        events = await ask(runner, "question 2")
+
+        assert events[-1].content.parts[0].text == "answer 2"
+        assert len(llm.requests[-1].contents) == 3
+        assert await state_of(runner) == {}
+
+    @pytest.mark.asyncio
+    async def test_tokens_logged(self, caplog):
+        """Test that the tokens of each model call are logged."""
+        runner, _ = build(FakeSummarizer())
+
+        with caplog.at_level(logging.INFO, logger="root_agent.compaction"):
+            await ask(runner, "question 1")
+
+        assert "agent=assistant prompt_tokens=1 candidates_tokens=2 summarized_turns=0" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_agent_tool_ignores_summary_of_caller(self):
+        """Test that an agent called as a tool is sent its request, not the caller's summarized turns."""
+        summarizer = FakeSummarizer()
+        compactor = HistoryCompactor(summarize=summarizer, max_turns=4, keep_turns=2)
+        helper_llm = RecordingLlm(model="recording")
+        helper = Agent(name="helper", model=helper_llm, instruction="Help.")
+        llm = DelegatingLlm(model="recording")
+        agent = Agent(name="assistant", model=llm, instruction="Answer.", tools=[AgentTool(agent=helper)])
+        compactor.install(agent)
+        compactor.install(helper)
+        runner = InMemoryRunner(agent)
+
+        for i in range(5):
+            await ask(runner, f"question {i + 1}")
+        await ask(runner, "ask the helper")
+
+        request, = helper_llm.requests
+        assert [content.parts[0].text for content in request.contents] == ["sub question"]
+        assert "Summary" not in request.config.system_instruction
+        assert (await state_of(runner))[SUMMARY_SESSION_KEY] == "s1"
+
+    def test_install_keeps_own_callbacks(self):
+        """Test that agents with callbacks of their own keep them."""
+        def own(callback_context, llm_request):
+            return None
+
+        child = Agent(name="child", model="gemini-2.0-flash", before_model_callback=own)
+        parent = Agent(name="parent", model="gemini-2.0-flash", sub_agents=[child])
+        compactor = HistoryCompactor()
+
+        compactor.install(parent)
+
+        assert parent.before_model_callback == compactor.before_model
+        assert child.before_model_callback is own
+        assert child.after_model_callback == compactor.after_model
+
+
+class TestTranscript:
+    """Tests for transcript."""
+
+    def test_tool_calls(self):
+        """Test that tool calls and cut results are written as text."""
+        contents = [
+            types.Content(role="user", parts=[types.Part(text="道順は？")]),
+            types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+                name="maps_directions", args={"origin": "渋谷"},
+            ))]),
+            types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+                name="maps_directions", response={"result": "x" * 1000},
+            ))]),
+        ]
+
+        lines = transcript(contents).splitlines()
+
+        assert lines[0] == "user: 道順は？"
+        assert lines[1] == 'model: called maps_directions({"origin": "渋谷"})'
+        assert lines[2].startswith('user: maps_directions returned: {"result": "xxx')
+        assert lines[2].endswith("...")
+        assert len(lines[2]) < 600
@@ -0,0 +1,111 @@
+"""Tests for root_agent/fanout.py concurrent sub-agent calls."""
+import asyncio
+import time
+
+import pytest
+from google.adk.agents import BaseAgent
+from google.adk.events import Event
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from root_agent.fanout import FanOutAgent
+from tests.test_router import ask
+
+
+class SlowAgent(BaseAgent):
+    """Agent that answers with its name after a delay, or fails."""
+
+    delay: float = 0.0
+    fail: bool = False
+
+    async def _run_async_impl(self, ctx):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("branch failed")
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            content=types.Content(role="model", parts=[types.Part(text=f"{self.name} answer")]),
+        )
+
+
+class MergeAgent(BaseAgent):
+    """Agent that answers with the branch responses it finds in the session."""
+
+    async def _run_async_impl(self, ctx):
+        responses = ctx.session.events[-1].get_function_responses()
+        text = ", ".join(f"{r.name}={r.response}" for r in responses)
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+        )
+
+
+def build_fanout(*branches, **kwargs):
+    return FanOutAgent(name="fanout", branches=list(branches), sub_agents=[MergeAgent(name="merge")], **kwargs)
+
+
+class TestFanOutAgent:
+    """Tests for FanOutAgent."""
+
+    @pytest.mark.asyncio
+    async def test_branches_run_concurrently(self):
+        """Test that the branches take as long as the slowest one."""
+        runner = InMemoryRunner(build_fanout(SlowAgent(name="search", delay=0.3), SlowAgent(name="maps", delay=0.3)))
+
+        start = time.perf_counter()
+        events = await ask(runner, "天気と経路")
+        seconds = time.perf_counter() - start
+
+        assert seconds < 0.5
+        assert [call.name for call in events[0].get_function_calls()] == ["search", "maps"]
+        assert [call.args for call in events[0].get_function_calls()] == [{"request": "天気と経路"}] * 2
+        assert events[-1].author == "merge"
+        assert events[-1].content.parts[0].text == (
+            "search={'result': 'search answer'}, maps={'result': 'maps answer'}"
+        )
+
+    @pytest.mark.asyncio
+    async def test_timed_out_branch(self):
+        """Test that the answer is merged without a branch that takes too long."""
+        runner = InMemoryRunner(build_fanout(
+            SlowAgent(name="search", delay=5), SlowAgent(name="maps"), timeout=0.1,
+        ))
+
+        start = time.perf_counter()
+        events = await ask(runner, "天気と経路")
+
+        assert time.perf_counter() - start < 1
+        assert events[-1].content.parts[0].text == (
+            "search={'error': 'no answer within 0.1 seconds'}, maps={'result': 'maps answer'}"
+        )
+
+    @pytest.mark.asyncio
+    async def test_timeout_per_branch(self):
+        """Test that a branch can be given a timeout of its own."""
+        runner = InMemoryRunner(build_fanout(
+            SlowAgent(name="search", delay=0.2), SlowAgent(name="maps", delay=0.2),
+            timeout=1, timeouts={"maps": 0.1},
+        ))
+
+        events = await ask(runner, "天気と経路")
+
+        responses = {r.name: r.response for r in events[1].get_function_responses()}
+        assert responses == {
+            "search": {"result": "search answer"},
+            "maps": {"error": "no answer within 0.1 seconds"},
+        }
+
+    @pytest.mark.asyncio
+    async def test_failed_branch(self):
+        """Test that a failing branch becomes an error result."""
+        runner = InMemoryRunner(build_fanout(SlowAgent(name="search", fail=True), SlowAgent(name="maps")))
+
+        events = await ask(runner, "天気と経路")
+
+        responses = {r.name: r.response for r in events[1].get_function_responses()}
+        assert responses == {
+            "search": {"error": "failed: RuntimeError"},
+            "maps": {"result": "maps answer"},
+        }
@@ -0,0 +1,163 @@
+"""Tests for map/mcp_pool.py MCP server process pool."""
+import asyncio
+import pickle
+import threading
+
+import pytest
+from google.adk.tools.mcp_tool.mcp_tool import MCPTool
+from unittest.mock import patch
+
+from map import mcp_pool
+from map.mcp_pool import MCPServerPool, PooledMCPToolset, server_parameters
+
+
+def pid_of(result):
+    """Process id of the stand-in server that answered."""
+    return result.content[0].text.split("pid=")[1].split()[0]
+
+
+def run_in_new_loop(coro_fn):
+    """Run a coroutine the way the ADK Runner does: asyncio.run on a new thread."""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(asyncio.run(coro_fn())))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+@pytest.fixture
+def pool(stub_server_params):
+    pool = MCPServerPool(
+        stub_server_params, size=2, min_size=0, max_concurrency=1, health_interval=60
+    )
+    yield pool
+    pool.close()
+
+
+class TestMCPServerPool:
+    """Tests for MCPServerPool."""
+
+    def test_process_is_reused_across_event_loops(self, pool):
+        """Test that queries on new event loops share one warm server process."""
+        toolset = PooledMCPToolset(pool=pool)
+
+        async def geocode():
+            tools = {tool.name: tool for tool in await toolset.get_tools()}
+            return await tools["maps_geocode"].run_async(args={"address": "a"}, tool_context=None)
+
+        pids = {pid_of(run_in_new_loop(geocode)) for _ in range(3)}
+
+        assert len(pids) == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_capped_per_process(self, pool):
+        """Test that concurrent calls beyond the per-process limit use more processes."""
+        results = await asyncio.gather(*(
+            pool.call_tool("maps_geocode", {"address": str(i)}) for i in range(4)
+        ))
+
+        assert len({pid_of(result) for result in results}) == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_process_is_replaced(self, stub_server_params):
+        """Test that a process past its lifetime is not used again."""
+        pool = MCPServerPool(stub_server_params, size=1, min_size=0, max_lifetime=0)
+        try:
+            first = await pool.call_tool("maps_geocode", {"address": "a"})
+            second = await pool.call_tool("maps_geocode", {"address": "a"})
+        finally:
+            pool.close()
+
+        assert pid_of(first) != pid_of(second)
+
+    @pytest.mark.asyncio
+    async def test_broken_process_is_retried(self, pool):
+        """Test that a call on a dead process is sent to a new one."""
+        await pool.call_tool("maps_geocode", {"address": "a"})
+        server = pool._servers[0]
+        await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(server.close(), pool._loop)
+        )
+        server.broken = False  # as if it had died without the pool noticing
+
+        result = await pool.call_tool("maps_geocode", {"address": "a"})
+
+        assert "call=1" in result.content[0].text
+
+    @pytest.mark.asyncio
+    async def test_min_size_kept_warm(self, stub_server_params):
+        """Test that min_size processes are started in the background once the pool is used."""
+        pool = MCPServerPool(stub_server_params, size=3, min_size=2, max_concurrency=1)
+        try:
+            await pool.call_tool("maps_geocode", {"address": "a"})
+            for _ in range(50):
+                if len(pool._servers) >= 2:
+                    break
+                await asyncio.sleep(0.1)
+            warm = len(pool._servers)
+        finally:
+            pool.close()
+
+        assert warm == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_health_check_replaces_process(self, stub_server_params):
+        """Test that an idle process that does not answer the ping is replaced."""
+        pool = MCPServerPool(stub_server_params, size=1, min_size=0, health_interval=0)
+        try:
+            first = await pool.call_tool("maps_geocode", {"address": "a"})
+
+            async def no_answer():
+                raise TimeoutError
+            pool._servers[0].session.send_ping = no_answer
+            second = await pool.call_tool("maps_geocode", {"address": "a"})
+        finally:
+            pool.close()
+
+        assert pid_of(first) != pid_of(second)
+
+    def test_pickle_keeps_settings_only(self, pool, stub_server_params):
+        """Test that the pool is deployed with the agent without its processes."""
+        restored = pickle.loads(pickle.dumps(pool))
+
+        assert restored.params == stub_server_params
+        assert restored.size == 2
+        assert restored._loop is None
+
+
+class TestServerParameters:
+    """Tests for server_parameters."""
+
+    def test_npx_by_default(self):
+        """Test that the package is fetched with npx -y unless a command is set."""
+        with patch.object(mcp_pool, "MCP_SERVER_COMMAND", None):
+            params = server_parameters({"GOOGLE_MAPS_API_KEY": "k"})
+
+        assert params.command == "npx"
+        assert params.args == ["-y", mcp_pool.MCP_SERVER_PACKAGE]
+        assert params.env == {"GOOGLE_MAPS_API_KEY": "k"}
+
+    def test_preinstalled_command(self):
+        """Test that MAP_MCP_SERVER_COMMAND runs the pinned binary instead."""
+        with patch.object(mcp_pool, "MCP_SERVER_COMMAND", "mcp-server-google-maps --stdio"):
+            params = server_parameters()
+
+        assert (params.command, params.args) == ("mcp-server-google-maps", ["--stdio"])
+
+
+class TestADKInternals:
+    """The private parts of google-adk the pool replaces, which the pinned release must keep."""
+
+    @pytest.mark.asyncio
+    async def test_tools_are_bound_to_the_pool(self, pool):
+        """Test that the tools MCPToolset builds take their session from the pool's manager."""
+        toolset = PooledMCPToolset(pool=pool)
+
+        tools = await toolset.get_tools()
+
+        assert {tool.name for tool in tools} >= {"maps_geocode", "maps_directions"}
+        for tool in tools:
+            assert isinstance(tool, MCPTool)
+            assert tool._mcp_session_manager is toolset._mcp_session_manager
+            assert await tool._mcp_session_manager.create_session() is pool
+            assert tool._mcp_tool.name == tool.name
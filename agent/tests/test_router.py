@@ -0,0 +1,155 @@
+"""Tests for root_agent/router.py message routing."""
+import pytest
+from google.adk.agents import BaseAgent
+from google.adk.events import Event
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from root_agent import router
+from root_agent.router import RouteStats, RouterAgent, classify
+
+
+class NamedAgent(BaseAgent):
+    """Agent that answers with its own name."""
+
+    async def _run_async_impl(self, ctx):
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            content=types.Content(role="model", parts=[types.Part(text=self.name)]),
+        )
+
+
+def build_router():
+    return RouterAgent(
+        name="root_agent",
+        sub_agents=[NamedAgent(name="delegating"), NamedAgent(name="maps"), NamedAgent(name="chat")],
+        routes={"map": "maps", "chat": "chat"},
+    )
+
+
+async def ask(runner, text, session_id="s1"):
+    """Send text as the user and return the events of the answer."""
+    if await runner.session_service.get_session(
+        app_name=runner.app_name, user_id="u1", session_id=session_id
+    ) is None:
+        await runner.session_service.create_session(
+            app_name=runner.app_name, user_id="u1", session_id=session_id
+        )
+    message = types.Content(role="user", parts=[types.Part(text=text)])
+    return [
+        event async for event in runner.run_async(
+            user_id="u1", session_id=session_id, new_message=message
+        )
+    ]
+
+
+class TestClassify:
+    """Tests for classify."""
+
+    @pytest.mark.parametrize("text, route", [
+        ("渋谷駅から東京駅までの経路を教えて", "map"),
+        ("How to get to Tokyo Tower?", "map"),
+        ("明日の東京の天気は？", "search"),
+        ("latest news about AI", "search"),
+        ("こんにちは！", "chat"),
+        ("Thank you.", "chat"),
+        ("渋谷の天気と、駅からオフィスまでの経路", "both"),
+        ("Pythonでリストを逆順にするには？", "delegate"),
+    ])
+    def test_routes(self, text, route):
+        """Test that clear messages are routed and the rest delegated."""
+        assert classify(text)[0] == route
+
+    @pytest.mark.parametrize("text", [
+        "How do I configure my home router?",
+        "Explain the Levenshtein distance",
+        "What is on our product roadmap?",
+        "How does Python map() work?",
+        "Subscribe to the newsletter",
+    ])
+    def test_words_containing_keywords_are_delegated(self, text):
+        """Test that English keywords inside other words or meanings do not route."""
+        assert classify(text) == ("delegate", "no rule")
+
+    @pytest.mark.parametrize("text, reason", [
+        ("Give me directions to Tokyo Station", "keyword: directions to"),
+        ("Any good ramen nearby?", "keyword: nearby"),
+        ("What's the news today?", "keyword: news"),
+        ("渋谷のweatherは？", "keyword: weather"),
+    ])
+    def test_whole_words_are_routed(self, text, reason):
+        """Test that English keywords still route as whole words."""
+        assert classify(text)[1] == reason
+
+    def test_long_message_is_delegated(self):
+        """Test that keywords in long texts do not decide the route."""
+        assert classify("経路" + "あ" * router.ROUTER_MAX_CHARS) == ("delegate", "long message")
+
+
+class TestRouterAgent:
+    """Tests for RouterAgent."""
+
+    @pytest.mark.asyncio
+    async def test_routed_to_sub_agent(self):
+        """Test that a map question is answered by the map agent alone."""
+        runner = InMemoryRunner(build_router())
+
+        events = await ask(runner, "東京駅への行き方")
+
+        assert [event.author for event in events] == ["maps"]
+        assert events[0].custom_metadata == {"route": "map"}
+
+    @pytest.mark.asyncio
+    async def test_unrouted_goes_to_first_sub_agent(self):
+        """Test that routes without an agent, and messages without a route, are delegated."""
+        runner = InMemoryRunner(build_router())
+
+        search = await ask(runner, "今日のニュース")
+        other = await ask(runner, "素数とは？")
+
+        assert [event.author for event in search + other] == ["delegating", "delegating"]
+        assert search[0].custom_metadata == {"route": "delegate"}
+
+    @pytest.mark.asyncio
+    async def test_next_message_is_routed_again(self):
+        """Test that a sub-agent that answered does not keep the thread."""
+        runner = InMemoryRunner(build_router())
+
+        await ask(runner, "こんにちは")
+        events = await ask(runner, "近くのカフェ")
+
+        assert [event.author for event in events] == ["maps"]
+
+    @pytest.mark.asyncio
+    async def test_routes_are_recorded(self, monkeypatch):
+        """Test that each decision is counted with its time."""
+        stats = RouteStats()
+        monkeypatch.setattr(router, "route_stats", stats)
+        runner = InMemoryRunner(build_router())
+
+        await ask(runner, "こんにちは")
+        await ask(runner, "地図を見せて")
+        await ask(runner, "地図を見せて")
+
+        summary = stats.stats()
+        assert summary["chat"]["count"] == 1
+        assert summary["map"]["count"] == 2
+        assert summary["map"]["model_responses_avg"] == 1
+
+
+class TestRootAgent:
+    """Tests for the root agent of the deployment."""
+
+    def test_router_in_front_of_delegating_agent(self):
+        """Test that the root agent routes to the real sub-agents."""
+        from root_agent.agent import root_agent
+
+        assert isinstance(root_agent, RouterAgent)
+        assert root_agent.sub_agents[0].name == "delegating_agent"
+        for name in root_agent.routes.values():
+            assert root_agent.find_sub_agent(name) is not None
+        fanout = root_agent.find_sub_agent(root_agent.routes["both"])
+        assert [branch.name for branch in fanout.branches] == [
+            root_agent.routes["search"], root_agent.routes["map"],
+        ]
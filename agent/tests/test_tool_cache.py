@@ -0,0 +1,139 @@
+"""Tests for map/tool_cache.py tool result cache."""
+import pickle
+
+import pytest
+from mcp.types import CallToolResult, TextContent
+
+from map.mcp_pool import MCPServerPool, PooledMCPToolset
+from map.tool_cache import ToolResultCache, cache_key
+
+
+def result(text, is_error=False):
+    """CallToolResult with one text part."""
+    return CallToolResult(content=[TextContent(type="text", text=text)], isError=is_error)
+
+
+class TestCacheKey:
+    """Tests for cache_key."""
+
+    def test_normalized_arguments_share_a_key(self):
+        """Test that case, spacing, key order and float noise are ignored."""
+        assert cache_key("maps_geocode", {"address": " Tokyo  Station "}) == cache_key(
+            "maps_geocode", {"address": "tokyo station"}
+        )
+        assert cache_key("maps_directions", {"origin": "a", "destination": "b"}) == cache_key(
+            "maps_directions", {"destination": "b", "origin": "a"}
+        )
+        assert cache_key("maps_elevation", {"lat": 35.68123400001}) == cache_key(
+            "maps_elevation", {"lat": 35.681234}
+        )
+
+    def test_tool_name_is_part_of_the_key(self):
+        """Test that the same arguments to other tools do not collide."""
+        assert cache_key("maps_geocode", {"q": "x"}) != cache_key("maps_search_places", {"q": "x"})
+
+
+class TestToolResultCache:
+    """Tests for ToolResultCache."""
+
+    def test_ttl_per_tool(self, clock):
+        """Test that each tool keeps its results for its own TTL."""
+        cache = ToolResultCache({"maps_geocode": 100, "maps_directions": 10}, 10, timer=clock)
+        cache.set("maps_geocode", {"address": "a"}, result("geo"))
+        cache.set("maps_directions", {"origin": "a"}, result("route"))
+
+        clock.now = 20
+
+        assert cache.get("maps_geocode", {"address": "a"}).content[0].text == "geo"
+        assert cache.get("maps_directions", {"origin": "a"}) is None
+
+    def test_uncached_tools_and_errors(self):
+        """Test that tools without a TTL and error results are not kept."""
+        cache = ToolResultCache({"maps_geocode": 100}, 10)
+        cache.set("maps_search_places", {"query": "a"}, result("places"))
+        cache.set("maps_geocode", {"address": "a"}, result("failed", is_error=True))
+
+        assert len(cache) == 0
+        assert cache.cacheable("maps_search_places") is False
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the size stays bounded, dropping the entry unused longest."""
+        cache = ToolResultCache({"maps_geocode": 100}, 2)
+        cache.set("maps_geocode", {"address": "a"}, result("a"))
+        cache.set("maps_geocode", {"address": "b"}, result("b"))
+        cache.get("maps_geocode", {"address": "a"})
+        cache.set("maps_geocode", {"address": "c"}, result("c"))
+
+        assert len(cache) == 2
+        assert cache.get("maps_geocode", {"address": "b"}) is None
+        assert cache.get("maps_geocode", {"address": "a"}) is not None
+
+    def test_hit_rate(self):
+        """Test that hits and misses are counted."""
+        cache = ToolResultCache({"maps_geocode": 100}, 10)
+        cache.get("maps_geocode", {"address": "a"})
+        cache.set("maps_geocode", {"address": "a"}, result("a"))
+        cache.get("maps_geocode", {"address": "a"})
+        cache.get("maps_geocode", {"address": "a"})
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+        assert stats["hit_rate"] == pytest.approx(2 / 3)
+
+    def test_cached_result_is_a_copy(self):
+        """Test that changing a returned result does not change the cache."""
+        cache = ToolResultCache({"maps_geocode": 100}, 10)
+        cache.set("maps_geocode", {"address": "a"}, result("a"))
+        cache.get("maps_geocode", {"address": "a"}).content[0].text = "changed"
+
+        assert cache.get("maps_geocode", {"address": "a"}).content[0].text == "a"
+
+    def test_pickle_keeps_settings_only(self):
+        """Test that the cache travels with the agent without its entries."""
+        cache = ToolResultCache({"maps_geocode": 100}, 10)
+        cache.set("maps_geocode", {"address": "a"}, result("a"))
+
+        restored = pickle.loads(pickle.dumps(cache))
+
+        assert restored.ttls == {"maps_geocode": 100}
+        assert len(restored) == 0
+
+
+class TestCachedToolset:
+    """Tests for the cache in front of the stand-in MCP server."""
+
+    @pytest.mark.asyncio
+    async def test_repeated_calls_are_answered_from_cache(self, stub_server_params):
+        """Test that only new tool calls reach the server."""
+        pool = MCPServerPool(stub_server_params, size=1, min_size=0)
+        cache = ToolResultCache({"maps_geocode": 100, "maps_directions": 10}, 10)
+        toolset = PooledMCPToolset(pool=pool, cache=cache)
+        try:
+            tools = {tool.name: tool for tool in await toolset.get_tools()}
+            geocode = tools["maps_geocode"]
+
+            first = await geocode.run_async(args={"address": "Tokyo Station"}, tool_context=None)
+            again = await geocode.run_async(args={"address": "tokyo  station"}, tool_context=None)
+            other = await geocode.run_async(args={"address": "Shibuya"}, tool_context=None)
+
+            assert again.content[0].text == first.content[0].text
+            assert "call=2" in other.content[0].text
+            assert cache.stats()["hits"] == 1
+        finally:
+            pool.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_calls_are_not_cached(self, stub_server_params):
+        """Test that a tool error is asked again the next time."""
+        pool = MCPServerPool(stub_server_params, size=1, min_size=0)
+        cache = ToolResultCache({"maps_fail": 100}, 10)
+        toolset = PooledMCPToolset(pool=pool, cache=cache)
+        try:
+            tools = {tool.name: tool for tool in await toolset.get_tools()}
+
+            failed = await tools["maps_fail"].run_async(args={"reason": "x"}, tool_context=None)
+
+            assert failed.isError
+            assert len(cache) == 0
+        finally:
+            pool.close()
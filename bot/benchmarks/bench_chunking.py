@@ -0,0 +1,72 @@
+"""
+Benchmark of splitting long mrkdwn answers into Slack messages.
+
+The chunker looks at every line once, so its cost per character stays flat as
+answers grow. While streaming it is fed the stable text after every fragment,
+which is compared with splitting the whole converted text again each time.
+
+    uv run python -m benchmarks.bench_chunking --size 50000 --limit 3000
+"""
+import argparse
+import time
+from markdown_to_mrkdwn import SlackMarkdownConverter
+from module.chunking import MrkdwnChunker, split_mrkdwn
+from module.mrkdwn import IncrementalMrkdwnConverter
+from benchmarks.bench_mrkdwn import build_answer, fragments
+
+
+def bench_split(text: str, limit: int, repeat: int = 5) -> float:
+    """Split the whole text, best of repeat runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        split_mrkdwn(text, limit)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_resplit_per_fragment(parts: list[str], limit: int) -> float:
+    """Split everything converted so far after every fragment."""
+    converter = IncrementalMrkdwnConverter()
+    start = time.perf_counter()
+    for part in parts:
+        converter.feed(part)
+        split_mrkdwn(converter.text, limit)
+    return time.perf_counter() - start
+
+
+def bench_incremental(parts: list[str], limit: int) -> float:
+    """Feed the stable text of every fragment to one chunker."""
+    converter = IncrementalMrkdwnConverter()
+    chunker = MrkdwnChunker(limit)
+    start = time.perf_counter()
+    for part in parts:
+        chunker.feed(converter.feed(part))
+    chunker.feed(converter.finish())
+    chunker.finish()
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark and print the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=50000, help="answer length in characters")
+    parser.add_argument("--chunk", type=int, default=200, help="fragment length in characters")
+    parser.add_argument("--limit", type=int, default=3000, help="message length in characters")
+    args = parser.parse_args()
+
+    print("size        chunks   split ms   us/KB")
+    for size in (args.size // 4, args.size // 2, args.size, args.size * 2):
+        text = SlackMarkdownConverter().convert(build_answer(size))
+        seconds = bench_split(text, args.limit)
+        chunks = len(split_mrkdwn(text, args.limit))
+        print(f"{len(text):>8} {chunks:>9} {seconds * 1000:10.2f} {seconds * 1e6 / (len(text) / 1000):7.1f}")
+
+    parts = fragments(build_answer(args.size), args.chunk)
+    print(f"\nstreamed: {args.size} chars, {len(parts)} fragments")
+    print(f"split everything, every fragment : {bench_resplit_per_fragment(parts, args.limit) * 1000:10.2f} ms")
+    print(f"chunker, every fragment          : {bench_incremental(parts, args.limit) * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
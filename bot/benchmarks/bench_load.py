@@ -0,0 +1,263 @@
+"""
+Load test of /slack/events with a fake Agent Engine and a stub Slack Web API.
+
+main.api is served by uvicorn on localhost. Signed app_mention events are sent
+at a fixed rate regardless of how fast the bot answers, and some of them are
+delivered again the way Slack retries. The stub Slack records when each thread
+got its reply, which gives end-to-end latency, throughput and duplicate replies.
+
+    uv run python -m benchmarks.bench_load --rate 20 --duration 10
+    uv run python -m benchmarks.bench_load --mode async --reply streaming --output base.json
+    uv run python -m benchmarks.bench_load --baseline base.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+import aiohttp
+from slack_sdk.signature import SignatureVerifier
+
+from benchmarks.fakes import BOT_USER_ID, FakeAgentEngine, StubSlackServer
+
+SIGNING_SECRET = "load-test-secret"
+CHANNEL = "C0LOADTEST"
+# ベースラインと比較するときに, 値が小さい / 大きいほど良い指標
+LOWER_IS_BETTER = (
+    "ack_p50_ms", "ack_p99_ms", "first_reply_p50_ms", "first_reply_p99_ms",
+    "complete_p50_ms", "complete_p99_ms", "duplicate_replies", "missing_replies",
+    "slack_connections",
+)
+HIGHER_IS_BETTER = ("throughput_rps",)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def build_body(i: int, users: int) -> bytes:
+    """A signed-to-be app_mention event_callback payload."""
+    now = time.time()
+    ts = f"{int(now)}.{i:06d}"
+    payload = {
+        "token": "load-test",
+        "team_id": "T0LOADTEST",
+        "api_app_id": "A0LOADTEST",
+        "type": "event_callback",
+        "event_id": f"Ev{i:010d}",
+        "event_time": int(now),
+        "event": {
+            "type": "app_mention",
+            "user": f"U{i % users:08d}",
+            "text": f"<@{BOT_USER_ID}> 質問 {i}",
+            "ts": ts,
+            "event_ts": ts,
+            "channel": CHANNEL,
+        },
+    }
+    return json.dumps(payload).encode()
+
+
+class Driver:
+    """Sends signed events at a fixed rate and records the acknowledgements."""
+
+    def __init__(self, url: str, args):
+        self.url = url
+        self.args = args
+        self.signer = SignatureVerifier(SIGNING_SECRET)
+        self.sent_at = {}  # thread ts -> first delivery
+        self.ack_latencies = []
+        self.retries = 0
+        self.failed_acks = 0
+
+    async def run(self):
+        total = int(self.args.rate * self.args.duration)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start = time.perf_counter()
+            tasks = []
+            for i in range(total):
+                await asyncio.sleep(max(0.0, start + i / self.args.rate - time.perf_counter()))
+                body = build_body(i, self.args.users)
+                ts = json.loads(body)["event"]["ts"]
+                self.sent_at[ts] = time.perf_counter()
+                tasks.append(asyncio.create_task(self._post(session, body)))
+                if random.random() < self.args.retry_rate:
+                    self.retries += 1
+                    tasks.append(asyncio.create_task(self._retry(session, body)))
+            await asyncio.gather(*tasks)
+        return start
+
+    async def _retry(self, session, body: bytes):
+        await asyncio.sleep(self.args.retry_delay)
+        await self._post(session, body, retry_num=1)
+
+    async def _post(self, session, body: bytes, retry_num: int = 0):
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": self.signer.generate_signature(timestamp=timestamp, body=body),
+        }
+        if retry_num:
+            headers["X-Slack-Retry-Num"] = str(retry_num)
+            headers["X-Slack-Retry-Reason"] = "http_timeout"
+        start = time.perf_counter()
+        async with session.post(self.url, data=body, headers=headers) as response:
+            await response.read()
+            if response.status != 200:
+                self.failed_acks += 1
+        self.ack_latencies.append(time.perf_counter() - start)
+
+
+def wait_for_replies(stub: StubSlackServer, expected: int, timeout: float, quiet: float = 1.0):
+    """Wait until every thread got a reply and nothing was written for quiet seconds."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        quiet_for = time.perf_counter() - stub.last_write()
+        if stub.replied_threads() >= expected and quiet_for >= quiet:
+            return
+        time.sleep(0.1)
+
+
+def summarize(driver: Driver, stub: StubSlackServer, engine: FakeAgentEngine, start: float) -> dict:
+    """Latency, throughput and correctness figures of one run."""
+    first, complete = [], []
+    last_write = start
+    for ts, sent_at in driver.sent_at.items():
+        writes = stub.writes.get(ts)
+        if writes:
+            first.append(writes[0] - sent_at)
+            complete.append(writes[-1] - sent_at)
+            last_write = max(last_write, writes[-1])
+    replied = len(complete)
+    return {
+        "events": len(driver.sent_at),
+        "retries_sent": driver.retries,
+        "failed_acks": driver.failed_acks,
+        "ack_p50_ms": percentile(driver.ack_latencies, 50) * 1000,
+        "ack_p99_ms": percentile(driver.ack_latencies, 99) * 1000,
+        "first_reply_p50_ms": percentile(first, 50) * 1000,
+        "first_reply_p99_ms": percentile(first, 99) * 1000,
+        "complete_p50_ms": percentile(complete, 50) * 1000,
+        "complete_p99_ms": percentile(complete, 99) * 1000,
+        "throughput_rps": replied / (last_write - start) if last_write > start else 0.0,
+        "missing_replies": len(driver.sent_at) - replied,
+        "duplicate_replies": stub.duplicate_replies(),
+        "error_replies": stub.errors,
+        "slack_connections": stub.connections,
+        "agent_calls": engine.calls,
+    }
+
+
+def print_report(result: dict, baseline: dict | None):
+    """Print the result, with the change against baseline when given."""
+    for name, value in result.items():
+        line = f"{name:20s}: {value:12.2f}" if isinstance(value, float) else f"{name:20s}: {value:12d}"
+        if baseline and name in baseline:
+            before = baseline[name]
+            line += f"   (baseline {before:.2f}"
+            if before:
+                change = (value - before) / before * 100
+                line += f", {change:+.1f}%"
+                if change and name in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                    line += " better" if (change < 0) == (name in LOWER_IS_BETTER) else " worse"
+            line += ")"
+        print(line)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    """Run the load test and print the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=float, default=10, help="events per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send events for")
+    parser.add_argument("--users", type=int, default=50, help="distinct users sending events")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="BOT_EXECUTION_MODE")
+    parser.add_argument("--reply", choices=["single", "streaming"], default="single", help="BOT_REPLY_MODE")
+    parser.add_argument("--ttft", type=float, default=1.0, help="agent time to first token in seconds")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="agent delay between chunks in seconds")
+    parser.add_argument("--chunks", type=int, default=10, help="agent chunks per answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of agent calls that fail")
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="stub Slack API latency in seconds")
+    parser.add_argument("--retry-rate", type=float, default=0.1, help="fraction of events Slack delivers twice")
+    parser.add_argument("--retry-delay", type=float, default=0.5, help="seconds before the retried delivery")
+    parser.add_argument("--rate-limits", default="", help="BOT_RATE_LIMITS, off by default")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the last replies")
+    parser.add_argument("--output", help="write the result as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a result written with --output")
+    args = parser.parse_args()
+
+    # main.py と module は import 時に設定を読むので, 先に環境変数を決める.
+    os.environ.update(
+        SLACK_BOT_TOKEN="xoxb-load-test",
+        SLACK_SECRET=SIGNING_SECRET,
+        AGENT_ENGINE_RESOURCE="fake",
+        BOT_EXECUTION_MODE=args.mode,
+        BOT_REPLY_MODE=args.reply,
+        BOT_AGENT_ENGINE_WARMUP="false",
+        BOT_RATE_LIMITS=args.rate_limits,
+    )
+    os.environ.setdefault("BOT_LOG_LEVEL", "ERROR")
+
+    import uvicorn
+
+    bot_main = importlib.import_module("main")
+    from module import agent
+
+    engine = FakeAgentEngine(
+        ttft=args.ttft,
+        chunk_delay=args.chunk_delay,
+        chunks=args.chunks,
+        error_rate=args.error_rate,
+    )
+    agent.agent_engine = engine
+    stub = StubSlackServer(latency=args.slack_latency).start()
+    bot_main.app.client.base_url = stub.base_url
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(bot_main.api, host="127.0.0.1", port=port, log_level="error")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        driver = Driver(f"http://127.0.0.1:{port}/slack/events", args)
+        start = asyncio.run(driver.run())
+        wait_for_replies(stub, len(driver.sent_at), args.drain_timeout)
+        result = summarize(driver, stub, engine, start)
+    finally:
+        server.should_exit = True
+        thread.join()
+        stub.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(f"mode={args.mode} reply={args.reply} rate={args.rate}/s duration={args.duration}s")
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
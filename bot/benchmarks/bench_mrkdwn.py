@@ -0,0 +1,96 @@
+"""
+Benchmark of the incremental mrkdwn converter against whole-string conversion.
+
+A long Markdown answer is split into streamed fragments. The streaming reply
+needs the converted text after every fragment, which costs a full reparse
+with SlackMarkdownConverter but only the new bytes with the incremental one.
+
+    uv run python -m benchmarks.bench_mrkdwn --size 20000 --chunk 200
+"""
+import argparse
+import time
+from markdown_to_mrkdwn import SlackMarkdownConverter
+from module.mrkdwn import IncrementalMrkdwnConverter
+
+SECTION = """## 見出し {i}
+
+**太字** と *斜体* と `code` と [リンク](https://example.com/{i}) を含む段落です。
+~~取り消し~~ も使います。
+
+- 項目 {i}
+  - 入れ子の項目
+1. 番号付き
+
+| 列A | 列B |
+|-----|-----|
+| {i} | 値 |
+
+```python
+print("**{i}**")
+```
+
+"""
+
+
+def build_answer(size: int) -> str:
+    """Markdown text of roughly size characters."""
+    sections = []
+    length = 0
+    i = 0
+    while length < size:
+        section = SECTION.format(i=i)
+        sections.append(section)
+        length += len(section)
+        i += 1
+    return "".join(sections)[:size]
+
+
+def fragments(text: str, chunk: int) -> list[str]:
+    """Split text into streamed fragments of chunk characters."""
+    return [text[i:i + chunk] for i in range(0, len(text), chunk)]
+
+
+def bench_whole_once(parts: list[str]) -> float:
+    """Convert once at the end, as create_answer does."""
+    start = time.perf_counter()
+    SlackMarkdownConverter().convert("".join(parts))
+    return time.perf_counter() - start
+
+
+def bench_whole_per_fragment(parts: list[str]) -> float:
+    """Reconvert everything after every fragment."""
+    start = time.perf_counter()
+    received = ""
+    for part in parts:
+        received += part
+        SlackMarkdownConverter().convert(received)
+    return time.perf_counter() - start
+
+
+def bench_incremental(parts: list[str]) -> float:
+    """Feed fragments to the incremental converter."""
+    start = time.perf_counter()
+    converter = IncrementalMrkdwnConverter()
+    for part in parts:
+        converter.feed(part)
+    converter.finish()
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark and print the timings."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=20000, help="answer length in characters")
+    parser.add_argument("--chunk", type=int, default=200, help="fragment length in characters")
+    args = parser.parse_args()
+
+    answer = build_answer(args.size)
+    parts = fragments(answer, args.chunk)
+    print(f"answer: {len(answer)} chars, {len(parts)} fragments")
+    print(f"whole string, once at the end : {bench_whole_once(parts) * 1000:10.2f} ms")
+    print(f"whole string, every fragment  : {bench_whole_per_fragment(parts) * 1000:10.2f} ms")
+    print(f"incremental, every fragment   : {bench_incremental(parts) * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
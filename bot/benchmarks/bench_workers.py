@@ -0,0 +1,198 @@
+"""
+Throughput of /slack/events with one and several uvicorn worker processes.
+
+For each worker count, benchmarks.worker_app is served by uvicorn with
+--workers N, the way the Dockerfile runs main:api with WEB_CONCURRENCY=N.
+Client processes send signed app_mention events at --rate events per second,
+with at most --concurrency of them in flight per client, and every event is
+answered: "busy" counts the events refused because the workers were
+overloaded, and "missing" the ones never answered. Some events are delivered
+twice the way Slack retries; with the caches shared between the workers, the
+retries are not answered again whichever worker they reach ("dup" stays 0
+while the workers keep up; an event refused as busy may be refused again on
+its retry).
+
+The default rate is answered by one worker on a small machine. To find how
+many events the workers can verify, parse and dispatch per second, raise
+--rate, or pass --rate 0 to send as fast as the acks come back; beyond the
+capacity the surplus is refused as busy. Scaling needs as many free cores as
+workers, plus the clients.
+
+    uv run python -m benchmarks.bench_workers --workers 1,2,4 --duration 10
+    uv run python -m benchmarks.bench_workers --workers 1,2,4 --rate 0
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+from slack_sdk.signature import SignatureVerifier
+
+from benchmarks.bench_load import SIGNING_SECRET, build_body, free_port, percentile, wait_for_replies
+from benchmarks.fakes import StubSlackServer
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_client(url: str, index: int, clients: int, concurrency: int, rate: float,
+               duration: float, users: int, retry_rate: float) -> dict:
+    """Send events from one client process until duration is over."""
+    return asyncio.run(_client(url, index, clients, concurrency, rate, duration, users, retry_rate))
+
+
+async def _client(url, index, clients, concurrency, rate, duration, users, retry_rate):
+    signer = SignatureVerifier(SIGNING_SECRET)
+    result = {"acks": 0, "failed_acks": 0, "retries": 0, "events": 0, "latencies": []}
+    sequence = iter(range(index, 10 ** 9, clients))  # クライアント間で重ならない通し番号
+    start = time.perf_counter()
+    deadline = start + duration
+    # このクライアントが送る間隔. 0 なら ack が返るたびに送る.
+    interval = clients / rate if rate > 0 else 0.0
+    slots = itertools.count()
+
+    async def post(session, body):
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": signer.generate_signature(timestamp=timestamp, body=body),
+        }
+        start = time.perf_counter()
+        async with session.post(url, data=body, headers=headers) as response:
+            await response.read()
+        result["latencies"].append(time.perf_counter() - start)
+        result["acks" if response.status == 200 else "failed_acks"] += 1
+
+    async def loop(session):
+        while time.perf_counter() < deadline:
+            send_at = start + next(slots) * interval
+            if send_at >= deadline:
+                break
+            await asyncio.sleep(send_at - time.perf_counter())
+            body = build_body(next(sequence), users)
+            result["events"] += 1
+            await post(session, body)
+            if random.random() < retry_rate:
+                result["retries"] += 1
+                await post(session, body)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        await asyncio.gather(*(loop(session) for _ in range(concurrency)))
+    return result
+
+
+def start_server(workers: int, port: int, stub: StubSlackServer, state_dir: str, args):
+    env = {
+        **os.environ,
+        "SLACK_BOT_TOKEN": "xoxb-load-test",
+        "SLACK_SECRET": SIGNING_SECRET,
+        "AGENT_ENGINE_RESOURCE": "fake",
+        "BOT_EXECUTION_MODE": args.mode,
+        "BOT_AGENT_ENGINE_WARMUP": "false",
+        "BOT_RATE_LIMITS": "",
+        "BOT_LOG_LEVEL": os.getenv("BOT_LOG_LEVEL", "ERROR"),
+        "BOT_SHARED_STATE": args.shared,
+        "BOT_SHARED_STATE_PATH": os.path.join(state_dir, f"state-{workers}.db"),
+        "WEB_CONCURRENCY": str(workers),
+        "BENCH_SLACK_URL": stub.base_url,
+        "BENCH_TTFT": str(args.ttft),
+        "BENCH_CHUNKS": str(args.chunks),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.worker_app:api",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "error"],
+        cwd=BOT_DIR, env=env,
+    )
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1)
+            # 全てのワーカーが起動するのを待つ.
+            time.sleep(1 + workers * 0.5)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"uvicorn with {workers} workers did not start")
+
+
+def measure(workers: int, state_dir: str, args) -> dict:
+    """Serve with workers processes, drive the clients and collect the figures."""
+    stub = StubSlackServer(latency=args.slack_latency).start()
+    port = free_port()
+    server = start_server(workers, port, stub, state_dir, args)
+    try:
+        url = f"http://127.0.0.1:{port}/slack/events"
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            start = time.perf_counter()
+            results = pool.starmap(run_client, [
+                (url, i, args.clients, args.concurrency, args.rate, args.duration, args.users,
+                 args.retry_rate)
+                for i in range(args.clients)
+            ])
+            elapsed = time.perf_counter() - start
+        events = sum(result["events"] for result in results)
+        wait_for_replies(stub, events, args.drain_timeout)
+    finally:
+        server.terminate()
+        server.wait(30)
+        stub.stop()
+
+    latencies = [latency for result in results for latency in result["latencies"]]
+    acks = sum(result["acks"] for result in results)
+    return {
+        "workers": workers,
+        "acks_per_second": acks / elapsed,
+        "ack_p50_ms": percentile(latencies, 50) * 1000,
+        "ack_p99_ms": percentile(latencies, 99) * 1000,
+        "events": events,
+        "retries_sent": sum(result["retries"] for result in results),
+        "failed_acks": sum(result["failed_acks"] for result in results),
+        "missing_replies": events - stub.replied_threads(),
+        "duplicate_replies": stub.duplicate_replies(),
+        "busy_replies": stub.busy,
+    }
+
+
+def main():
+    """Run the benchmark for each worker count and print the scaling."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send events for")
+    parser.add_argument("--clients", type=int, default=2, help="client processes")
+    parser.add_argument("--rate", type=float, default=50, help="events per second from all clients (0: as fast as acked)")
+    parser.add_argument("--concurrency", type=int, default=8, help="events in flight per client at most")
+    parser.add_argument("--users", type=int, default=50, help="distinct users sending events")
+    parser.add_argument("--mode", choices=["sync", "async"], default="async", help="BOT_EXECUTION_MODE")
+    parser.add_argument("--shared", choices=["auto", "true", "false"], default="auto", help="BOT_SHARED_STATE")
+    parser.add_argument("--ttft", type=float, default=0.05, help="agent time to first token in seconds")
+    parser.add_argument("--chunks", type=int, default=3, help="agent chunks per answer")
+    parser.add_argument("--slack-latency", type=float, default=0.0, help="stub Slack API latency in seconds")
+    parser.add_argument("--retry-rate", type=float, default=0.1, help="fraction of events Slack delivers twice")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the last replies")
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} mode={args.mode} rate={args.rate or 'max'}/s "
+          f"clients={args.clients}x{args.concurrency} duration={args.duration}s")
+    print(f"{'workers':>7s} {'acks/s':>9s} {'speedup':>7s} {'p50 ms':>7s} {'p99 ms':>7s} "
+          f"{'failed':>6s} {'missing':>7s} {'dup':>4s} {'busy':>5s}")
+    base = None
+    with tempfile.TemporaryDirectory() as state_dir:
+        for workers in [int(n) for n in args.workers.split(",")]:
+            result = measure(workers, state_dir, args)
+            base = base or result["acks_per_second"]
+            print(f"{workers:7d} {result['acks_per_second']:9.1f} {result['acks_per_second'] / base:6.2f}x "
+                  f"{result['ack_p50_ms']:7.1f} {result['ack_p99_ms']:7.1f} {result['failed_acks']:6d} "
+                  f"{result['missing_replies']:7d} {result['duplicate_replies']:4d} {result['busy_replies']:5d}")
+
+
+if __name__ == "__main__":
+    main()
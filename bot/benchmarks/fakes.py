@@ -0,0 +1,223 @@
+"""
+Local stand-ins for the Agent Engine and the Slack Web API used by the benchmarks.
+
+FakeAgentEngine answers stream_query, and streams the same answer through its
+execution_async_client, with a configurable time to first token, delay between
+chunks and error rate. StubSlackServer is an
+HTTP server speaking enough of the Web API for the bot, and records every
+message it is asked to post or update.
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.api import httpbody_pb2
+
+BOT_USER_ID = "U08QRHY4R42"
+ERROR_MARKER = "メッセージを処理できませんでした"
+BUSY_MARKER = "ただいま混み合っています"
+
+
+class FakeAgentEngine:
+    """Agent Engine client that streams canned text after fixed delays."""
+
+    resource_name = "projects/bench/locations/local/reasoningEngines/fake"
+
+    def __init__(
+        self,
+        ttft: float = 1.0,
+        chunk_delay: float = 0.05,
+        chunks: int = 10,
+        chunk_chars: int = 80,
+        error_rate: float = 0.0,
+        session_delay: float = 0.05,
+    ):
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.session_delay = session_delay
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._sessions = {}  # user_id -> session id
+        self.execution_async_client = FakeExecutionAsyncClient(self)
+        # 本物と同じく, クライアントを作る時に SDK を読み込んでおく（イベントループ上で import しない）.
+        import google.cloud.aiplatform_v1.types  # noqa: F401
+        import vertexai.agent_engines._utils  # noqa: F401
+
+    def list_sessions(self, user_id: str):
+        time.sleep(self.session_delay)
+        with self._lock:
+            session_id = self._sessions.get(user_id)
+        return {"sessions": [{"id": session_id}] if session_id else []}
+
+    def create_session(self, user_id: str):
+        time.sleep(self.session_delay)
+        with self._lock:
+            session_id = self._sessions.setdefault(user_id, f"session-{len(self._sessions)}")
+        return {"id": session_id}
+
+    def stream_query(self, user_id: str, session_id: str, message: str):
+        self._count()
+        time.sleep(self.ttft)
+        self._maybe_fail()
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield self._event(i)
+
+    async def _async_stream_query(self, user_id: str, session_id: str, message: str):
+        self._count()
+        await asyncio.sleep(self.ttft)
+        self._maybe_fail()
+        for i in range(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield self._event(i)
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def _maybe_fail(self):
+        if random.random() < self.error_rate:
+            raise RuntimeError("fake agent engine error")
+
+    def _event(self, i: int) -> dict:
+        text = f"chunk {i} " + "x" * max(0, self.chunk_chars - 8)
+        return {"author": "root_agent", "content": {"role": "model", "parts": [{"text": text}]}}
+
+
+class FakeExecutionAsyncClient:
+    """Async execution client of FakeAgentEngine, streaming HttpBody chunks."""
+
+    def __init__(self, engine: FakeAgentEngine):
+        self.engine = engine
+
+    async def stream_query_reasoning_engine(self, request):
+        events = self.engine._async_stream_query(**dict(request.input))
+
+        async def chunks():
+            async for event in events:
+                yield httpbody_pb2.HttpBody(content_type="application/json", data=json.dumps(event).encode())
+        return chunks()
+
+
+class StubSlackServer:
+    """Slack Web API stub on localhost that records posts and updates."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.posts = {}  # thread_ts -> [perf_counter of each chat.postMessage]
+        self.writes = {}  # thread_ts -> [perf_counter of each post or update]
+        self.errors = 0  # replies that carry the error message
+        self.busy = 0  # replies that carry the busy message
+        self.connections = 0  # TCP connections accepted
+        self._ts = itertools.count(1)
+        self._reply_threads = {}  # ts of our reply -> thread_ts
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def replied_threads(self) -> int:
+        with self._lock:
+            return len(self.posts)
+
+    def last_write(self) -> float:
+        """perf_counter of the latest post or update, 0 before any."""
+        with self._lock:
+            return max((times[-1] for times in self.writes.values()), default=0.0)
+
+    def duplicate_replies(self) -> int:
+        """Number of extra chat.postMessage calls into threads already answered."""
+        with self._lock:
+            return sum(len(times) - 1 for times in self.posts.values())
+
+    def _record(self, method: str, payload: dict) -> dict:
+        now = time.perf_counter()
+        with self._lock:
+            if method == "chat.postMessage":
+                ts = f"{next(self._ts)}.000000"
+                thread_ts = payload.get("thread_ts") or ts
+                self._reply_threads[ts] = thread_ts
+                self.posts.setdefault(thread_ts, []).append(now)
+            elif method == "chat.update":
+                ts = payload["ts"]
+                thread_ts = self._reply_threads.get(ts, ts)
+            else:
+                return {"ok": True}
+            self.writes.setdefault(thread_ts, []).append(now)
+            if ERROR_MARKER in (payload.get("text") or ""):
+                self.errors += 1
+            if BUSY_MARKER in (payload.get("text") or ""):
+                self.busy += 1
+        return {"ok": True, "channel": payload.get("channel"), "ts": ts}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Slack と同じく keep-alive で接続を使い回せるようにする.
+            protocol_version = "HTTP/1.1"
+            # ヘッダと本文を別々に書くので, 使い回した接続で Nagle による遅延が出ないようにする.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                payload = _parse_body(self.headers.get("Content-Type", ""), body)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if method == "auth.test":
+                    response = {
+                        "ok": True,
+                        "user_id": BOT_USER_ID,
+                        "bot_id": "B0LOADTEST",
+                        "team_id": "T0LOADTEST",
+                        "user": "gemini",
+                    }
+                else:
+                    response = stub._record(method, payload)
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _parse_body(content_type: str, body: bytes) -> dict:
+    if "json" in content_type:
+        return json.loads(body or b"{}")
+    from urllib.parse import parse_qsl
+
+    return dict(parse_qsl(body.decode()))
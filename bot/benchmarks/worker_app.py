@@ -0,0 +1,20 @@
+"""
+main.api wired to the fakes, for uvicorn worker processes started by bench_workers.
+
+Every worker imports this module on its own, so the fake Agent Engine and the
+address of the stub Slack API come from the environment set by the benchmark:
+BENCH_SLACK_URL, BENCH_TTFT, BENCH_CHUNK_DELAY and BENCH_CHUNKS.
+"""
+import os
+
+import main
+from benchmarks.fakes import FakeAgentEngine
+from module import agent
+
+agent.agent_engine = FakeAgentEngine(
+    ttft=float(os.getenv("BENCH_TTFT", "0.05")),
+    chunk_delay=float(os.getenv("BENCH_CHUNK_DELAY", "0")),
+    chunks=int(os.getenv("BENCH_CHUNKS", "3")),
+)
+main.app.client.base_url = os.environ["BENCH_SLACK_URL"]
+api = main.api
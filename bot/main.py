@@ -2,32 +2,95 @@
 FastAPI Slack Bot.
 
 Handles requests from Slack using FastAPI and SocketModeHandler.
+BOT_EXECUTION_MODE selects the sync (App) or asyncio (AsyncApp) pipeline.
 """
+import asyncio
 import os
-from slack_bolt.adapter.socket_mode import SocketModeHandler
-from slack_bolt.adapter.fastapi import SlackRequestHandler
-from fastapi import FastAPI, Request
-from module.app import app
+from contextlib import asynccontextmanager
+from module import startup
 
-app_handler = SlackRequestHandler(app)
-api = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+with startup.timed("import_fastapi"):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from module import agent, lifecycle, metrics, prefilter
+from module.logs import setup_logging
+from module.worker import EXECUTION_MODE
+
+setup_logging()
+
+with startup.timed("import_slack_app"):
+    if EXECUTION_MODE == "async":
+        from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
+        from module.async_app import app
+
+        app_handler = AsyncSlackRequestHandler(app)
+    else:
+        from slack_bolt.adapter.fastapi import SlackRequestHandler
+        from module.app import app
+
+        app_handler = SlackRequestHandler(app)
+
+
+@asynccontextmanager
+async def lifespan(_api):
+    """Warm up the agent engine client while serving, and drain the answers on shutdown."""
+    agent.warm_up()
+    lifecycle.watch_signals()
+    yield
+    await lifecycle.drain()
+
+
+api = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
+startup.report()
 
 
 @api.post("/slack/events")
 async def endpoint(req: Request):
     """Handle incoming Slack events."""
-    return await app_handler.handle(req)
+    # 終了処理中は受け付けず, Slack に他のインスタンスへ再送させる.
+    if lifecycle.is_draining():
+        return Response(status_code=503)
+    # 回答しないイベントには, Bolt に渡さずにすぐ 200 を返す.
+    reason = prefilter.drop_reason(await req.body(), req.headers.get("content-type", ""))
+    if reason is not None:
+        prefilter.DROPPED.inc(reason=reason)
+        return Response()
+    with metrics.IN_FLIGHT.track_inprogress(kind="http"), \
+         metrics.STAGE_SECONDS.time(stage="http"):
+        return await app_handler.handle(req)
 
 
 @api.get("/healthz")
 async def healthz():
-    """Health check endpoint."""
+    """Health check endpoint. Not ready while the instance is draining."""
+    if lifecycle.is_draining():
+        return JSONResponse({"status": "draining"}, status_code=503)
     return {"status": "ok"}
 
 
+@api.get("/metrics")
+async def metrics_endpoint():
+    """Metrics in the Prometheus text format."""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
 # socket mode on direct run
 if __name__ == "__main__":
     try:
-        SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start()
+        agent.warm_up()
+        if EXECUTION_MODE == "async":
+            from slack_bolt.adapter.socket_mode.async_handler import (
+                AsyncSocketModeHandler,
+            )
+
+            asyncio.run(
+                AsyncSocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start_async()
+            )
+        else:
+            from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+            SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start()
     except KeyboardInterrupt:
         pass  # Ctrl+C が押された時はエラーではなく正常終了とする.
@@ -4,56 +4,299 @@ This file defines an agent that interacts with a Vertex AI agent engine.
 It handles creating answers to user messages, managing user sessions,
 and preprocessing input text by removing mentions.
 """
+import logging
 import os
 import re
+import threading
+import time
 from markdown_to_mrkdwn import SlackMarkdownConverter
-from vertexai import agent_engines
+from . import metrics, resilience, startup, transport
+from .breaker import breaker
+from .logs import event_type, log_agent_event
+from .response_cache import response_cache
+from .shared_state import new_cache, new_keyed_lock
 
-agent_engine = agent_engines.get(os.getenv("AGENT_ENGINE_RESOURCE"))
+SESSION_CACHE_TTL = float(os.getenv("BOT_SESSION_CACHE_TTL", "3600"))
+SESSION_CACHE_MAXSIZE = int(os.getenv("BOT_SESSION_CACHE_MAXSIZE", "1000"))
+# 起動後にバックグラウンドでクライアントを作っておく
+AGENT_ENGINE_WARMUP = os.getenv("BOT_AGENT_ENGINE_WARMUP", "true").lower() == "true"
 
+# Agent Engine が不調で, 問い合わせを控えている間の返信.
+UNAVAILABLE_LINES = [
+    "Gemini が一時的に利用できません。少し時間をおいてもう一度お試しください。:bow:",
+    "※本メッセージはGeminiからの返答ではありません。",
+]
 
-def create_answer(thread_id: str, message: str):
+logger = logging.getLogger(__name__)
+
+# 起動を速くするため, vertexai の import とクライアントの作成は最初に使う時まで遅らせる.
+agent_engine = None
+_agent_engine_lock = threading.Lock()
+# thread_id -> session_id. Saves list_sessions/create_session round trips.
+_session_cache = new_cache("session", SESSION_CACHE_MAXSIZE, SESSION_CACHE_TTL)
+_session_locks = new_keyed_lock("session")
+metrics.register_stats("session", _session_cache.stats)
+
+
+def get_agent_engine():
+    """Return the agent engine client, creating it on first use."""
+    global agent_engine
+    if agent_engine is None:
+        with _agent_engine_lock:
+            if agent_engine is None:
+                with startup.timed("agent_engine"):
+                    from vertexai import agent_engines
+
+                    engine = agent_engines.get(os.getenv("AGENT_ENGINE_RESOURCE"))
+                    transport.keep_agent_engine_client(engine)
+                    agent_engine = engine
+                startup.report()
+    return agent_engine
+
+
+def warm_up():
+    """Create the agent engine client on a background thread, off the request path."""
+    if AGENT_ENGINE_WARMUP and agent_engine is None:
+        threading.Thread(target=_warm_up, name="agent-engine-warmup", daemon=True).start()
+
+
+def _warm_up():
+    try:
+        get_agent_engine()
+    except Exception:
+        logger.exception("failed to warm up the agent engine client")
+
+
+def create_answer(thread_id: str, message: str, first_turn: bool = False):
     """Create an answer for the given user and session."""
     md_converter = SlackMarkdownConverter()
-    answers = []
+    answer = "\n".join(stream_answer(thread_id, message, first_turn))
+    with metrics.span("convert"):
+        return md_converter.convert(answer)
+
+
+def stream_answer(thread_id: str, message: str, first_turn: bool = False):
+    """Yield the text parts of the answer as the agent produces them.
+
+    The first message of a thread may be answered from the response cache.
+    """
+    message, cached, cacheable = response_cache.lookup(
+        thread_id, _remove_mention_string(message), first_turn
+    )
+    if cached is not None:
+        yield from cached
+        return
+    # Agent Engine が不調な間は, 問い合わせずにすぐ返信する.
+    if not breaker.allow():
+        metrics.ERRORS.inc(stage="stream", error="CircuitOpen")
+        yield from UNAVAILABLE_LINES
+        return
+
+    parts = []
+    used_tool = False
+    tokens = {"prompt": 0, "candidates": 0}
     try:
-        for event in agent_engine.stream_query(
-            user_id=thread_id,
-            session_id=_get_or_create_session_id(thread_id),
-            message=_remove_mention_string(message),
-        ):
-            print(event)
-            result = event["content"]["parts"][0]
-            if "text" in result:
-                answers.append(result["text"])
+        for event in breaker.guard(_stream_query(thread_id, message, first_turn)):
+            log_agent_event(event, thread_id)
+            used_tool = used_tool or event_type(event) == "function_call"
+            _add_tokens(tokens, event)
+            text = _event_text(event)
+            if text is not None:
+                parts.append(text)
+                yield text
     except Exception as e:
-        answers.extend(
-            [
-                "メッセージを処理できませんでした。もう一度実行してみてください。:bow:",
-                "※本メッセージはGeminiからの返答ではありません。",
-                "",
-                "",
-                "エラー詳細",
-                "```",
-                str(e),
-                "```",
-            ]
+        metrics.ERRORS.inc(stage="stream", error=type(e).__name__)
+        yield from _error_lines(e)
+        return
+    for kind, count in tokens.items():
+        metrics.AGENT_TOKENS.observe(count, kind=kind)
+    if cacheable:
+        response_cache.set(message, parts, used_tool)
+
+
+def _add_tokens(tokens: dict, event: dict):
+    """Add the token counts of a model call to tokens."""
+    usage = event.get("usage_metadata") or {}
+    for kind in tokens:
+        tokens[kind] += usage.get(f"{kind}_token_count") or 0
+
+
+def _event_text(event: dict) -> str | None:
+    """Return the text part of a streamed agent event, if any."""
+    result = event["content"]["parts"][0]
+    return result.get("text")
+
+
+def _error_lines(error: Exception) -> list[str]:
+    """Lines of the reply posted instead of an answer when the agent fails."""
+    return [
+        "メッセージを処理できませんでした。もう一度実行してみてください。:bow:",
+        "※本メッセージはGeminiからの返答ではありません。",
+        "",
+        "",
+        "エラー詳細",
+        "```",
+        str(error),
+        "```",
+    ]
+
+
+def _stream_query(thread_id: str, message: str, first_turn: bool = False):
+    """Stream agent events within the deadlines, trying again on failures before the first event.
+
+    A cached session that is gone is looked up again once, and transient
+    failures are retried up to STREAM_RETRIES times after a jittered backoff.
+    """
+    retries = 0
+    refreshed = False
+    while True:
+        started = False
+        try:
+            for event in _timed_events(_guarded_query(thread_id, message, first_turn)):
+                started = True
+                yield event
+            return
+        except Exception as e:
+            if started:
+                raise
+            # キャッシュしていたセッションが消えていた場合は, 取り直して一度だけやり直す.
+            if not refreshed and _is_session_gone(e) and _session_cache.pop(thread_id) is not None:
+                refreshed = True
+                continue
+            if retries >= resilience.STREAM_RETRIES or not resilience.is_transient(e):
+                raise
+            logger.warning("retrying stream_query after %r", e)
+            resilience.RETRIES.inc(error=type(e).__name__)
+            time.sleep(resilience.backoff(retries))
+            retries += 1
+
+
+def _guarded_query(thread_id: str, message: str, first_turn: bool):
+    """The events of one query within the deadlines, hedging the first turn of a thread."""
+    session_id = _get_or_create_session_id(thread_id)
+    # 2つ目の問い合わせは, 履歴が無い最初の発言だけ別のセッションで行える.
+    hedge = _HedgeSession(thread_id, session_id) if first_turn else None
+    return resilience.guard_stream(
+        lambda: get_agent_engine().stream_query(
+            user_id=thread_id, session_id=session_id, message=message
+        ),
+        open_hedge=hedge and (lambda: hedge.events(message)),
+        on_hedge=hedge and hedge.settle,
+    )
+
+
+class _HedgeSession:
+    """The second session of a hedged first turn.
+
+    Both sessions are sent the message, so the one whose answer is not used
+    is deleted, and the thread keeps the other.
+    """
+
+    def __init__(self, thread_id: str, session_id: str):
+        self.thread_id = thread_id
+        self.primary_id = session_id
+        self.session_id = None
+        self._lost = False
+        self._lock = threading.Lock()
+
+    def create(self) -> str | None:
+        """Create the session, or None when the primary query has already answered."""
+        session_id = get_agent_engine().create_session(user_id=self.thread_id)["id"]
+        with self._lock:
+            self.session_id = session_id
+            lost = self._lost
+        if lost:
+            _delete_session(self.thread_id, session_id)
+            return None
+        return session_id
+
+    def events(self, message: str):
+        session_id = self.create()
+        if session_id is None:
+            return iter(())
+        return get_agent_engine().stream_query(
+            user_id=self.thread_id, session_id=session_id, message=message
         )
-    return md_converter.convert("\n".join(answers))
+
+    def settle(self, winner: str):
+        """Keep the session that answered and delete the other."""
+        if winner == resilience.HEDGE:
+            _session_cache.set(self.thread_id, self.session_id)
+            _delete_session_later(self.thread_id, self.primary_id)
+            return
+        with self._lock:
+            self._lost = True
+            session_id = self.session_id
+        if session_id is not None:
+            _delete_session_later(self.thread_id, session_id)
+
+
+def _delete_session_later(thread_id: str, session_id: str):
+    threading.Thread(
+        target=_delete_session, args=(thread_id, session_id), name="delete-session", daemon=True
+    ).start()
+
+
+def _delete_session(thread_id: str, session_id: str):
+    try:
+        get_agent_engine().delete_session(user_id=thread_id, session_id=session_id)
+    except Exception:
+        logger.exception("failed to delete the unused session %s", session_id)
+
+
+def _timed_events(events):
+    """Yield events, recording the time to the first one and to the end of the stream."""
+    start = time.perf_counter()
+    first = True
+    for event in events:
+        if first:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_event")
+            first = False
+        yield event
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="stream")
 
 
 def _get_or_create_session_id(thread_id: str):
     """Get or create a session ID for the given thread ID."""
+    with metrics.span("session"):
+        session_id = _session_cache.get(thread_id)
+        if session_id is not None:
+            return session_id
+        return _load_session_id(thread_id)
+
+
+def _load_session_id(thread_id: str):
+    """Fetch the session ID of a thread missing from the cache, and cache it."""
+    # 同じスレッドの新規セッションを並行して作らないよう, ワーカープロセスをまたいでスレッド単位で直列化する.
+    with _session_locks(thread_id):
+        session_id = _session_cache.get(thread_id)
+        if session_id is None:
+            session_id = _fetch_or_create_session_id(thread_id)
+            _session_cache.set(thread_id, session_id)
+    return session_id
+
+
+def _fetch_or_create_session_id(thread_id: str):
+    """Look up the session of the thread on the agent engine, creating it if needed."""
     # Check if the session ID already exists
-    sessions = agent_engine.list_sessions(user_id=thread_id)["sessions"]
+    sessions = get_agent_engine().list_sessions(user_id=thread_id)["sessions"]
     if len(sessions) >= 1:
         return sessions[0]["id"]
 
     # Create a new session ID
-    session = agent_engine.create_session(user_id=thread_id)
+    session = get_agent_engine().create_session(user_id=thread_id)
     return session["id"]
 
 
+def _is_session_gone(error: Exception) -> bool:
+    """Whether the agent engine rejected the request because the session no longer exists."""
+    from google.api_core import exceptions as google_exceptions
+
+    return isinstance(error, google_exceptions.NotFound) or (
+        "session not found" in str(error).lower()
+    )
+
+
 def _remove_mention_string(text: str) -> str:
     """テキストからメンション文字列を削除する."""
     return re.sub(r"<@.+?>", "", text, count=1).strip()
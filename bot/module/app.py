@@ -4,58 +4,195 @@ This file implements a Slack bot using the slack_bolt library.
 It handles incoming messages (DMs and mentions), processes them using an AI agent,
 allows for message deletion via reactions, and defines a slash command.
 """
+import logging
 import os
 from slack_bolt import App
-from . import agent
+from . import agent, lifecycle, metrics
+from .chunking import message_payload, split_mrkdwn
+from .common import (
+    HELP_MESSAGE,
+    OVERLOAD_POLICY,
+    REPLY_MODE,
+    SLACK_BOT_USER_ID,
+    SLACK_BUSY_MESSAGE,
+    SLACK_DELETE_REACTION,
+    SLACK_RATE_LIMITED_MESSAGE,
+    SLACK_VERIFY_TOKEN_ON_START,
+    THREAD_QUEUE_SIZE,
+    is_first_turn,
+    merge_events,
+    observe_ingress,
+    thread_id_of,
+)
+from .dedup import deduplicator
+from .ratelimit import answer_slots, limit_keys, rate_limiter
+from .shared_state import new_keyed_lock
+from .streaming import StreamingReply
+from .thread_queue import ThreadQueue
+from .transport import PooledWebClient
+from .worker import answer_executor
+
+# "background": ack してから回答を生成する / "inline": ハンドラ内で回答する
+ANSWER_MODE = os.getenv("BOT_ANSWER_MODE", "background")
 
-SLACK_BOT_USER_ID = "U08QRHY4R42"  # BotのユーザID
-SLACK_DELETE_REACTION = "del_gemini"  # 削除用のリアクションを作成しておく
+logger = logging.getLogger(__name__)
 
 # ボットトークンを渡してアプリを初期化します
 app = App(
     token=os.environ.get("SLACK_BOT_TOKEN"),
     signing_secret=os.environ.get("SLACK_SECRET"),
+    token_verification_enabled=SLACK_VERIFY_TOKEN_ON_START,
 )
 
 
+@app.middleware
+def use_pooled_client(context, next):
+    """リクエストごとに Bolt が作る WebClient を, 接続を使い回すものに差し替える."""
+    context["client"] = PooledWebClient.from_client(context.client)
+    # 引数を用意する際に古い client で作られた say は, 次に使う時に作り直させる.
+    context.pop("say", None)
+    next()
+
+
 # https://tools.slack.dev/bolt-python/ja-jp/getting-started/
 # https://tools.slack.dev/bolt-python/api-docs/slack_bolt/kwargs_injection/args.html
 @app.event("message")
-def event_message(event, say):
+def event_message(event, say, body=None):
     """Slack Apps に対する DM で発言された時に返信する."""
     # ボットとの DM 以外を除外する.
     if event.get("channel_type") != "im":
         return
 
-    thread_id = event["thread_ts"] if "thread_ts" in event else event["ts"]
-    say(
-        {
-            "text": agent.create_answer(str(thread_id), event["text"]),
-            "thread_ts": event["ts"],
-        }
-    )
+    _dispatch_answer(event, say, body)
 
 
 @app.event("app_mention")
-def event_mention(event, say):
+def event_mention(event, say, body=None):
     """ボットがメンションされた場合に返信する."""
-    thread_id = event["thread_ts"] if "thread_ts" in event else event["ts"]
-    say(
-        {
-            "text": agent.create_answer(str(thread_id), event["text"]),
-            "thread_ts": event["ts"],
-        }
-    )
+    _dispatch_answer(event, say, body)
+
+
+def _dispatch_answer(event, say, body=None):
+    """回答の生成を ANSWER_MODE に応じてその場で, またはバックグラウンドで行う."""
+    observe_ingress(event)
+    # Slack の再送や同じ投稿に対する複数のイベントには一度だけ回答する.
+    if deduplicator.is_duplicate(event, body):
+        logger.info("skip duplicated event ts=%s", event["ts"])
+        return
+    # 1人のユーザやチャンネルが Agent Engine を占有しないよう, 回答する頻度を制限する.
+    scope = rate_limiter.acquire(limit_keys(event, body))
+    if scope is not None:
+        logger.info("rate limited by %s, event ts=%s", scope, event["ts"])
+        _post_ephemeral(event, say, SLACK_RATE_LIMITED_MESSAGE)
+        return
+
+    if ANSWER_MODE == "inline":
+        _reply(event, say)
+        return
+
+    # 回答が先に終わっても残らないよう, キューに入れる前に覚えておく.
+    lifecycle.accept(event, say)
+    if answer_queue.put(thread_id_of(event), (event, say)):
+        return
+    lifecycle.finish(event)
+
+    logger.warning("answer queue is full, dropping event ts=%s", event["ts"])
+    metrics.ERRORS.inc(stage="dispatch", error="Overloaded")
+    # 処理しなかったイベントは Slack の再送で改めて受け付ける.
+    deduplicator.forget(event, body)
+    if OVERLOAD_POLICY == "busy":
+        say({"text": SLACK_BUSY_MESSAGE, "thread_ts": event["ts"]})
+
+
+def _reply_batch(thread_id, items):
+    """同じスレッドで続けて届いた発言に, まとめて一度だけ回答する."""
+    events = [event for event, _ in items]
+    try:
+        # 同じスレッドの発言が別のワーカーに届いても, 順番に回答する.
+        with _turn_locks(thread_id):
+            _reply(merge_events(events), items[-1][1], events)
+    finally:
+        for item, _ in items:
+            lifecycle.finish(item)
+
+
+# スレッドごとに発言を順番に処理し, 続けて届いた発言はまとめる.
+_turn_locks = new_keyed_lock("turn")
+answer_queue = ThreadQueue(_reply_batch, answer_executor, THREAD_QUEUE_SIZE)
+
+
+def _reply(event, say, events=None):
+    """同時に生成する回答の数に空きがあれば, 回答をスレッドに投稿する.
+
+    events は回答する発言で, 省略すると event だけに回答する.
+    """
+    with answer_slots.slot() as admitted:
+        if admitted:
+            _answer(event, say, events or [event])
+            return
+    logger.warning("too many answers in progress, refusing event ts=%s", event["ts"])
+    _post_ephemeral(event, say, SLACK_BUSY_MESSAGE)
+
+
+def _answer(event, say, events):
+    """エージェントの回答をスレッドに投稿する."""
+    with metrics.IN_FLIGHT.track_inprogress(kind="answer"), \
+         metrics.STAGE_SECONDS.time(stage="answer"):
+        try:
+            if REPLY_MODE == "streaming":
+                _reply_streaming(event, say, events)
+                return
+            text = agent.create_answer(
+                thread_id_of(event), event["text"], is_first_turn(event)
+            )
+            # 停止の際に中断を知らせた発言には, 遅れて回答しない.
+            if not lifecycle.claim(events):
+                logger.info("drop the answer to interrupted event ts=%s", event["ts"])
+                return
+            with metrics.span("say"):
+                # 長い回答は Slack の上限に収まるよう分け, 順番に投稿する.
+                for chunk in split_mrkdwn(text) or [text]:
+                    say({**message_payload(chunk), "thread_ts": event["ts"]})
+        except Exception:
+            logger.exception("failed to reply to event ts=%s", event["ts"])
+
+
+def _reply_streaming(event, say, events):
+    """仮のメッセージを投稿し, 回答の生成に合わせて更新していく."""
+    # 仮のメッセージを投稿した回答は, 停止の際にも中断を知らせず最後まで更新する.
+    if not lifecycle.claim(events):
+        logger.info("drop the answer to interrupted event ts=%s", event["ts"])
+        return
+    reply = StreamingReply(say.client, event["channel"], event["ts"])
+    reply.start()
+    for text in agent.stream_answer(
+        thread_id_of(event), event["text"], is_first_turn(event)
+    ):
+        reply.append(text)
+    reply.finish()
+
+
+def _post_ephemeral(event, say, text):
+    """発言したユーザにだけ見えるメッセージを送る."""
+    try:
+        say.client.chat_postEphemeral(
+            channel=event["channel"],
+            user=event["user"],
+            text=text,
+            thread_ts=event.get("thread_ts"),
+        )
+    except Exception:
+        logger.exception("failed to post an ephemeral message for ts=%s", event["ts"])
 
 
 @app.event("reaction_added")
-def message_delete(event):
+def message_delete(event, client):
     """削除用のリアクションがついた場合に発言を削除する."""
     if (
         event["reaction"] == SLACK_DELETE_REACTION
         and event["item_user"] == SLACK_BOT_USER_ID
     ):
-        app.client.chat_delete(
+        client.chat_delete(
             channel=event["item"]["channel"], ts=event["item"]["ts"]
         )
 
@@ -76,17 +213,7 @@ def handle_slash_command(ack, client, command):
 
     # bot の使い方を表示する.
     if subcommand == "help":
-        post_ephemeral_message(
-            "\n".join(
-                [
-                    "1. gemini をメンションすると Google Gemini からのレスポンスが返されます。",
-                    "2. スレッド内でやり取りを繰り返すと、それまでの会話を考慮した回答がおこなわれます。",
-                    "3. スレッド内でもメンションは必要です。",
-                    "4. gemini との DM でも利用可能です。この場合はメンション不要です。",
-                    f"5. gemini からの返信に :{SLACK_DELETE_REACTION}: でリアクションすると返信を削除できます。",
-                ]
-            )
-        )
+        post_ephemeral_message(HELP_MESSAGE)
         return
 
     post_ephemeral_message("Not Implemented")
@@ -0,0 +1,178 @@
+"""
+This file defines the asyncio counterpart of agent.py.
+
+Answers are streamed through the agent engine's async execution client, so a
+conversation waiting for Gemini holds no thread. Sessions and helpers are
+shared with agent.py.
+"""
+import asyncio
+import logging
+import time
+from markdown_to_mrkdwn import SlackMarkdownConverter
+from . import agent, metrics, resilience
+from .async_transport import keep_agent_engine_async_client
+from .breaker import breaker
+from .logs import event_type, log_agent_event
+from .response_cache import response_cache
+from .shared_state import offload
+
+logger = logging.getLogger(__name__)
+
+
+async def create_answer(thread_id: str, message: str, first_turn: bool = False):
+    """Create an answer for the given user and session."""
+    md_converter = SlackMarkdownConverter()
+    answers = [text async for text in stream_answer(thread_id, message, first_turn)]
+    with metrics.span("convert"):
+        return md_converter.convert("\n".join(answers))
+
+
+async def stream_answer(thread_id: str, message: str, first_turn: bool = False):
+    """Yield the text parts of the answer as the agent produces them.
+
+    The first message of a thread may be answered from the response cache.
+    """
+    message, cached, cacheable = await offload(
+        response_cache.lookup, thread_id, agent._remove_mention_string(message), first_turn
+    )
+    if cached is not None:
+        for text in cached:
+            yield text
+        return
+    if not breaker.allow():
+        metrics.ERRORS.inc(stage="stream", error="CircuitOpen")
+        for line in agent.UNAVAILABLE_LINES:
+            yield line
+        return
+
+    parts = []
+    used_tool = False
+    tokens = {"prompt": 0, "candidates": 0}
+    try:
+        async for event in breaker.guard_async(_stream_query(thread_id, message, first_turn)):
+            log_agent_event(event, thread_id)
+            used_tool = used_tool or event_type(event) == "function_call"
+            agent._add_tokens(tokens, event)
+            text = agent._event_text(event)
+            if text is not None:
+                parts.append(text)
+                yield text
+    except Exception as e:
+        metrics.ERRORS.inc(stage="stream", error=type(e).__name__)
+        for line in agent._error_lines(e):
+            yield line
+        return
+    for kind, count in tokens.items():
+        metrics.AGENT_TOKENS.observe(count, kind=kind)
+    if cacheable:
+        await offload(response_cache.set, message, parts, used_tool)
+
+
+async def _stream_query(thread_id: str, message: str, first_turn: bool = False):
+    """Stream agent events within the deadlines, trying again on failures before the first event."""
+    engine = await _get_agent_engine()
+    retries = 0
+    refreshed = False
+    while True:
+        started = False
+        try:
+            async for event in _timed_events(
+                await _guarded_query(engine, thread_id, message, first_turn)
+            ):
+                started = True
+                yield event
+            return
+        except Exception as e:
+            if started:
+                raise
+            if (
+                not refreshed
+                and agent._is_session_gone(e)
+                and await offload(agent._session_cache.pop, thread_id) is not None
+            ):
+                refreshed = True
+                continue
+            if retries >= resilience.STREAM_RETRIES or not resilience.is_transient(e):
+                raise
+            logger.warning("retrying the async stream query after %r", e)
+            resilience.RETRIES.inc(error=type(e).__name__)
+            await asyncio.sleep(resilience.backoff(retries))
+            retries += 1
+
+
+async def _guarded_query(engine, thread_id: str, message: str, first_turn: bool):
+    """The events of one query within the deadlines, hedging the first turn of a thread."""
+    session_id = await _get_or_create_session_id(thread_id)
+    hedge = agent._HedgeSession(thread_id, session_id) if first_turn else None
+    return resilience.guard_async_stream(
+        lambda: _async_stream_query(
+            engine, user_id=thread_id, session_id=session_id, message=message
+        ),
+        open_hedge=hedge and (lambda: _hedge_events(engine, hedge, message)),
+        on_hedge=hedge and hedge.settle,
+    )
+
+
+async def _hedge_events(engine, hedge, message: str):
+    session_id = await asyncio.to_thread(hedge.create)
+    if session_id is None:
+        return
+    async for event in _async_stream_query(
+        engine, user_id=hedge.thread_id, session_id=session_id, message=message
+    ):
+        yield event
+
+
+async def _async_stream_query(engine, **kwargs):
+    """Yield the events of the agent's stream_query, read with the async execution client.
+
+    The SDK's async_stream_query reads the stream with the synchronous client
+    inside the coroutine, which blocks the event loop for the whole answer, and
+    exists only when the deployed agent registered it. stream_query is
+    registered by every AdkApp.
+    """
+    from google.cloud.aiplatform_v1.types import StreamQueryReasoningEngineRequest
+    from vertexai.agent_engines import _utils
+
+    stream = await engine.execution_async_client.stream_query_reasoning_engine(
+        request=StreamQueryReasoningEngineRequest(
+            name=engine.resource_name, input=kwargs, class_method="stream_query"
+        ),
+    )
+    async for chunk in stream:
+        for event in _utils.yield_parsed_json(chunk):
+            if event is not None:
+                yield event
+
+
+async def _timed_events(events):
+    """Yield events, recording the time to the first one and to the end of the stream."""
+    start = time.perf_counter()
+    first = True
+    async for event in events:
+        if first:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_event")
+            first = False
+        yield event
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="stream")
+
+
+async def _get_agent_engine():
+    """Return the agent engine client, creating it on a thread on first use."""
+    engine = agent.agent_engine
+    if engine is None:
+        engine = await asyncio.to_thread(agent.get_agent_engine)
+    # 非同期クライアントは, 使うイベントループ上で作る必要がある.
+    keep_agent_engine_async_client(engine)
+    return engine
+
+
+async def _get_or_create_session_id(thread_id: str):
+    """Get or create a session ID for the given thread ID."""
+    with metrics.span("session"):
+        session_id = await offload(agent._session_cache.get, thread_id)
+        if session_id is not None:
+            return session_id
+
+        # キャッシュに無い時だけ, 同期版の単一実行ガード付きの取得をスレッドで行う.
+        return await asyncio.to_thread(agent._load_session_id, thread_id)
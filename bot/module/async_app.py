@@ -0,0 +1,205 @@
+"""
+This file implements the Slack bot on slack_bolt's AsyncApp.
+
+It mirrors app.py, but answers run as asyncio tasks instead of on a thread
+pool, so one instance can keep hundreds of conversations in flight.
+Selected with BOT_EXECUTION_MODE=async.
+"""
+import logging
+import os
+from slack_bolt.async_app import AsyncApp
+from . import async_agent, lifecycle, metrics
+from .async_transport import PooledAsyncWebClient
+from .chunking import message_payload, split_mrkdwn
+from .common import (
+    HELP_MESSAGE,
+    OVERLOAD_POLICY,
+    REPLY_MODE,
+    SLACK_BOT_USER_ID,
+    SLACK_BUSY_MESSAGE,
+    SLACK_DELETE_REACTION,
+    SLACK_RATE_LIMITED_MESSAGE,
+    THREAD_QUEUE_SIZE,
+    is_first_turn,
+    merge_events,
+    observe_ingress,
+    thread_id_of,
+)
+from .dedup import deduplicator
+from .ratelimit import answer_slots, limit_keys, rate_limiter
+from .shared_state import offload
+from .streaming import AsyncStreamingReply
+from .thread_queue import AsyncThreadQueue
+from .worker import ASYNC_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+app = AsyncApp(
+    token=os.environ.get("SLACK_BOT_TOKEN"),
+    signing_secret=os.environ.get("SLACK_SECRET"),
+)
+
+
+@app.middleware
+async def use_pooled_client(context, next):
+    """リクエストごとに Bolt が作る WebClient を, 接続を使い回すものに差し替える."""
+    context["client"] = PooledAsyncWebClient.from_client(context.client)
+    # 引数を用意する際に古い client で作られた say は, 次に使う時に作り直させる.
+    context.pop("say", None)
+    await next()
+
+
+@app.event("message")
+async def event_message(event, say, body=None):
+    """Slack Apps に対する DM で発言された時に返信する."""
+    # ボットとの DM 以外を除外する.
+    if event.get("channel_type") != "im":
+        return
+
+    await _dispatch_answer(event, say, body)
+
+
+@app.event("app_mention")
+async def event_mention(event, say, body=None):
+    """ボットがメンションされた場合に返信する."""
+    await _dispatch_answer(event, say, body)
+
+
+async def _dispatch_answer(event, say, body=None):
+    """回答の生成をバックグラウンドのタスクとして開始する."""
+    observe_ingress(event)
+    # Slack の再送や同じ投稿に対する複数のイベントには一度だけ回答する.
+    if await offload(deduplicator.is_duplicate, event, body):
+        logger.info("skip duplicated event ts=%s", event["ts"])
+        return
+    # 1人のユーザやチャンネルが Agent Engine を占有しないよう, 回答する頻度を制限する.
+    scope = await offload(rate_limiter.acquire, limit_keys(event, body))
+    if scope is not None:
+        logger.info("rate limited by %s, event ts=%s", scope, event["ts"])
+        await _post_ephemeral(event, say, SLACK_RATE_LIMITED_MESSAGE)
+        return
+
+    # 回答が先に終わっても残らないよう, キューに入れる前に覚えておく.
+    lifecycle.accept(event, say)
+    if answer_queue.put(thread_id_of(event), (event, say)):
+        return
+    lifecycle.finish(event)
+
+    logger.warning("too many answers in flight, dropping event ts=%s", event["ts"])
+    metrics.ERRORS.inc(stage="dispatch", error="Overloaded")
+    # 処理しなかったイベントは Slack の再送で改めて受け付ける.
+    await offload(deduplicator.forget, event, body)
+    if OVERLOAD_POLICY == "busy":
+        await say({"text": SLACK_BUSY_MESSAGE, "thread_ts": event["ts"]})
+
+
+async def _reply_batch(_thread_id, items):
+    """同じスレッドで続けて届いた発言に, まとめて一度だけ回答する."""
+    events = [event for event, _ in items]
+    try:
+        await _reply(merge_events(events), items[-1][1], events)
+    finally:
+        for item, _ in items:
+            lifecycle.finish(item)
+
+
+# スレッドごとに発言を順番に処理し, 続けて届いた発言はまとめる.
+answer_queue = AsyncThreadQueue(_reply_batch, THREAD_QUEUE_SIZE, ASYNC_CONCURRENCY)
+
+
+async def _reply(event, say, events=None):
+    """同時に生成する回答の数に空きがあれば, 回答をスレッドに投稿する.
+
+    events は回答する発言で, 省略すると event だけに回答する.
+    """
+    with answer_slots.slot() as admitted:
+        if admitted:
+            await _answer(event, say, events or [event])
+            return
+    logger.warning("too many answers in progress, refusing event ts=%s", event["ts"])
+    await _post_ephemeral(event, say, SLACK_BUSY_MESSAGE)
+
+
+async def _answer(event, say, events):
+    """エージェントの回答をスレッドに投稿する."""
+    with metrics.IN_FLIGHT.track_inprogress(kind="answer"), \
+         metrics.STAGE_SECONDS.time(stage="answer"):
+        try:
+            if REPLY_MODE == "streaming":
+                await _reply_streaming(event, say, events)
+                return
+            text = await async_agent.create_answer(
+                thread_id_of(event), event["text"], is_first_turn(event)
+            )
+            # 停止の際に中断を知らせた発言には, 遅れて回答しない.
+            if not lifecycle.claim(events):
+                logger.info("drop the answer to interrupted event ts=%s", event["ts"])
+                return
+            with metrics.span("say"):
+                # 長い回答は Slack の上限に収まるよう分け, 順番に投稿する.
+                for chunk in split_mrkdwn(text) or [text]:
+                    await say({**message_payload(chunk), "thread_ts": event["ts"]})
+        except Exception:
+            logger.exception("failed to reply to event ts=%s", event["ts"])
+
+
+async def _reply_streaming(event, say, events):
+    """仮のメッセージを投稿し, 回答の生成に合わせて更新していく."""
+    # 仮のメッセージを投稿した回答は, 停止の際にも中断を知らせず最後まで更新する.
+    if not lifecycle.claim(events):
+        logger.info("drop the answer to interrupted event ts=%s", event["ts"])
+        return
+    reply = AsyncStreamingReply(say.client, event["channel"], event["ts"])
+    await reply.start()
+    async for text in async_agent.stream_answer(
+        thread_id_of(event), event["text"], is_first_turn(event)
+    ):
+        await reply.append(text)
+    await reply.finish()
+
+
+async def _post_ephemeral(event, say, text):
+    """発言したユーザにだけ見えるメッセージを送る."""
+    try:
+        await say.client.chat_postEphemeral(
+            channel=event["channel"],
+            user=event["user"],
+            text=text,
+            thread_ts=event.get("thread_ts"),
+        )
+    except Exception:
+        logger.exception("failed to post an ephemeral message for ts=%s", event["ts"])
+
+
+@app.event("reaction_added")
+async def message_delete(event, client):
+    """削除用のリアクションがついた場合に発言を削除する."""
+    if (
+        event["reaction"] == SLACK_DELETE_REACTION
+        and event["item_user"] == SLACK_BOT_USER_ID
+    ):
+        await client.chat_delete(
+            channel=event["item"]["channel"], ts=event["item"]["ts"]
+        )
+
+
+@app.command("/gemini")
+async def handle_slash_command(ack, client, command):
+    """スラッシュコマンドを実行する."""
+    await ack()
+
+    async def post_ephemeral_message(text):
+        await client.chat_postEphemeral(
+            channel=command["channel_id"], user=command["user_id"], text=text
+        )
+
+    # /gemini [text] の [text] 部分.
+    split = command["text"].split(" ")
+    subcommand, _ = split[0], split[1:]
+
+    # bot の使い方を表示する.
+    if subcommand == "help":
+        await post_ephemeral_message(HELP_MESSAGE)
+        return
+
+    await post_ephemeral_message("Not Implemented")
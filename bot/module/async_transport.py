@@ -0,0 +1,107 @@
+"""
+This file defines the asyncio versions of the pooled transports in transport.py.
+
+AsyncWebClient opens a new aiohttp session, and new connections, for every API
+call unless it is given one. PooledAsyncWebClient shares one session, created
+on first use since a session cannot be created outside a running event loop.
+The Agent Engine async client must likewise be created on the loop using it.
+"""
+import asyncio
+
+import aiohttp
+from slack_sdk.web.async_client import AsyncWebClient
+from .transport import (
+    CONNECTIONS_OPENED,
+    HTTP_KEEPALIVE,
+    HTTP_POOL_SIZE,
+    POOL_IN_USE,
+    POOL_SIZE,
+    REQUESTS,
+    _is_per_call_client,
+    _kept_client,
+)
+
+_session = None
+_session_loop = None
+
+
+class PooledAsyncWebClient(AsyncWebClient):
+    """AsyncWebClient that sends its requests over the shared pooled session."""
+
+    @classmethod
+    def from_client(cls, client: AsyncWebClient) -> "PooledAsyncWebClient":
+        """A PooledAsyncWebClient with the settings of client, e.g. one Bolt made per request."""
+        return cls(
+            token=client.token,
+            base_url=client.base_url,
+            timeout=client.timeout,
+            ssl=client.ssl,
+            proxy=client.proxy,
+            headers=client.headers,
+            team_id=client.default_params.get("team_id"),
+            logger=client.logger,
+            retry_handlers=client.retry_handlers,
+        )
+
+    @property
+    def session(self):
+        if self._session is not None:
+            return self._session
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+        return shared_session()
+
+    @session.setter
+    def session(self, session):
+        # 渡されたセッションがあればそちらを使う.
+        self._session = session
+
+
+def shared_session() -> aiohttp.ClientSession:
+    """The pooled session of the running event loop, created on first use."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        if HTTP_KEEPALIVE > 0:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE)
+        else:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, force_close=True)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            # 共有セッションではクライアントごとの timeout が使われないので, 既定の 30 秒にする.
+            timeout=aiohttp.ClientTimeout(total=30),
+            trace_configs=[_trace_config()],
+        )
+        _session_loop = loop
+        POOL_SIZE.set(HTTP_POOL_SIZE, client="slack")
+    return _session
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    async def on_request_start(session, context, params):
+        REQUESTS.inc(client="slack")
+        POOL_IN_USE.inc(client="slack")
+
+    async def on_request_done(session, context, params):
+        POOL_IN_USE.dec(client="slack")
+
+    async def on_connection_create_end(session, context, params):
+        CONNECTIONS_OPENED.inc(client="slack")
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_done)
+    trace_config.on_request_exception.append(on_request_done)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+def keep_agent_engine_async_client(engine):
+    """Give engine one async execution client instead of one per call.
+
+    Call it on the event loop that will use the client.
+    """
+    if _is_per_call_client(getattr(engine, "execution_async_client", None)):
+        engine.execution_async_client = _kept_client(engine, engine.execution_async_client)
@@ -0,0 +1,215 @@
+"""
+This file defines the circuit breaker around Agent Engine queries.
+
+When the agent engine is failing or slow, every answer would still wait for
+its own failure while the queues fill up. The breaker watches the queries of
+the last BOT_BREAKER_WINDOW seconds and opens when, over at least
+BOT_BREAKER_MIN_CALLS of them, the error rate reaches BOT_BREAKER_ERROR_RATE
+or the BOT_BREAKER_LATENCY_PERCENTILE of the time to the first event exceeds
+BOT_BREAKER_SLOW_SECONDS.
+
+While open, allow() refuses queries and the bot answers at once that Gemini
+is temporarily unavailable. After BOT_BREAKER_OPEN_SECONDS the breaker is half
+open: BOT_BREAKER_TRIAL_CALLS queries are let through, and it closes when they
+all succeed in time, or opens again on the first that does not.
+
+The state is exported as bot_agent_circuit_state (0: closed, 1: half open,
+2: open).
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from . import metrics
+
+BREAKER_ENABLED = os.getenv("BOT_BREAKER", "true").lower() == "true"
+BREAKER_WINDOW = float(os.getenv("BOT_BREAKER_WINDOW", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("BOT_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("BOT_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("BOT_BREAKER_SLOW_SECONDS", "30"))
+BREAKER_LATENCY_PERCENTILE = float(os.getenv("BOT_BREAKER_LATENCY_PERCENTILE", "0.9"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BOT_BREAKER_OPEN_SECONDS", "30"))
+BREAKER_TRIAL_CALLS = int(os.getenv("BOT_BREAKER_TRIAL_CALLS", "1"))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+TRANSITIONS = metrics.Counter(
+    "bot_agent_circuit_transitions_total", "Circuit breaker state changes.", ["state"]
+)
+REJECTED = metrics.Counter(
+    "bot_agent_circuit_rejected_total", "Queries refused while the circuit is open."
+)
+
+
+class CircuitBreaker:
+    """Opens on errors or slow first events, and lets trial queries through to close."""
+
+    def __init__(
+        self,
+        window: float = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        slow_seconds: float = BREAKER_SLOW_SECONDS,
+        percentile: float = BREAKER_LATENCY_PERCENTILE,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        trial_calls: int = BREAKER_TRIAL_CALLS,
+        enabled: bool = BREAKER_ENABLED,
+        clock=time.monotonic,
+    ):
+        self.window = window
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.percentile = percentile
+        self.open_seconds = open_seconds
+        self.trial_calls = max(1, trial_calls)
+        self.enabled = enabled
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._calls = deque()  # (time, ok, seconds to the first event or None)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0  # half open: queries let through
+        self._passed = 0  # half open: trials that succeeded
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._half_open_when_due()
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a query may be sent now. Every allowed query must be recorded or released."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            self._half_open_when_due()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._trials < self.trial_calls:
+                self._trials += 1
+                return True
+        REJECTED.inc()
+        return False
+
+    def record(self, ok: bool, seconds: float | None = None):
+        """Add the outcome of a query and the seconds to its first event."""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                if not ok or self._slow(seconds):
+                    self._open(now)
+                    return
+                self._passed += 1
+                if self._passed >= self.trial_calls:
+                    self._calls.clear()
+                    self._set_state(CLOSED)
+                return
+            self._calls.append((now, ok, seconds))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            if self._state == CLOSED and self._tripped():
+                self._open(now)
+
+    def release(self):
+        """Give back an allowed query that ended without an outcome."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > self._passed:
+                self._trials -= 1
+
+    def clear(self):
+        """Forget the recorded queries and close."""
+        with self._lock:
+            self._calls.clear()
+            self._trials = self._passed = 0
+            self._state = CLOSED
+
+    def guard(self, events):
+        """Yield the events of a query, recording how it went."""
+        start = time.perf_counter()
+        first = None
+        try:
+            for event in events:
+                if first is None:
+                    first = time.perf_counter() - start
+                yield event
+        except GeneratorExit:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, first)
+            raise
+        self.record(True, first)
+
+    async def guard_async(self, events):
+        """The async counterpart of guard()."""
+        start = time.perf_counter()
+        first = None
+        try:
+            async for event in events:
+                if first is None:
+                    first = time.perf_counter() - start
+                yield event
+        except GeneratorExit:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, first)
+            raise
+        self.record(True, first)
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = list(self._calls)
+        latencies = [seconds for _, ok, seconds in calls if ok and seconds is not None]
+        return {
+            "state": self.state,
+            "calls": len(calls),
+            "errors": sum(1 for _, ok, _ in calls if not ok),
+            "latency": _percentile(latencies, self.percentile),
+        }
+
+    def _tripped(self) -> bool:
+        if len(self._calls) < self.min_calls:
+            return False
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        if errors / len(self._calls) >= self.error_rate:
+            return True
+        latencies = [seconds for _, ok, seconds in self._calls if ok and seconds is not None]
+        return self._slow(_percentile(latencies, self.percentile))
+
+    def _slow(self, seconds: float | None) -> bool:
+        return seconds is not None and seconds > self.slow_seconds
+
+    def _open(self, now: float):
+        self._opened_at = now
+        self._set_state(OPEN)
+
+    def _half_open_when_due(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._trials = self._passed = 0
+            self._set_state(HALF_OPEN)
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            self._state = state
+            TRANSITIONS.inc(state=state)
+
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(percentile * len(values)) - 1)]
+
+
+breaker = CircuitBreaker()
+metrics.Gauge(
+    "bot_agent_circuit_state", "Agent Engine circuit: 0 closed, 1 half open, 2 open."
+).set_function(lambda: STATE_VALUES[breaker.state])
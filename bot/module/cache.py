@@ -0,0 +1,102 @@
+"""
+This file defines a small thread-safe in-process cache with TTL and LRU eviction.
+
+It is shared by the event deduplication store and the other per-process caches.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache whose entries also expire after a time-to-live."""
+
+    def __init__(self, maxsize: int, ttl: float, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the cached value, or default when missing or expired."""
+        with self._lock:
+            value = self._get(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        """Store value under key, evicting the least recently used entry."""
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key, value=True, ttl: float | None = None) -> bool:
+        """Store value only if key is absent. Returns True when it was added."""
+        with self._lock:
+            if self._get(key) is not _MISSING:
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._set(key, value, ttl)
+            return True
+
+    def pop(self, key, default=None):
+        """Remove key and return its value."""
+        with self._lock:
+            value = self._get(key)
+            if value is _MISSING:
+                return default
+            del self._data[key]
+            return value
+
+    def expire(self) -> int:
+        """Drop expired entries from the least recently used end. Returns how many."""
+        now = self._timer()
+        dropped = 0
+        with self._lock:
+            while self._data:
+                key, (_, expires_at) = next(iter(self._data.items()))
+                if expires_at > now:
+                    break
+                del self._data[key]
+                dropped += 1
+        return dropped
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+    def _get(self, key):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return _MISSING
+        value, expires_at = item
+        if expires_at <= self._timer():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value, ttl):
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
@@ -0,0 +1,158 @@
+"""
+This file splits long Slack mrkdwn answers into messages that fit Slack's limits.
+
+Slack truncates long message text, and a Block Kit section takes at most 3000
+characters, so BOT_MESSAGE_MAX_CHARS is kept within one section when the
+answers are posted as blocks. MrkdwnChunker cuts converted mrkdwn into ordered chunks of at most
+BOT_MESSAGE_MAX_CHARS characters. It prefers blank lines, never cuts inside a
+code block or a list when another boundary fits, and otherwise closes and
+reopens the code fence around the cut. Lines are looked at once as they are
+fed, so splitting is linear in the length of the answer and works on the
+stable text the incremental converter emits while the answer streams in.
+"""
+import os
+import re
+
+# 回答を Block Kit の section ブロックで投稿するか
+REPLY_BLOCKS = os.getenv("BOT_REPLY_BLOCKS", "false").lower() == "true"
+SECTION_MAX_CHARS = 3000
+# 1つのメッセージに載せられるブロックの数
+MAX_BLOCKS = 50
+# 1つのメッセージに載せる文字数の上限. ブロックで投稿する時は1つの section に収める.
+MESSAGE_MAX_CHARS = int(os.getenv("BOT_MESSAGE_MAX_CHARS", "3000"))
+if REPLY_BLOCKS:
+    MESSAGE_MAX_CHARS = min(MESSAGE_MAX_CHARS, SECTION_MAX_CHARS)
+FENCE = "```"
+
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•◦▪]|\d+[.)])\s")
+
+
+class MrkdwnChunker:
+    """Cut mrkdwn into chunks of at most limit characters, as it is fed."""
+
+    def __init__(self, limit: int = MESSAGE_MAX_CHARS):
+        # 分割したコードブロックを閉じて開き直す分より短くはしない.
+        self.limit = max(limit, 4 * len(FENCE) + 4)
+        self._prefix = ""  # the fence reopening a code block cut in the previous chunk
+        self._lines = []  # lines of the chunk being built
+        self._size = 0  # characters of the chunk being built, with the prefix and newlines
+        self._paragraph = 0  # last cut before a blank line, as an index into _lines
+        self._line = 0  # last cut between lines outside code blocks and lists
+        self._in_code = False
+        self._in_list = False
+        self._tail = ""
+
+    @property
+    def pending(self) -> str:
+        """The text fed but not returned in a chunk yet."""
+        lines = self._head() + self._lines + ([self._tail] if self._tail else [])
+        return "\n".join(lines).strip("\n")
+
+    def feed(self, text: str) -> list[str]:
+        """Add text, as returned by IncrementalMrkdwnConverter.feed. Returns the finished chunks."""
+        *lines, self._tail = (self._tail + text).split("\n")
+        chunks = []
+        for line in lines:
+            self._add(line, chunks)
+        return chunks
+
+    def finish(self) -> list[str]:
+        """Return the remaining chunks."""
+        chunks = []
+        if self._tail:
+            self._add(self._tail, chunks)
+            self._tail = ""
+        # 閉じられないまま終わったコードブロックは, そのまま返す.
+        self._cut(len(self._lines), chunks, close_code=False)
+        return chunks
+
+    def _add(self, line: str, chunks: list[str]):
+        is_fence = line.lstrip().startswith(FENCE)
+        is_list = not self._in_code and (
+            bool(_LIST_ITEM.match(line))
+            or (self._in_list and line[:1].isspace() and bool(line.strip()))
+        )
+        # この行の前で切ってよいか. コードブロックの中とリストの項目の間では切らない.
+        if self._lines and not self._in_code and not (self._in_list and is_list):
+            self._line = len(self._lines)
+            if not self._lines[-1].strip():
+                self._paragraph = self._line
+
+        # コードブロックを閉じる行には, 閉じるための余白はいらない.
+        closes_code = self._in_code and is_fence
+        while self._lines and len(line) > self._room(closes_code):
+            self._cut(self._best_cut(), chunks)
+        # 1行だけで上限を超える行は, 空白か上限の位置で折り返す.
+        while len(line) > self._room(closes_code):
+            room = self._room(closes_code)
+            space = line.rfind(" ", 1, room + 1)
+            end = space if space > 0 else room
+            self._append(line[:end])
+            self._cut(len(self._lines), chunks)
+            line = line[end + 1:] if space > 0 and not self._in_code else line[end:]
+        self._append(line)
+
+        if is_fence:
+            self._in_code = not self._in_code
+        self._in_list = is_list
+
+    def _room(self, closes_code: bool = False) -> int:
+        """The length a line added to the current chunk may have."""
+        closing = len(FENCE) + 1 if self._in_code and not closes_code else 0
+        return self.limit - self._size - self._separator() - closing
+
+    def _best_cut(self) -> int:
+        """Where to end the current chunk: a blank line, unless it leaves the chunk too short."""
+        if self._paragraph and self._paragraph >= self._line // 2:
+            return self._paragraph
+        if self._line:
+            return self._line
+        # 安全な区切りがなければ, コードブロックやリストの途中でも行の間で切る.
+        return len(self._lines)
+
+    def _cut(self, index: int, chunks: list[str], close_code: bool = True):
+        """Return the chunk ending before _lines[index] and keep the rest for the next one."""
+        # 安全な区切りはコードブロックの外なので, コードブロックの中で切れるのは末尾だけ.
+        split_code = close_code and self._in_code and index == len(self._lines)
+        head = self._head() + self._lines[:index] + ([FENCE] if split_code else [])
+        chunk = "\n".join(head).strip("\n")
+        if chunk.strip():
+            chunks.append(chunk)
+
+        self._prefix = FENCE if split_code else ""
+        self._lines = self._lines[index:]
+        self._size = len("\n".join(self._head() + self._lines))
+        self._paragraph = max(0, self._paragraph - index)
+        self._line = max(0, self._line - index)
+
+    def _head(self) -> list[str]:
+        return [self._prefix] if self._prefix else []
+
+    def _separator(self) -> int:
+        return 1 if self._lines or self._prefix else 0
+
+    def _append(self, line: str):
+        self._size += len(line) + self._separator()
+        self._lines.append(line)
+
+
+def split_mrkdwn(text: str, limit: int = MESSAGE_MAX_CHARS) -> list[str]:
+    """Split mrkdwn into ordered chunks of at most limit characters."""
+    chunker = MrkdwnChunker(limit)
+    return chunker.feed(text) + chunker.finish()
+
+
+def message_payload(text: str) -> dict:
+    """The chat.postMessage / chat.update arguments that show text."""
+    if not REPLY_BLOCKS:
+        return {"text": text}
+    # 長い text もコードブロックなどの途中で切らずに section に分け, ブロック数の上限までを載せる.
+    sections = split_mrkdwn(text, SECTION_MAX_CHARS)[:MAX_BLOCKS]
+    return {
+        # 通知やブロックを表示できないクライアントには text が使われる.
+        "text": text,
+        "blocks": [
+            {"type": "section", "text": {"type": "mrkdwn", "text": section}}
+            for section in sections
+        ],
+    }
@@ -0,0 +1,57 @@
+"""
+This file defines the settings and helpers shared by the sync and async Slack apps.
+"""
+import os
+import time
+from . import metrics
+from .agent import _remove_mention_string
+
+SLACK_BOT_USER_ID = "U08QRHY4R42"  # BotのユーザID
+SLACK_DELETE_REACTION = "del_gemini"  # 削除用のリアクションを作成しておく
+# 回答キューが溢れた時の挙動. "busy": 混雑メッセージを返す / "reject": 何もしない
+OVERLOAD_POLICY = os.getenv("BOT_OVERLOAD_POLICY", "busy")
+# "single": 回答が揃ってから投稿する / "streaming": 生成中の回答を随時更新する
+REPLY_MODE = os.getenv("BOT_REPLY_MODE", "single")
+# 起動時に auth.test でトークンを検証するか. しない場合は最初のリクエストで検証される.
+SLACK_VERIFY_TOKEN_ON_START = (
+    os.getenv("BOT_SLACK_VERIFY_TOKEN_ON_START", "false").lower() == "true"
+)
+# 1つのスレッドで回答待ちにできる発言の数
+THREAD_QUEUE_SIZE = int(os.getenv("BOT_THREAD_QUEUE_SIZE", "10"))
+SLACK_BUSY_MESSAGE = "ただいま混み合っています。少し時間をおいてもう一度お試しください。:bow:"
+SLACK_RATE_LIMITED_MESSAGE = (
+    "短い時間に多くの質問をいただいたため、回答を控えました。少し時間をおいてもう一度お試しください。:bow:"
+)
+HELP_MESSAGE = "\n".join(
+    [
+        "1. gemini をメンションすると Google Gemini からのレスポンスが返されます。",
+        "2. スレッド内でやり取りを繰り返すと、それまでの会話を考慮した回答がおこなわれます。",
+        "3. スレッド内でもメンションは必要です。",
+        "4. gemini との DM でも利用可能です。この場合はメンション不要です。",
+        f"5. gemini からの返信に :{SLACK_DELETE_REACTION}: でリアクションすると返信を削除できます。",
+    ]
+)
+
+
+def observe_ingress(event: dict):
+    """Record how long Slack took to deliver the event."""
+    sent_at = float(event.get("event_ts") or event["ts"])
+    metrics.STAGE_SECONDS.observe(max(0.0, time.time() - sent_at), stage="ingress")
+
+
+def thread_id_of(event: dict) -> str:
+    """スレッド内の発言ならスレッドの, そうでなければ発言自身の ts を返す."""
+    return str(event["thread_ts"] if "thread_ts" in event else event["ts"])
+
+
+def is_first_turn(event: dict) -> bool:
+    """スレッドの最初の発言なら True を返す."""
+    return event.get("thread_ts", event["ts"]) == event["ts"]
+
+
+def merge_events(events: list[dict]) -> dict:
+    """同じスレッドで続けて届いた発言を, 最後の発言に返信する1つのイベントにまとめる."""
+    if len(events) == 1:
+        return events[0]
+    text = "\n".join(_remove_mention_string(event["text"]) for event in events)
+    return {**events[-1], "text": text}
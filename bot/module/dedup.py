@@ -0,0 +1,111 @@
+"""
+This file defines the deduplication store for incoming Slack events.
+
+Slack retries events it considers undelivered (X-Slack-Retry-Num) and may send
+several events for one post, e.g. message.im and app_mention. Every event is
+keyed by its event_id and by (channel, ts); an event whose key was already
+claimed is a duplicate and must not trigger another agent call.
+
+The default backend is in-process, and shared by the worker processes of the
+instance when there are several (see shared_state.py). Set BOT_DEDUP_REDIS_URL
+to share the store between Cloud Run instances (requires the redis package).
+"""
+import os
+import threading
+from . import metrics
+from .shared_state import new_cache
+
+DEDUP_TTL = float(os.getenv("BOT_DEDUP_TTL", "600"))
+DEDUP_MAXSIZE = int(os.getenv("BOT_DEDUP_MAXSIZE", "10000"))
+DEDUP_REDIS_URL = os.getenv("BOT_DEDUP_REDIS_URL")
+
+
+class MemoryDedupBackend:
+    """Instance-local backend using a TTL+LRU cache."""
+
+    def __init__(self, maxsize: int = DEDUP_MAXSIZE, ttl: float = DEDUP_TTL):
+        self._cache = new_cache("dedup", maxsize, ttl)
+
+    def claim(self, key: str, ttl: float) -> bool:
+        """Mark key as seen. Returns False when it was already claimed."""
+        return self._cache.add(key, ttl=ttl)
+
+    def release(self, key: str):
+        """Forget key so that the event can be processed again."""
+        self._cache.pop(key)
+
+
+class RedisDedupBackend:
+    """Backend shared between instances through Redis SET NX."""
+
+    def __init__(self, client, prefix: str = "ai-bot:dedup:"):
+        self._client = client
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str):
+        """Create a backend from a redis:// URL."""
+        import redis  # optional dependency, only needed for the shared store
+
+        return cls(redis.Redis.from_url(url))
+
+    def claim(self, key: str, ttl: float) -> bool:
+        """Mark key as seen. Returns False when it was already claimed."""
+        return bool(
+            self._client.set(self._prefix + key, 1, nx=True, ex=max(1, int(ttl)))
+        )
+
+    def release(self, key: str):
+        """Forget key so that the event can be processed again."""
+        self._client.delete(self._prefix + key)
+
+
+class EventDeduplicator:
+    """Detect Slack events that have already been answered."""
+
+    def __init__(self, backend, ttl: float = DEDUP_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, event: dict, body: dict | None = None) -> bool:
+        """Claim the keys of event. Returns True if any was already claimed."""
+        duplicate = False
+        for key in _event_keys(event, body):
+            if not self.backend.claim(key, self.ttl):
+                duplicate = True
+        with self._lock:
+            if duplicate:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return duplicate
+
+    def forget(self, event: dict, body: dict | None = None):
+        """Release the keys of an event that was not processed after all."""
+        for key in _event_keys(event, body):
+            self.backend.release(key)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters. Hits are agent calls saved."""
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def _event_keys(event: dict, body: dict | None) -> list[str]:
+    """Keys identifying the Slack post behind event."""
+    keys = [f"ts:{event.get('channel')}:{event['ts']}"]
+    if body and body.get("event_id"):
+        keys.append(f"event:{body['event_id']}")
+    return keys
+
+
+def _create_backend():
+    if DEDUP_REDIS_URL:
+        return RedisDedupBackend.from_url(DEDUP_REDIS_URL)
+    return MemoryDedupBackend()
+
+
+deduplicator = EventDeduplicator(_create_backend())
+metrics.register_stats("dedup", deduplicator.stats)
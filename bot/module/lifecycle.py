@@ -0,0 +1,149 @@
+"""
+This file defines the draining of the bot when its instance shuts down.
+
+Cloud Run sends SIGTERM when it scales an instance in, and kills it after a
+grace period. Slack has already been answered 200 for the events whose
+answers are still running, so it will not send them again, and without
+draining their users would never get a reply.
+
+On SIGTERM the instance starts draining: /healthz reports it as not ready and
+new Slack events are refused with 503, so Slack retries them on another
+instance. The answers accepted before wait for up to BOT_SHUTDOWN_GRACE
+seconds. Those still unfinished then are checkpointed: the thread queues are
+closed, so no further message is started, and the threads of the messages not
+answered are told that the answer was interrupted, so the user can ask again.
+An answer claims its messages before it posts, and the notice is sent only for
+messages not claimed, so no message gets both. Finally the last metrics and
+the log records still queued are written out.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import signal
+import threading
+import time
+from . import metrics, thread_queue
+from .logs import flush_logs
+from .worker import answer_executor
+
+# 終了の合図から, 回答中のイベントを待つ秒数. Cloud Run の猶予 (既定 10 秒) より短くする.
+SHUTDOWN_GRACE = float(os.getenv("BOT_SHUTDOWN_GRACE", "8"))
+SLACK_INTERRUPTED_MESSAGE = (
+    "再起動のため回答を中断しました。お手数ですがもう一度お試しください。:bow:"
+)
+
+DRAINED = metrics.Counter(
+    "bot_shutdown_answers_total",
+    "Answers in progress at shutdown, by whether they finished or were interrupted.",
+    ["outcome"],
+)
+
+logger = logging.getLogger(__name__)
+
+_draining = threading.Event()
+_lock = threading.Lock()
+_accepted = {}  # event ts -> (event, say) of answers not finished yet
+_claimed = set()  # ts of accepted events whose answer is being posted
+_interrupted = set()  # ts of events told that their answer was interrupted
+
+
+def is_draining() -> bool:
+    return _draining.is_set()
+
+
+def start_draining(reason: str):
+    """Stop accepting new Slack events."""
+    if not _draining.is_set():
+        _draining.set()
+        logger.info("draining on %s, %d answers in progress", reason, len(_accepted))
+
+
+def accept(event: dict, say):
+    """Remember an answer queued for event until finish() is called."""
+    with _lock:
+        _accepted[event["ts"]] = (event, say)
+
+
+def finish(event: dict):
+    with _lock:
+        _accepted.pop(event["ts"], None)
+        _claimed.discard(event["ts"])
+
+
+def claim(events: list[dict]) -> bool:
+    """Take over the reply to events. False when they were told of the interruption already."""
+    with _lock:
+        if any(event["ts"] in _interrupted for event in events):
+            return False
+        _claimed.update(event["ts"] for event in events if event["ts"] in _accepted)
+    return True
+
+
+def in_progress() -> int:
+    """Answers accepted and not finished, and threads still in the answer queues."""
+    with _lock:
+        accepted = len(_accepted)
+    return max(accepted, sum(len(queue) for queue in thread_queue._instances))
+
+
+def watch_signals(signals=(signal.SIGTERM,)):
+    """Start draining on the signals, then let the server handle them as before."""
+    for signum in signals:
+        try:
+            previous = signal.getsignal(signum)
+            signal.signal(signum, _chain(signum, previous))
+        except ValueError:
+            # シグナルはメインスレッドでしか扱えない. その場合は lifespan の終了時に始める.
+            logger.debug("cannot watch signal %s outside the main thread", signum)
+
+
+def _chain(signum, previous):
+    def handler(received, frame):
+        start_draining(signal.Signals(signum).name)
+        if callable(previous):
+            previous(received, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            signal.raise_signal(signum)
+    return handler
+
+
+async def drain(grace: float = None, poll: float = 0.1):
+    """Wait for the accepted answers within grace seconds, then checkpoint the rest."""
+    grace = SHUTDOWN_GRACE if grace is None else grace
+    start_draining("shutdown")
+    started = time.monotonic()
+    waiting = in_progress()
+    while in_progress() and time.monotonic() - started < grace:
+        await asyncio.sleep(poll)
+
+    # 待ち行列に残った回答は始めず, 投稿を始めていない回答はスレッドに中断を知らせる.
+    for queue in list(thread_queue._instances):
+        queue.close()
+    answer_executor.shutdown(wait=False, cancel_futures=True)
+    with _lock:
+        interrupted = [
+            _accepted.pop(ts) for ts in list(_accepted) if ts not in _claimed
+        ]
+        _interrupted.update(event["ts"] for event, _ in interrupted)
+    for event, say in interrupted:
+        await _notify(event, say)
+    finished = max(0, waiting - len(interrupted))
+    DRAINED.inc(finished, outcome="finished")
+    DRAINED.inc(len(interrupted), outcome="interrupted")
+    logger.info(
+        "drained in %.1f seconds, %d answers finished, %d interrupted",
+        time.monotonic() - started, finished, len(interrupted),
+    )
+    logger.info("final metrics\n%s", metrics.render())
+    flush_logs()
+
+
+async def _notify(event: dict, say):
+    try:
+        result = say({"text": SLACK_INTERRUPTED_MESSAGE, "thread_ts": event["ts"]})
+        if inspect.isawaitable(result):
+            await result
+    except Exception:
+        logger.exception("failed to post the interruption of ts=%s", event["ts"])
@@ -0,0 +1,33 @@
+"""
+This file defines a map of per-key locks.
+
+Locks are created on first use and dropped as soon as nobody holds or waits
+for them, so the map stays as small as the set of keys in use.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLock:
+    """Mutual exclusion per key, e.g. per Slack thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}  # key -> [lock, number of holders and waiters]
+
+    def __len__(self):
+        return len(self._locks)
+
+    @contextmanager
+    def __call__(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
@@ -0,0 +1,131 @@
+"""
+This file sets up structured logging for Cloud Logging.
+
+Records are written to stdout as one JSON object per line, which Cloud Logging
+parses into jsonPayload with its severity. Handlers sit behind a queue, so the
+request path never blocks on stdout. Streamed agent events go through
+log_agent_event, which samples them per event type and truncates the payload.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+
+def _parse_rates(value: str) -> dict[str, float]:
+    """Parse "text=0.1,function_call=1" into a dict."""
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+LOG_LEVEL = os.getenv("BOT_LOG_LEVEL", "INFO")
+# イベント種別ごとの記録率. 指定のない種別はすべて記録する.
+EVENT_LOG_SAMPLE_RATES = _parse_rates(os.getenv("BOT_EVENT_LOG_SAMPLE_RATES", "text=0.1"))
+EVENT_LOG_MAX_CHARS = int(os.getenv("BOT_EVENT_LOG_MAX_CHARS", "1000"))
+LOG_QUEUE_SIZE = 10000
+
+event_logger = logging.getLogger("agent.events")
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines understood by Cloud Logging."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        }
+        payload.update(getattr(record, "json_fields", {}))
+        if record.exc_info:
+            payload["stack_trace"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(stream=sys.stdout):
+    """Send log records to stream as JSON through a background thread."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(DroppingQueueHandler(records))
+    root.setLevel(LOG_LEVEL)
+    return _listener
+
+
+def flush_logs():
+    """Write out the records queued so far, e.g. before the instance is stopped."""
+    if _listener is not None:
+        # stop() は残りのレコードを書き出してから止まる. 以降のレコードのために再び始める.
+        _listener.stop()
+        _listener.start()
+
+
+def event_type(event: dict) -> str:
+    """Classify a streamed agent event by its first content part."""
+    parts = (event.get("content") or {}).get("parts") or [{}]
+    for kind in ("text", "function_call", "function_response"):
+        if kind in parts[0]:
+            return kind
+    return "other"
+
+
+def log_agent_event(event: dict, thread_id: str):
+    """Log a streamed agent event, subject to sampling and truncation."""
+    if not event_logger.isEnabledFor(logging.INFO):
+        return
+    kind = event_type(event)
+    rate = EVENT_LOG_SAMPLE_RATES.get(kind, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+
+    event_logger.info(
+        "agent event",
+        extra={
+            "json_fields": {
+                "thread_id": thread_id,
+                "event_type": kind,
+                "author": event.get("author"),
+                # root_agent の RouterAgent が付ける経路.
+                "route": (event.get("custom_metadata") or {}).get("route"),
+                "event": _truncate(json.dumps(event, ensure_ascii=False, default=str)),
+            }
+        },
+    )
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= EVENT_LOG_MAX_CHARS:
+        return text
+    return f"{text[:EVENT_LOG_MAX_CHARS]}...(+{len(text) - EVENT_LOG_MAX_CHARS} chars)"
@@ -0,0 +1,280 @@
+"""
+This file defines in-process metrics rendered in the Prometheus text format.
+
+Counters, gauges and histograms are registered in REGISTRY when created and
+exposed by the /metrics route of main.py. Stats of the caches are collected
+when the metrics are rendered. The API follows prometheus_client, without
+adding it as a dependency.
+
+The metrics are kept per process. With several uvicorn workers, /metrics is
+answered by whichever worker gets the request, so every sample is labeled
+with worker="<pid>" and the scraper sums over the workers.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from .shared_state import WORKERS
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+# stats() のキーと, 出力するメトリクス名と型の対応
+_STATS_METRICS = {
+    "hits": ("bot_cache_hits_total", "counter", "Cache hits."),
+    "misses": ("bot_cache_misses_total", "counter", "Cache misses."),
+    "size": ("bot_cache_size", "gauge", "Number of cached entries."),
+}
+
+
+class Registry:
+    """A set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+        self._stats = {}  # cache name -> stats() function
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def register_stats(self, name: str, stats):
+        """Expose the hits, misses and size returned by stats() under cache=name."""
+        self._stats[name] = stats
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        worker = _worker_labels()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(
+                f"{name}{_format_labels({**labels, **worker})} {_format_value(value)}"
+                for name, labels, value in metric.samples()
+            )
+        lines.extend(self._render_stats(worker))
+        return "\n".join(lines) + "\n"
+
+    def _render_stats(self, worker: dict) -> list[str]:
+        samples = {key: [] for key in _STATS_METRICS}
+        for cache, stats in self._stats.items():
+            for key, value in stats().items():
+                if key in samples:
+                    samples[key].append((cache, value))
+
+        lines = []
+        for key, (name, metric_type, documentation) in _STATS_METRICS.items():
+            if not samples[key]:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(
+                f"{name}{_format_labels({'cache': cache, **worker})} {_format_value(value)}"
+                for cache, value in samples[key]
+            )
+        return lines
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from a function."""
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function):
+        """Read the value from function() when rendered. Only for unlabelled gauges."""
+        self._function = function
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """Count the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        if self._function is not None:
+            return [(self.name, {}, self._function())]
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. durations in seconds."""
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        samples = []
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": bound}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+def _worker_labels() -> dict:
+    # fork されたワーカーでも自分の pid になるよう, 出力の度に調べる.
+    return {"worker": str(os.getpid())} if WORKERS > 1 else {}
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(_format_value(value) if isinstance(value, float) else value)}"'
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# 回答の各段階の所要時間. stage: ingress, http, queue, session, first_event,
+# stream, convert, say, update, answer
+STAGE_SECONDS = Histogram(
+    "bot_stage_seconds", "Time spent in each stage of answering.", ["stage"]
+)
+IN_FLIGHT = Gauge(
+    "bot_in_flight", "Requests and answers currently in progress.", ["kind"]
+)
+ERRORS = Counter(
+    "bot_errors_total", "Failures by stage and error class.", ["stage", "error"]
+)
+# 1回の回答で, モデル呼び出しの全体で送った (prompt) / 返ってきた (candidates) トークン数.
+# 長いスレッドの履歴の圧縮の効果はここに出る.
+AGENT_TOKENS = Histogram(
+    "bot_agent_tokens", "Tokens of the model calls of an answer.", ["kind"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the block as stage, counting the class of any exception it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def register_stats(name: str, stats):
+    """Expose a cache's stats() on /metrics."""
+    REGISTRY.register_stats(name, stats)
+
+
+def render() -> str:
+    """Render REGISTRY for the /metrics route."""
+    return REGISTRY.render()
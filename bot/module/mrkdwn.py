@@ -0,0 +1,119 @@
+"""
+This file implements an incremental Markdown to Slack mrkdwn converter.
+
+SlackMarkdownConverter works line by line, except for tables and the code
+block state it keeps while walking the lines. This converter feeds it one
+complete line at a time and keeps that state between fragments, so each
+streamed chunk costs O(new bytes) and converted lines never change once
+emitted. Incomplete lines, blank lines and tables that may still grow are
+held back until they are settled.
+"""
+import re
+from markdown_to_mrkdwn import SlackMarkdownConverter
+
+_TABLE_LINE = re.compile(r"^\|.+\|\s*$")
+_TABLE_PLACEHOLDER = re.compile(r"^%%TABLE_PLACEHOLDER_-?\d+%%$")
+
+
+class IncrementalMrkdwnConverter:
+    """Convert Markdown fragments into Slack mrkdwn as they arrive."""
+
+    def __init__(self):
+        self._converter = SlackMarkdownConverter()
+        self._lines = []  # converted lines that will not change any more
+        self._blank = []  # blank lines, dropped if nothing follows them
+        self._table = []  # table lines that may still be followed by rows
+        self._tail = ""  # the line that has not seen its newline yet
+        self._started = False
+
+    @property
+    def text(self) -> str:
+        """Everything converted so far, including a preview of the held back lines."""
+        return "\n".join(self._lines + self._preview_lines())
+
+    @property
+    def preview(self) -> str:
+        """The held back lines, converted as if nothing followed them."""
+        return "\n".join(self._preview_lines())
+
+    def feed(self, fragment: str) -> str:
+        """Add a fragment. Returns the converted text that became stable."""
+        if not self._started:
+            # convert() strips the whole text, so leading whitespace is dropped.
+            fragment = fragment.lstrip()
+            if not fragment:
+                return ""
+            self._started = True
+
+        *lines, self._tail = (self._tail + fragment).split("\n")
+        new_lines = []
+        for line in lines:
+            new_lines.extend(self._accept(line))
+        return self._emit(new_lines)
+
+    def finish(self) -> str:
+        """Flush the held back lines. Returns the converted text that became stable."""
+        new_lines = []
+        if self._tail.strip():
+            new_lines.extend(self._accept(self._tail.rstrip()))
+        self._tail = ""
+        self._blank = []
+        new_lines.extend(self._convert(self._table, flush_table=True))
+        self._table = []
+        return self._emit(new_lines)
+
+    def _accept(self, line: str) -> list[str]:
+        """Take a complete line and return the lines it settles, converted."""
+        if not line.strip():
+            self._blank.append(line)
+            return []
+        if _TABLE_LINE.match(line) and not self._converter.in_code_block:
+            self._table.extend(self._blank)
+            self._blank = []
+            self._table.append(line)
+            return []
+
+        # The table pattern may swallow the newline that follows a table,
+        # so a table is converted together with the lines after it.
+        settled = self._convert(
+            self._table + self._blank + [line], flush_table=bool(self._table)
+        )
+        self._table = []
+        self._blank = []
+        return settled
+
+    def _preview_lines(self) -> list[str]:
+        in_code_block = self._converter.in_code_block
+        preview = self._convert(self._pending_lines(), flush_table=True)
+        self._converter.in_code_block = in_code_block
+        return preview
+
+    def _pending_lines(self) -> list[str]:
+        lines = self._table + (self._blank if self._tail.strip() else [])
+        if self._tail.strip():
+            lines.append(self._tail)
+        return lines
+
+    def _convert(self, lines: list[str], flush_table: bool = False) -> list[str]:
+        if not lines:
+            return []
+        if not flush_table:
+            return [self._converter._convert_line(line) for line in lines]
+
+        converter = self._converter
+        converter.table_replacements = {}
+        block = converter._convert_tables("\n".join(lines))
+        converted = []
+        for line in block.split("\n"):
+            if _TABLE_PLACEHOLDER.match(line):
+                converted.extend(converter.table_replacements[line].split("\n"))
+            else:
+                converted.append(converter._convert_line(line))
+        return converted
+
+    def _emit(self, new_lines: list[str]) -> str:
+        if not new_lines:
+            return ""
+        prefix = "\n" if self._lines else ""
+        self._lines.extend(new_lines)
+        return prefix + "\n".join(new_lines)
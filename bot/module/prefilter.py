@@ -0,0 +1,71 @@
+"""
+This file defines the prefilter of Slack events, run before Bolt dispatches them.
+
+The app subscribes to message.channels, message.groups and message.mpim, so
+every message in every channel the bot is in is sent to /slack/events, only to
+be ignored by event_message after Bolt has verified, parsed and dispatched it.
+drop_reason() looks at the raw request first, and main.py answers the events
+the bot never replies to at once:
+
+- not_im: messages outside DMs. Mentions come as app_mention events, which
+  are not filtered.
+- own_message: the bot's own posts.
+- bot_message: posts of other bots and integrations.
+- edited: edits and deletions of messages.
+- subtype: other message subtypes, e.g. joins and topic changes.
+
+Slack only needs a 200 to stop retrying, so the dropped requests are not
+verified; nothing is done for them either way. Dropped events are counted per
+reason in bot_prefiltered_events_total.
+"""
+import json
+import os
+from . import metrics
+from .common import SLACK_BOT_USER_ID
+
+PREFILTER_ENABLED = os.getenv("BOT_PREFILTER", "true").lower() == "true"
+# 回答の対象になるメッセージのサブタイプ. None は通常の投稿.
+ANSWERED_SUBTYPES = {None, "file_share", "thread_broadcast"}
+EDIT_SUBTYPES = {"message_changed", "message_deleted"}
+
+DROPPED = metrics.Counter(
+    "bot_prefiltered_events_total", "Slack events dropped before dispatch.", ["reason"]
+)
+
+
+def drop_reason(body: bytes, content_type: str) -> str | None:
+    """Why the request needs no dispatch, or None for requests Bolt must handle."""
+    # スラッシュコマンドやインタラクションはフォーム形式で届く.
+    if not PREFILTER_ENABLED or not content_type.startswith("application/json"):
+        return None
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or payload.get("type") != "event_callback":
+        return None
+    event = payload.get("event") or {}
+    if event.get("type") != "message":
+        return None
+
+    subtype = event.get("subtype")
+    if event.get("user") in _bot_user_ids(payload):
+        return "own_message"
+    if subtype == "bot_message" or event.get("bot_id"):
+        return "bot_message"
+    if subtype in EDIT_SUBTYPES:
+        return "edited"
+    if subtype not in ANSWERED_SUBTYPES:
+        return "subtype"
+    if event.get("channel_type") != "im":
+        return "not_im"
+    return None
+
+
+def _bot_user_ids(payload: dict) -> set:
+    # 複数のワークスペースにインストールされていても, 各ワークスペースのボットのユーザを見分ける.
+    return {SLACK_BOT_USER_ID} | {
+        authorization.get("user_id")
+        for authorization in payload.get("authorizations") or []
+        if authorization.get("is_bot")
+    }
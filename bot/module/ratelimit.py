@@ -0,0 +1,131 @@
+"""
+This file defines the admission control applied before the agent is called.
+
+Every message takes a token from the bucket of its user, its channel and its
+workspace, so that one person or one noisy channel cannot keep the Agent Engine
+busy and make Cloud Run scale out. A bucket holds up to `count` tokens and
+refills at count/seconds tokens per second. Buckets are dropped once they would
+be full again, so idle users cost no memory, and the number kept is bounded.
+Limits are per instance; its worker processes share the buckets.
+
+ConcurrencyLimit caps the answers generated at once, on top of the worker and
+thread queues.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from . import metrics
+from .shared_state import new_cache, new_lock
+from .worker import ASYNC_CONCURRENCY, EXECUTION_MODE, WORKER_CONCURRENCY
+
+
+def _parse_limits(value: str) -> dict[str, tuple[float, float]]:
+    """Parse "user=10/60,channel=30/60" into {scope: (count, seconds)}."""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            scope, limit = item.split("=", 1)
+            count, seconds = limit.split("/", 1)
+            limits[scope.strip()] = (float(count), float(seconds))
+    return limits
+
+
+# 範囲（user / channel / team）ごとに, 何秒間に何回まで回答するか
+RATE_LIMITS = _parse_limits(
+    os.getenv("BOT_RATE_LIMITS", "user=10/60,channel=30/60,team=120/60")
+)
+RATE_LIMIT_MAXSIZE = int(os.getenv("BOT_RATE_LIMIT_MAXSIZE", "10000"))
+# 同時に生成する回答の上限. 0 なら制限しない. 既定は回答を生成するスレッド数,
+# async ではタスク数の上限.
+MAX_CONCURRENT_ANSWERS = int(os.getenv(
+    "BOT_MAX_CONCURRENT_ANSWERS",
+    str(ASYNC_CONCURRENCY if EXECUTION_MODE == "async" else WORKER_CONCURRENCY),
+))
+
+RATE_LIMITED = metrics.Counter(
+    "bot_rate_limited_total",
+    "Messages refused by admission control, by the limit that was hit.",
+    ["scope"],
+)
+BUCKETS = metrics.Gauge("bot_rate_limit_buckets", "Token buckets kept in memory.")
+
+
+class RateLimiter:
+    """Token buckets keyed by scope and id, e.g. ("user", "U123")."""
+
+    def __init__(self, limits: dict[str, tuple[float, float]], maxsize: int,
+                 timer=time.monotonic):
+        self.limits = limits  # scope -> (count, seconds)
+        self._timer = timer
+        self._buckets = new_cache("ratelimit", maxsize, 0, timer=timer)  # (scope, id) -> (tokens, at)
+        self._lock = new_lock("ratelimit")
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, keys: dict[str, str | None]) -> str | None:
+        """Take a token for every scope in keys.
+
+        Returns the first scope out of tokens, without taking any, or None.
+        """
+        now = self._timer()
+        self._buckets.expire()
+        with self._lock:
+            taken = {}
+            for scope, key in keys.items():
+                if scope not in self.limits or not key:
+                    continue
+                count, seconds = self.limits[scope]
+                tokens, updated_at = self._buckets.get((scope, key), (count, now))
+                tokens = min(count, tokens + (now - updated_at) * count / seconds)
+                if tokens < 1:
+                    RATE_LIMITED.inc(scope=scope)
+                    return scope
+                taken[(scope, key)] = tokens - 1
+
+            for bucket, tokens in taken.items():
+                count, seconds = self.limits[bucket[0]]
+                # 満杯に戻った後は, 新しく作るバケツと変わらないので捨てる.
+                refill = (count - tokens) * seconds / count
+                self._buckets.set(bucket, (tokens, now), ttl=refill)
+        return None
+
+
+class ConcurrencyLimit:
+    """Cap on the answers in progress that refuses instead of waiting."""
+
+    def __init__(self, limit: int):
+        self.limit = limit  # 0 なら制限しない
+        self.active = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        """Yield whether the answer may run, holding a slot while it does."""
+        with self._lock:
+            admitted = not self.limit or self.active < self.limit
+            if admitted:
+                self.active += 1
+        if not admitted:
+            RATE_LIMITED.inc(scope="concurrency")
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._lock:
+                    self.active -= 1
+
+
+def limit_keys(event: dict, body: dict | None = None) -> dict[str, str | None]:
+    """The user, channel and workspace a message is counted against."""
+    return {
+        "user": event.get("user"),
+        "channel": event.get("channel"),
+        "team": (body or {}).get("team_id") or event.get("team"),
+    }
+
+
+rate_limiter = RateLimiter(RATE_LIMITS, RATE_LIMIT_MAXSIZE)
+answer_slots = ConcurrencyLimit(MAX_CONCURRENT_ANSWERS)
+BUCKETS.set_function(lambda: len(rate_limiter))
@@ -0,0 +1,269 @@
+"""
+This file defines the deadlines, retries and hedging around agent streams.
+
+A stream of agent events is read within three deadlines: the time to its
+first event, the gap between two events and the total time. A stream that
+misses one is cancelled and raises StreamTimeout, instead of holding the
+worker until the connection gives up.
+
+guard_stream() reads a synchronous stream on a thread of its own, so the
+worker can stop waiting for it at the deadline; the reading thread stops at
+the next event or when the connection closes. guard_async_stream() cancels
+the pending read of an async stream.
+
+Both can hedge: when the first event is late, a second stream is opened and
+whichever answers first is used, the other being cancelled. The caller decides
+when hedging is safe, since each stream runs the agent once more.
+
+Transient failures are classified by is_transient() and retried by the
+callers after backoff(), which spreads the retries with full jitter.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from . import metrics
+
+FIRST_EVENT_TIMEOUT = float(os.getenv("BOT_FIRST_EVENT_TIMEOUT", "60"))
+EVENT_GAP_TIMEOUT = float(os.getenv("BOT_EVENT_GAP_TIMEOUT", "60"))
+ANSWER_TIMEOUT = float(os.getenv("BOT_ANSWER_TIMEOUT", "300"))
+# 最初のイベントが届く前の一時的な失敗を, やり直す回数.
+STREAM_RETRIES = int(os.getenv("BOT_STREAM_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("BOT_RETRY_BACKOFF", "0.5"))
+RETRY_BACKOFF_MAX = float(os.getenv("BOT_RETRY_BACKOFF_MAX", "5"))
+# 最初のイベントがこの秒数内に届かなければ, もう一つ問い合わせる. 0 なら行わない.
+HEDGE_AFTER = float(os.getenv("BOT_HEDGE_AFTER", "0"))
+
+# Status codes worth another try: rate limits and server side failures.
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+TIMEOUTS = metrics.Counter(
+    "bot_stream_timeouts_total", "Agent streams cancelled at a deadline.", ["stage"]
+)
+RETRIES = metrics.Counter(
+    "bot_stream_retries_total", "Agent streams retried after a failure.", ["error"]
+)
+HEDGES = metrics.Counter(
+    "bot_stream_hedges_total", "Hedged agent streams, by the stream that answered.", ["winner"]
+)
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+_END = object()
+
+
+class StreamTimeout(TimeoutError):
+    """An agent stream missed one of its deadlines."""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"no {stage.replace('_', ' ')} within {seconds:g} seconds")
+        self.stage = stage
+
+
+class Deadlines:
+    """Seconds allowed to the first event, between events and in total."""
+
+    def __init__(self, first_event: float = None, gap: float = None, total: float = None):
+        # 省略時は, その時点の設定を使う.
+        self.first_event = FIRST_EVENT_TIMEOUT if first_event is None else first_event
+        self.gap = EVENT_GAP_TIMEOUT if gap is None else gap
+        self.total = ANSWER_TIMEOUT if total is None else total
+
+    def next_due(self, start: float, last: float | None) -> tuple[str, float, float]:
+        """The stage of the next deadline, its time and its length in seconds."""
+        if last is None:
+            stage, due, seconds = "first_event", start + self.first_event, self.first_event
+        else:
+            stage, due, seconds = "event_gap", last + self.gap, self.gap
+        if start + self.total < due:
+            return "total", start + self.total, self.total
+        return stage, due, seconds
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed request may succeed when tried again."""
+    if isinstance(error, StreamTimeout):
+        # 問い合わせは届いて動いているかもしれないので, やり直さない.
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "code", None)
+    response = getattr(error, "response", None)
+    if not isinstance(status, int):
+        status = getattr(response, "status_code", getattr(response, "status", None))
+    if status in TRANSIENT_STATUS:
+        return True
+    # requests, urllib3 や aiohttp の接続エラーは組み込みの ConnectionError を継承しない.
+    return any(
+        cls.__name__ in ("ConnectionError", "ChunkedEncodingError", "ProtocolError",
+                         "ClientConnectionError", "ServerDisconnectedError")
+        for cls in type(error).__mro__
+    )
+
+
+def backoff(attempt: int) -> float:
+    """Seconds to wait before retry number attempt (from 0), with full jitter."""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+
+class _Reader:
+    """Reads the events of one stream on a thread of its own into a shared queue."""
+
+    def __init__(self, tag: str, open_stream, events: queue.Queue):
+        self._cancelled = threading.Event()
+        threading.Thread(
+            target=self._run, args=(tag, open_stream, events),
+            name=f"agent-stream-{tag}", daemon=True,
+        ).start()
+
+    def _run(self, tag, open_stream, events):
+        stream = None
+        try:
+            stream = open_stream()
+            for event in stream:
+                if self._cancelled.is_set():
+                    return
+                events.put((tag, event, None))
+            events.put((tag, _END, None))
+        except Exception as e:
+            events.put((tag, _END, e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+def guard_stream(open_stream, open_hedge=None, deadlines=None, hedge_after=None, on_hedge=None):
+    """Yield the events of open_stream() within the deadlines.
+
+    With open_hedge and hedge_after > 0, open_hedge() is started when the
+    first event is late, and on_hedge(winner) is told which stream was used.
+    """
+    deadlines = deadlines or Deadlines()
+    hedge_after = HEDGE_AFTER if hedge_after is None else hedge_after
+    events = queue.Queue()
+    readers = {PRIMARY: _Reader(PRIMARY, open_stream, events)}
+    start = time.monotonic()
+    last = winner = None
+    hedged = False
+    try:
+        while True:
+            stage, due, seconds = deadlines.next_due(start, last)
+            hedging = winner is None and open_hedge is not None and hedge_after > 0 and not hedged
+            wake = min(due, start + hedge_after) if hedging else due
+            try:
+                tag, event, error = events.get(timeout=max(0.0, wake - time.monotonic()))
+            except queue.Empty:
+                if hedging and wake < due:
+                    readers[HEDGE] = _Reader(HEDGE, open_hedge, events)
+                    hedged = True
+                    continue
+                TIMEOUTS.inc(stage=stage)
+                raise StreamTimeout(stage, seconds) from None
+
+            if winner is None:
+                if error is not None and len(readers) > 1:
+                    # もう一方がまだ答えるかもしれない.
+                    readers.pop(tag).cancel()
+                    continue
+                winner = tag
+                for other in [other for other in readers if other != winner]:
+                    readers.pop(other).cancel()
+                if hedged:
+                    _settle_hedge(winner, on_hedge)
+            elif tag != winner:
+                continue
+            if event is _END:
+                if error is not None:
+                    raise error
+                return
+            last = time.monotonic()
+            yield event
+    finally:
+        for reader in readers.values():
+            reader.cancel()
+
+
+async def guard_async_stream(open_stream, open_hedge=None, deadlines=None, hedge_after=None, on_hedge=None):
+    """Yield the events of the async stream open_stream() within the deadlines.
+
+    Hedges like guard_stream().
+    """
+    deadlines = deadlines or Deadlines()
+    hedge_after = HEDGE_AFTER if hedge_after is None else hedge_after
+    loop = asyncio.get_running_loop()
+    streams = {PRIMARY: open_stream()}
+    reads = {PRIMARY: asyncio.ensure_future(_next(streams[PRIMARY]))}
+    start = loop.time()
+    last = winner = None
+    hedged = False
+    try:
+        while True:
+            stage, due, seconds = deadlines.next_due(start, last)
+            hedging = winner is None and open_hedge is not None and hedge_after > 0 and not hedged
+            wake = min(due, start + hedge_after) if hedging else due
+            done, _ = await asyncio.wait(
+                reads.values(), timeout=max(0.0, wake - loop.time()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                if hedging and wake < due:
+                    streams[HEDGE] = open_hedge()
+                    reads[HEDGE] = asyncio.ensure_future(_next(streams[HEDGE]))
+                    hedged = True
+                    continue
+                TIMEOUTS.inc(stage=stage)
+                raise StreamTimeout(stage, seconds)
+
+            tag = next(tag for tag, read in reads.items() if read in done)
+            read = reads.pop(tag)
+            error = None if read.cancelled() else read.exception()
+            if winner is None:
+                if error is not None and not isinstance(error, StopAsyncIteration) and reads:
+                    await _close(streams.pop(tag))
+                    continue
+                winner = tag
+                for other in list(reads):
+                    pending = reads.pop(other)
+                    pending.cancel()
+                    await asyncio.gather(pending, return_exceptions=True)
+                    await _close(streams.pop(other))
+                if hedged:
+                    _settle_hedge(winner, on_hedge)
+            if isinstance(error, StopAsyncIteration):
+                return
+            if error is not None:
+                raise error
+            last = loop.time()
+            reads[tag] = asyncio.ensure_future(_next(streams[tag]))
+            yield read.result()
+    finally:
+        for read in reads.values():
+            read.cancel()
+        await asyncio.gather(*reads.values(), return_exceptions=True)
+        for stream in streams.values():
+            await _close(stream)
+
+
+def _settle_hedge(winner, on_hedge):
+    HEDGES.inc(winner=winner)
+    if on_hedge is not None:
+        on_hedge(winner)
+
+
+async def _next(stream):
+    return await stream.__anext__()
+
+
+async def _close(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
@@ -0,0 +1,97 @@
+"""
+This file defines an opt-in cache of answers to the first message of a thread.
+
+The first message of a new thread does not depend on any conversation, so the
+same question asked again can be answered without calling the agent. Keys are
+the message normalized for width, case, spacing and trailing punctuation.
+Answers that used a tool such as google_search go stale quickly and get a
+short TTL; answers the model gave directly are kept longer.
+
+A thread answered from the cache has no agent session yet, so the cached turn
+is remembered and sent along with the next message of that thread.
+"""
+import os
+import re
+import unicodedata
+from . import metrics
+from .shared_state import new_cache
+
+RESPONSE_CACHE_ENABLED = os.getenv("BOT_RESPONSE_CACHE", "false").lower() == "true"
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("BOT_RESPONSE_CACHE_MAXSIZE", "500"))
+# ツールを使わずに答えた回答 / google_search などのツールを使った回答を保持する秒数
+RESPONSE_CACHE_TTL = float(os.getenv("BOT_RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_TOOL_TTL = float(os.getenv("BOT_RESPONSE_CACHE_TOOL_TTL", "600"))
+# この文字列を含む発言はキャッシュを使わずに回答し, キャッシュを更新する
+RESPONSE_CACHE_BYPASS = os.getenv("BOT_RESPONSE_CACHE_BYPASS", "#nocache")
+# キャッシュから回答したスレッドの会話を, 次の発言に添える間の秒数
+CACHED_TURN_TTL = float(os.getenv("BOT_RESPONSE_CACHE_TURN_TTL", "3600"))
+
+_TRAILING_PUNCTUATION = "?!.。、,…"
+_SPACES = re.compile(r"\s+")
+
+
+class ResponseCache:
+    """LRU cache of first-turn answers keyed by the normalized question."""
+
+    def __init__(self, enabled: bool, maxsize: int, ttl: float, tool_ttl: float,
+                 bypass_marker: str):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.tool_ttl = tool_ttl
+        self.bypass_marker = bypass_marker
+        self._answers = new_cache("response", maxsize, ttl)  # normalized question -> text parts
+        self._turns = new_cache("response_turn", maxsize, CACHED_TURN_TTL)  # thread_id -> (question, answer)
+
+    def stats(self) -> dict:
+        return self._answers.stats()
+
+    def lookup(self, thread_id: str, message: str, first_turn: bool):
+        """Prepare message for the agent.
+
+        Returns the message to send, the cached text parts if the answer is
+        cached, and whether the answer should be stored with set().
+        """
+        if not self.enabled:
+            return message, None, False
+        bypass = bool(self.bypass_marker) and self.bypass_marker in message
+        if bypass:
+            message = message.replace(self.bypass_marker, "").strip()
+        if not first_turn:
+            return self._with_cached_turn(thread_id, message), None, False
+
+        cached = None if bypass else self._answers.get(normalize(message))
+        if cached is not None:
+            self._turns.set(thread_id, (message, "\n".join(cached)))
+            return message, cached, False
+        return message, None, True
+
+    def set(self, message: str, parts: list[str], used_tool: bool):
+        """Store the text parts of the answer to message."""
+        ttl = self.tool_ttl if used_tool else self.ttl
+        if parts and ttl > 0:
+            self._answers.set(normalize(message), list(parts), ttl=ttl)
+
+    def _with_cached_turn(self, thread_id: str, message: str) -> str:
+        """Prefix message with the turn answered from the cache, once."""
+        turn = self._turns.pop(thread_id)
+        if turn is None:
+            return message
+        question, answer = turn
+        return f"（これまでの会話）\nユーザー: {question}\nあなた: {answer}\n\n{message}"
+
+
+def normalize(message: str) -> str:
+    """Key of a question: NFKC, lower case, single spaces, no trailing punctuation."""
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = _SPACES.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION + " ")
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAXSIZE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_TOOL_TTL,
+    RESPONSE_CACHE_BYPASS,
+)
+metrics.register_stats("response", response_cache.stats)
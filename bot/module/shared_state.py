@@ -0,0 +1,295 @@
+"""
+This file defines the state shared by the worker processes of one instance.
+
+uvicorn runs WEB_CONCURRENCY worker processes, so that parsing, signature
+verification and mrkdwn conversion use every vCPU of the instance. Each worker
+would otherwise keep its own session cache, dedup store and rate-limit
+buckets: an event retried by Slack onto another worker would be answered
+twice, every limit would be multiplied by the workers, and each worker would
+look up the session of a thread again.
+
+SharedTTLCache has the methods of TTLCache, but keeps the entries in an SQLite
+database under /dev/shm, which is memory. Every process opens its own
+connection, SQLite's locking keeps the workers coherent, and add() claims a
+key in one statement. Entries are evicted by expiry rather than by use, so
+reads stay reads. SharedLock serializes read-modify-write sequences, such as
+taking tokens from the rate-limit buckets, across the workers with flock, and
+SharedKeyedLock does the same per key, such as creating the agent session of
+a thread once whichever worker its messages reach.
+
+The per-thread queues stay per worker. With the thread pool, app.py holds
+the keyed "turn" lock of the thread for each turn, so two messages of one
+thread that reach different workers are answered one after the other, though
+not together. The async app does not wait on that lock, which would hold a
+thread per waiting turn, so there they are answered concurrently in the same
+session. Its calls into the shared state go through offload(), since SQLite
+and flock block the calling thread and must not block the event loop.
+
+BOT_SHARED_STATE selects it: "auto" shares when WEB_CONCURRENCY is above 1,
+"true" always and "false" never. The hit and miss counters stay per process.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from .cache import TTLCache
+from .locks import KeyedLock
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE = os.getenv("BOT_SHARED_STATE", "auto").lower()
+SHARED_STATE_PATH = os.getenv(
+    "BOT_SHARED_STATE_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "ai-bot-state.db"),
+)
+# 書き込みのこの回数ごとに, 期限切れと上限を超えた分を消す.
+TRIM_EVERY = 64
+# SharedKeyedLock がキーを振り分けるファイル上の範囲の数
+LOCK_STRIPES = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (cache, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expiry ON entries (cache, expires_at);
+"""
+
+
+def is_shared() -> bool:
+    """Whether the per-process caches are kept in the shared database."""
+    return SHARED_STATE == "true" or (SHARED_STATE == "auto" and WORKERS > 1)
+
+
+def new_cache(name: str, maxsize: int, ttl: float, timer=None):
+    """A TTLCache, shared between the workers under name when is_shared()."""
+    if is_shared():
+        return SharedTTLCache(name, maxsize, ttl, timer=timer or time.time)
+    return TTLCache(maxsize, ttl, timer=timer or time.monotonic)
+
+
+def new_lock(name: str):
+    """A lock held across the workers under name when is_shared()."""
+    if is_shared():
+        return SharedLock(f"{SHARED_STATE_PATH}.{name}.lock")
+    return threading.Lock()
+
+
+def new_keyed_lock(name: str):
+    """A KeyedLock held across the workers under name when is_shared()."""
+    if is_shared():
+        return SharedKeyedLock(f"{SHARED_STATE_PATH}.{name}.lock")
+    return KeyedLock()
+
+
+async def offload(function, *args):
+    """Await function(*args), run on a thread when it touches the shared state."""
+    if is_shared():
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+
+class _Database:
+    """One SQLite connection per process and path, reopened after a fork."""
+
+    _connections = {}  # (pid, path) -> (connection, lock)
+    _guard = threading.Lock()
+
+    @classmethod
+    def get(cls, path: str):
+        key = (os.getpid(), path)
+        with cls._guard:
+            if key not in cls._connections:
+                connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+                # /dev/shm は再起動で消えるので, ディスクへの同期は要らない.
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=OFF")
+                connection.executescript(SCHEMA)
+                cls._connections[key] = (connection, threading.Lock())
+            return cls._connections[key]
+
+
+class SharedTTLCache:
+    """TTLCache kept in an SQLite database shared by the worker processes."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float, path: str = None, timer=time.time):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path or SHARED_STATE_PATH
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        (count,), = self._execute(
+            "SELECT COUNT(*) FROM entries WHERE cache = ? AND expires_at > ?",
+            (self.name, self._timer()),
+        )
+        return count
+
+    def get(self, key, default=None):
+        """Return the cached value, or default when missing or expired."""
+        rows = self._execute(
+            "SELECT value FROM entries WHERE cache = ? AND key = ? AND expires_at > ?",
+            (self.name, _key(key), self._timer()),
+        )
+        self._count(bool(rows))
+        return pickle.loads(rows[0][0]) if rows else default
+
+    def set(self, key, value, ttl: float | None = None):
+        """Store value under key."""
+        self._execute(
+            "INSERT INTO entries VALUES (?, ?, ?, ?) ON CONFLICT (cache, key)"
+            " DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (self.name, _key(key), pickle.dumps(value), self._expires_at(ttl)),
+        )
+        self._wrote()
+
+    def add(self, key, value=True, ttl: float | None = None) -> bool:
+        """Store value only if key is absent. Returns True when it was added."""
+        now = self._timer()
+        added = self._execute(
+            "INSERT INTO entries VALUES (?, ?, ?, ?) ON CONFLICT (cache, key)"
+            " DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+            " WHERE entries.expires_at <= ? RETURNING 1",
+            (self.name, _key(key), pickle.dumps(value), self._expires_at(ttl), now),
+        )
+        self._count(not added)
+        self._wrote()
+        return bool(added)
+
+    def pop(self, key, default=None):
+        """Remove key and return its value."""
+        rows = self._execute(
+            "DELETE FROM entries WHERE cache = ? AND key = ? RETURNING value, expires_at",
+            (self.name, _key(key)),
+        )
+        if not rows or rows[0][1] <= self._timer():
+            return default
+        return pickle.loads(rows[0][0])
+
+    def expire(self) -> int:
+        """Drop expired entries. Returns how many."""
+        return len(self._execute(
+            "DELETE FROM entries WHERE cache = ? AND expires_at <= ? RETURNING 1",
+            (self.name, self._timer()),
+        ))
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        self._execute("DELETE FROM entries WHERE cache = ?", (self.name,))
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Return this process's hit/miss counters and the shared size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def _expires_at(self, ttl: float | None) -> float:
+        return self._timer() + (self.ttl if ttl is None else ttl)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _wrote(self):
+        with self._lock:
+            self._writes += 1
+            if self._writes % TRIM_EVERY:
+                return
+        self.expire()
+        # 上限を超えた分は, 期限の近いものから消す.
+        self._execute(
+            "DELETE FROM entries WHERE cache = ? AND key IN (SELECT key FROM entries"
+            " WHERE cache = ? ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.maxsize),
+        )
+
+    def _execute(self, sql: str, parameters: tuple) -> list:
+        connection, lock = _Database.get(self.path)
+        with lock:
+            return connection.execute(sql, parameters).fetchall()
+
+
+class _LockFile:
+    """The lock file of path, opened once per process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._files = {}  # pid -> open lock file
+
+    def _file(self):
+        # fork した子は, 親と同じ open file description を共有しないよう開き直す.
+        pid = os.getpid()
+        if pid not in self._files:
+            self._files[pid] = open(self.path, "a")
+        return self._files[pid]
+
+
+class SharedLock(_LockFile):
+    """Lock held across threads and processes, through flock on a file."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            fcntl.flock(self._file(), fcntl.LOCK_EX)
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            fcntl.flock(self._file(), fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+
+class SharedKeyedLock(_LockFile):
+    """KeyedLock held across threads and processes, through record locks on a file.
+
+    Each key locks one byte of LOCK_STRIPES in the file, so unrelated keys
+    rarely wait for each other. Record locks belong to the process, so the
+    threads of a process take the stripe's threading lock first.
+    """
+
+    def __init__(self, path: str, stripes: int = LOCK_STRIPES):
+        super().__init__(path)
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def __call__(self, key):
+        stripe = zlib.crc32(_key(key).encode()) % self.stripes
+        with self._locks[stripe]:
+            file = self._file()
+            fcntl.lockf(file, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(file, fcntl.LOCK_UN, 1, stripe)
+
+
+def _key(key) -> str:
+    # 文字列とタプルのキーを区別して保存する.
+    return json.dumps(key, ensure_ascii=False)
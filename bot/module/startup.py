@@ -0,0 +1,45 @@
+"""
+This file records how long the bot takes to start.
+
+main.py times its imports with timed(), and the lazily created clients time
+their first use the same way. report() logs the timings as one structured
+record, and they are exported as bot_startup_seconds, so cold start
+regressions show up in Cloud Logging and on /metrics.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = metrics.Gauge(
+    "bot_startup_seconds", "Time spent in each startup phase.", ["phase"]
+)
+
+_started_at = time.perf_counter()
+_timings = {}  # phase -> seconds
+
+
+@contextmanager
+def timed(phase: str):
+    """Record the duration of the block as a startup phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def record(phase: str, seconds: float):
+    """Record a startup phase that took seconds."""
+    _timings[phase] = seconds
+    STARTUP_SECONDS.set(seconds, phase=phase)
+
+
+def report() -> dict:
+    """Log the phases recorded so far and the time since this module was imported."""
+    timings = {phase: round(seconds, 4) for phase, seconds in _timings.items()}
+    timings["total"] = round(time.perf_counter() - _started_at, 4)
+    logger.info("startup report", extra={"json_fields": {"startup_seconds": timings}})
+    return timings
@@ -0,0 +1,240 @@
+"""
+This file implements progressive replies that grow while the agent is still generating.
+
+A placeholder message is posted first and then edited with chat.update as
+text parts arrive. Updates are batched by time and size, respect Slack's
+Retry-After on rate limiting, and a final update always writes the full answer,
+or a fallback line when the answer has no text.
+An answer longer than BOT_MESSAGE_MAX_CHARS goes on in new messages: once a
+chunk is settled, the current message is finished with it and the rest of the
+answer continues in the next one, so the messages stay in order.
+"""
+import asyncio
+import logging
+import os
+import time
+from slack_sdk.errors import SlackApiError
+from . import metrics
+from .chunking import MESSAGE_MAX_CHARS, MrkdwnChunker, message_payload
+from .mrkdwn import IncrementalMrkdwnConverter
+
+# 前回の更新からこの秒数が経つか, 未反映の文字数がこの数を超えたら更新する
+STREAM_UPDATE_INTERVAL = float(os.getenv("BOT_STREAM_UPDATE_INTERVAL", "1.0"))
+STREAM_UPDATE_CHARS = int(os.getenv("BOT_STREAM_UPDATE_CHARS", "300"))
+# 文字数による更新でも, 最低限この秒数は空ける
+STREAM_MIN_GAP = 0.3
+# 最後の更新が rate limit された時に, Retry-After を待って試す回数
+FINAL_UPDATE_ATTEMPTS = 3
+PLACEHOLDER_TEXT = "回答を生成しています… :hourglass_flowing_sand:"
+# 回答にテキストが無かった時に, 仮のメッセージの代わりに書く
+EMPTY_ANSWER_TEXT = "回答を生成できませんでした。質問を変えてもう一度お試しください。:bow:"
+
+logger = logging.getLogger(__name__)
+
+
+class FlushScheduler:
+    """Decide when buffered text should be pushed with chat.update."""
+
+    def __init__(
+        self,
+        interval: float = STREAM_UPDATE_INTERVAL,
+        min_chars: int = STREAM_UPDATE_CHARS,
+        min_gap: float = STREAM_MIN_GAP,
+        timer=time.monotonic,
+    ):
+        self.interval = interval
+        self.min_chars = min_chars
+        self.min_gap = min_gap
+        self._timer = timer
+        self._last_flush = timer()
+        self._not_before = 0.0
+
+    def should_flush(self, pending_chars: int) -> bool:
+        """Whether pending_chars unsent characters should be flushed now."""
+        if pending_chars <= 0:
+            return False
+        now = self._timer()
+        if now < self._not_before:
+            return False
+        elapsed = now - self._last_flush
+        return elapsed >= self.interval or (
+            pending_chars >= self.min_chars and elapsed >= self.min_gap
+        )
+
+    def wait_time(self) -> float:
+        """Seconds until the next update is allowed."""
+        return max(0.0, self._not_before - self._timer())
+
+    def flushed(self):
+        """Record a successful update."""
+        self._last_flush = self._timer()
+        self._not_before = self._last_flush + self.min_gap
+
+    def rate_limited(self, retry_after: float):
+        """Hold back updates for retry_after seconds."""
+        self._not_before = self._timer() + retry_after
+
+
+class _BaseStreamingReply:
+    """State of a streaming reply shared by the sync and async versions, which do the I/O."""
+
+    def __init__(self, client, channel: str, thread_ts: str, scheduler=None,
+                 limit: int = MESSAGE_MAX_CHARS):
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.ts = None
+        self._scheduler = scheduler or FlushScheduler()
+        self._converter = IncrementalMrkdwnConverter()
+        self._chunker = MrkdwnChunker(limit)
+        self._has_text = False
+        self._pending_chars = 0
+
+    def _feed(self, text: str) -> list[str]:
+        """Add a text part. Returns the chunks that no longer fit in the current message."""
+        # create_answer と同じく, パーツは改行で繋ぐ.
+        settled = self._converter.feed("\n" + text if self._has_text else text)
+        self._has_text = True
+        self._pending_chars += len(text)
+        return self._chunker.feed(settled)
+
+    def _due(self) -> bool:
+        """Whether the current message should be updated now."""
+        return self._scheduler.should_flush(self._pending_chars) and bool(self._text())
+
+    def _final_chunks(self) -> list[str]:
+        """The rest of the answer, one chunk per message; a fallback line when it is empty."""
+        chunks = self._chunker.feed(self._converter.finish()) + self._chunker.finish()
+        # 空のテキストは chat.update が no_text で断り, 仮のメッセージが残ってしまう.
+        return [chunk for chunk in chunks if chunk.strip()] or [EMPTY_ANSWER_TEXT]
+
+    def _text(self) -> str:
+        """The text of the current message: settled lines not sent yet and a preview."""
+        return "\n".join(part for part in (self._chunker.pending, self._converter.preview) if part)
+
+    def _posted(self, response):
+        self.ts = response["ts"]
+        self._pending_chars = 0
+
+    def _updated(self):
+        self._pending_chars = 0
+        self._scheduler.flushed()
+
+    def _failed(self, error: SlackApiError) -> bool:
+        """Back off on rate limiting. Returns whether the update is worth trying again."""
+        if error.response.status_code == 429 or error.response.get("error") == "ratelimited":
+            headers = error.response.headers
+            retry_after = float(headers.get("Retry-After") or headers.get("retry-after") or 1)
+            logger.warning("chat.update is rate limited for %s seconds", retry_after)
+            self._scheduler.rate_limited(retry_after)
+            return True
+        logger.warning("chat.update failed: %s", error)
+        return False
+
+
+class StreamingReply(_BaseStreamingReply):
+    """A Slack reply that is edited as the answer streams in."""
+
+    def start(self):
+        """Post the placeholder message."""
+        self._post(PLACEHOLDER_TEXT)
+
+    def append(self, text: str):
+        """Add a text part, updating the message when it is due."""
+        for chunk in self._feed(text):
+            # 収まりきらなくなったメッセージを確定し, 続きは新しいメッセージに書く.
+            self._final_update(chunk)
+            self._post(self._text() or PLACEHOLDER_TEXT)
+        if self._due():
+            self._update(self._text())
+
+    def finish(self):
+        """Write the complete answer, waiting out rate limits if needed."""
+        chunks = self._final_chunks()
+        self._final_update(chunks[0])
+        for chunk in chunks[1:]:
+            self._post(chunk)
+
+    def _post(self, text: str):
+        with metrics.span("say"):
+            response = self.client.chat_postMessage(
+                channel=self.channel, thread_ts=self.thread_ts, **message_payload(text)
+            )
+        self._posted(response)
+
+    def _final_update(self, text: str):
+        for _ in range(FINAL_UPDATE_ATTEMPTS):
+            time.sleep(self._scheduler.wait_time())
+            try:
+                self._send_update(text)
+                return
+            except SlackApiError as e:
+                if not self._failed(e):
+                    break
+        logger.error("gave up the final update of ts=%s", self.ts)
+
+    def _update(self, text: str):
+        try:
+            self._send_update(text)
+        except SlackApiError as e:
+            # 途中の更新は, 次の更新で追いつく.
+            self._failed(e)
+
+    def _send_update(self, text: str):
+        with metrics.span("update"):
+            self.client.chat_update(channel=self.channel, ts=self.ts, **message_payload(text))
+        self._updated()
+
+
+class AsyncStreamingReply(_BaseStreamingReply):
+    """asyncio version of StreamingReply for AsyncWebClient."""
+
+    async def start(self):
+        """Post the placeholder message."""
+        await self._post(PLACEHOLDER_TEXT)
+
+    async def append(self, text: str):
+        """Add a text part, updating the message when it is due."""
+        for chunk in self._feed(text):
+            # 収まりきらなくなったメッセージを確定し, 続きは新しいメッセージに書く.
+            await self._final_update(chunk)
+            await self._post(self._text() or PLACEHOLDER_TEXT)
+        if self._due():
+            await self._update(self._text())
+
+    async def finish(self):
+        """Write the complete answer, waiting out rate limits if needed."""
+        chunks = self._final_chunks()
+        await self._final_update(chunks[0])
+        for chunk in chunks[1:]:
+            await self._post(chunk)
+
+    async def _post(self, text: str):
+        with metrics.span("say"):
+            response = await self.client.chat_postMessage(
+                channel=self.channel, thread_ts=self.thread_ts, **message_payload(text)
+            )
+        self._posted(response)
+
+    async def _final_update(self, text: str):
+        for _ in range(FINAL_UPDATE_ATTEMPTS):
+            await asyncio.sleep(self._scheduler.wait_time())
+            try:
+                await self._send_update(text)
+                return
+            except SlackApiError as e:
+                if not self._failed(e):
+                    break
+        logger.error("gave up the final update of ts=%s", self.ts)
+
+    async def _update(self, text: str):
+        try:
+            await self._send_update(text)
+        except SlackApiError as e:
+            # 途中の更新は, 次の更新で追いつく.
+            self._failed(e)
+
+    async def _send_update(self, text: str):
+        with metrics.span("update"):
+            await self.client.chat_update(channel=self.channel, ts=self.ts, **message_payload(text))
+        self._updated()
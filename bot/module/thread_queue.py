@@ -0,0 +1,136 @@
+"""
+This file defines per-thread work queues that answer one Slack thread at a time.
+
+Messages of one thread are handled in arrival order and never concurrently, so
+two quick mentions cannot race on the same agent session. Messages that pile
+up while a turn of their thread is running are handed over together as the
+next batch, so a burst costs one more agent call rather than one per message.
+The first message of a thread starts at once. The queue of a thread is
+dropped as soon as it runs empty. A closed queue accepts nothing and starts
+no further batch; the items left in it are not handled.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_instances = weakref.WeakSet()
+COALESCED_MESSAGES = metrics.Counter(
+    "bot_coalesced_messages_total",
+    "Messages answered in one turn together with earlier messages of the thread.",
+)
+ACTIVE_THREADS = metrics.Gauge(
+    "bot_active_threads", "Threads with an answer running or waiting."
+)
+ACTIVE_THREADS.set_function(lambda: sum(len(queue) for queue in _instances))
+
+
+class ThreadQueue:
+    """Serialize and batch work per key on a bounded executor."""
+
+    def __init__(self, handler, executor, max_pending: int):
+        self._handler = handler  # handler(key, items)
+        self._executor = executor  # BoundedExecutor
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._queues = {}  # key -> items waiting for the running batch
+        self._closed = False
+        _instances.add(self)
+
+    def __len__(self):
+        return len(self._queues)
+
+    def close(self):
+        """Accept no more items and start no further batch."""
+        with self._lock:
+            self._closed = True
+
+    def put(self, key, item) -> bool:
+        """Queue item for key. Returns False when it cannot be accepted."""
+        with self._lock:
+            if self._closed:
+                return False
+            pending = self._queues.get(key)
+            if pending is not None:
+                if len(pending) >= self.max_pending:
+                    return False
+                pending.append(item)
+                return True
+            if self._executor.submit(self._drain, key) is None:
+                return False
+            self._queues[key] = [item]
+        return True
+
+    def _drain(self, key):
+        """Run the batches of key until its queue is empty."""
+        while True:
+            with self._lock:
+                items = self._queues[key]
+                if not items or self._closed:
+                    del self._queues[key]
+                    return
+                self._queues[key] = []
+            COALESCED_MESSAGES.inc(len(items) - 1)
+            try:
+                self._handler(key, items)
+            except Exception:
+                logger.exception("failed to handle %d items of %s", len(items), key)
+
+
+class AsyncThreadQueue:
+    """asyncio version of ThreadQueue, running each key's batches in a task."""
+
+    def __init__(self, handler, max_pending: int, max_active: int):
+        self._handler = handler  # async handler(key, items)
+        self.max_pending = max_pending
+        self.max_active = max_active
+        self._queues = {}  # key -> items waiting for the running batch
+        self._tasks = set()  # 参照を保持しないとタスクが GC される.
+        self._closed = False
+        _instances.add(self)
+
+    def __len__(self):
+        return len(self._queues)
+
+    def close(self):
+        """Accept no more items and start no further batch."""
+        self._closed = True
+
+    def put(self, key, item) -> bool:
+        """Queue item for key. Returns False when it cannot be accepted."""
+        if self._closed:
+            return False
+        pending = self._queues.get(key)
+        if pending is not None:
+            if len(pending) >= self.max_pending:
+                return False
+            pending.append(item)
+            return True
+        if len(self._tasks) >= self.max_active:
+            return False
+        self._queues[key] = [item]
+        task = asyncio.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def join(self):
+        """Wait until every queue has run empty."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _drain(self, key):
+        while True:
+            items = self._queues[key]
+            if not items or self._closed:
+                del self._queues[key]
+                return
+            self._queues[key] = []
+            COALESCED_MESSAGES.inc(len(items) - 1)
+            try:
+                await self._handler(key, items)
+            except Exception:
+                logger.exception("failed to handle %d items of %s", len(items), key)
@@ -0,0 +1,179 @@
+"""
+This file defines the pooled HTTP transports of the Slack and Agent Engine clients.
+
+The default WebClient opens a new connection, and so pays a new TLS handshake,
+for every API call. PooledWebClient keeps up to BOT_HTTP_POOL_SIZE connections
+to Slack and closes those left idle for BOT_HTTP_KEEPALIVE seconds. urllib3
+does not speak HTTP/2, so Slack calls stay on HTTP/1.1 keep-alive.
+
+The Agent Engine SDK builds a new execution client, with a new gRPC channel,
+every time stream_query is called. keep_agent_engine_client() replaces it with
+one client kept for the process. Its gRPC channel multiplexes the streams over
+HTTP/2, and the REST transport gets a connection pool of BOT_HTTP_POOL_SIZE.
+"""
+import os
+import sys
+import time
+from email.message import Message
+from io import BytesIO
+from urllib.error import HTTPError
+
+import urllib3
+from slack_sdk import WebClient
+from . import metrics
+
+# Slack / Agent Engine (REST) に張っておく接続の上限と, 使われない接続を閉じるまでの秒数
+HTTP_POOL_SIZE = int(os.getenv("BOT_HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE = float(os.getenv("BOT_HTTP_KEEPALIVE", "30"))
+
+POOL_SIZE = metrics.Gauge(
+    "bot_http_pool_size", "Connections a client keeps open at most.", ["client"]
+)
+POOL_IN_USE = metrics.Gauge(
+    "bot_http_pool_in_use",
+    "Requests holding or waiting for a connection; above the pool size they wait.",
+    ["client"],
+)
+REQUESTS = metrics.Counter(
+    "bot_http_requests_total", "HTTP requests sent by a client.", ["client"]
+)
+CONNECTIONS_OPENED = metrics.Counter(
+    "bot_http_connections_opened_total",
+    "Connections opened, each paying a TCP and TLS handshake.",
+    ["client"],
+)
+
+
+class _CountingConnectionMixin:
+    def connect(self):
+        super().connect()
+        CONNECTIONS_OPENED.inc(client="slack")
+
+
+class _HTTPConnection(_CountingConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_CountingConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class _KeepAliveMixin:
+    """Close connections that sat in the pool longer than HTTP_KEEPALIVE."""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        released_at = getattr(conn, "released_at", None)
+        if released_at is not None and time.monotonic() - released_at > HTTP_KEEPALIVE:
+            conn.close()
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.released_at = time.monotonic()
+        super()._put_conn(conn)
+
+
+class _HTTPConnectionPool(_KeepAliveMixin, urllib3.HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(_KeepAliveMixin, urllib3.HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+def _new_pool(pool_size: int) -> urllib3.PoolManager:
+    # block=True: 上限を超えた分は新しい接続を張らずに空きを待つ.
+    pool = urllib3.PoolManager(maxsize=pool_size, block=True)
+    pool.pool_classes_by_scheme = {
+        "http": _HTTPConnectionPool,
+        "https": _HTTPSConnectionPool,
+    }
+    POOL_SIZE.set(pool_size, client="slack")
+    return pool
+
+
+# Bolt はリクエストごとに WebClient を作るので, 接続はプロセスで共有する.
+slack_pool = _new_pool(HTTP_POOL_SIZE)
+
+
+class PooledWebClient(WebClient):
+    """WebClient that sends its requests over the shared slack_pool."""
+
+    @classmethod
+    def from_client(cls, client: WebClient) -> "PooledWebClient":
+        """A PooledWebClient with the settings of client, e.g. one Bolt made per request."""
+        return cls(
+            token=client.token,
+            base_url=client.base_url,
+            timeout=client.timeout,
+            ssl=client.ssl,
+            proxy=client.proxy,
+            headers=client.headers,
+            team_id=client.default_params.get("team_id"),
+            logger=client.logger,
+            retry_handlers=client.retry_handlers,
+        )
+
+    def _perform_urllib_http_request_internal(self, url: str, req) -> dict:
+        if self.proxy is not None or self.ssl is not None or not url.lower().startswith("http"):
+            return super()._perform_urllib_http_request_internal(url, req)
+
+        REQUESTS.inc(client="slack")
+        with POOL_IN_USE.track_inprogress(client="slack"):
+            resp = slack_pool.urlopen(
+                req.get_method(),
+                url,
+                body=req.data,
+                headers={name: str(value) for name, value in req.header_items()},
+                timeout=self.timeout,
+                pool_timeout=self.timeout,
+                retries=False,
+            )
+        # 呼び出し元は urllib の応答を前提にしているので, 同じ形で返す.
+        headers = Message()
+        for name, value in resp.headers.items():
+            headers[name] = value
+        if resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason, headers, BytesIO(resp.data))
+        if headers.get_content_type() == "application/gzip":
+            return {"status": resp.status, "headers": headers, "body": resp.data}
+        charset = headers.get_content_charset() or "utf-8"
+        return {"status": resp.status, "headers": headers, "body": resp.data.decode(charset)}
+
+
+def keep_agent_engine_client(engine):
+    """Give engine one execution client for the process instead of one per call."""
+    if not _is_per_call_client(getattr(engine, "execution_api_client", None)):
+        return
+    client = _kept_client(engine, engine.execution_api_client)
+    transport = getattr(client, "transport", None)
+    if getattr(transport, "kind", None) == "rest":
+        from requests.adapters import HTTPAdapter
+
+        adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+        transport._session.mount("https://", adapter)
+        POOL_SIZE.set(HTTP_POOL_SIZE, client="agent")
+    engine.execution_api_client = client
+
+
+def _is_per_call_client(client) -> bool:
+    """True for the SDK wrapper that creates a new client on every attribute access."""
+    # aiplatform が読み込まれていなければ, engine は本物ではない（テストや負荷試験の偽物）.
+    utils = sys.modules.get("google.cloud.aiplatform.utils")
+    return (
+        utils is not None
+        and isinstance(client, utils.ClientWithOverride)
+        and client._is_temporary
+    )
+
+
+def _kept_client(engine, client):
+    """Create the GAPIC client that client would create on each call, once."""
+    from google.cloud.aiplatform import initializer
+
+    return initializer.global_config.create_client(
+        client_class=client.get_gapic_client_class(),
+        credentials=engine.credentials,
+        location_override=engine.location,
+    )
@@ -0,0 +1,74 @@
+"""
+This file defines a bounded background executor for answering Slack events.
+
+Slack expects the HTTP response within 3 seconds, so event handlers acknowledge
+first and hand the slow agent call to this executor. Unlike a plain
+ThreadPoolExecutor, the queue is bounded and work is refused when it is full.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import metrics
+
+# "sync": App がスレッドで回答する / "async": AsyncApp が asyncio のタスクで回答する
+EXECUTION_MODE = os.getenv("BOT_EXECUTION_MODE", "sync")
+WORKER_CONCURRENCY = int(os.getenv("BOT_WORKER_CONCURRENCY", "8"))
+WORKER_QUEUE_SIZE = int(os.getenv("BOT_WORKER_QUEUE_SIZE", "32"))
+# async で同時に生成する回答の上限. スレッドを占有しないので同期版より大きくできる.
+ASYNC_CONCURRENCY = int(os.getenv("BOT_ASYNC_CONCURRENCY", "200"))
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor that rejects work instead of queueing without limit."""
+
+    def __init__(self, max_workers: int, queue_size: int):
+        self.capacity = max_workers + queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="answer"
+        )
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of tasks running or waiting in the queue."""
+        return self._pending
+
+    def submit(self, fn, /, *args, **kwargs) -> Future | None:
+        """Schedule fn, or return None when the executor is saturated."""
+        if not self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(
+                self._run, time.perf_counter(), fn, args, kwargs
+            )
+        except RuntimeError:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """Stop accepting work and optionally wait for, or cancel, queued tasks."""
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def _run(self, submitted_at: float, fn, args, kwargs):
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - submitted_at, stage="queue")
+        return fn(*args, **kwargs)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+
+answer_executor = BoundedExecutor(WORKER_CONCURRENCY, WORKER_QUEUE_SIZE)
+
+ANSWER_QUEUE_PENDING = metrics.Gauge(
+    "bot_answer_queue_pending", "Answers running or waiting in the worker queue."
+)
+ANSWER_QUEUE_PENDING.set_function(lambda: answer_executor.pending)
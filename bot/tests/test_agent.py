@@ -5,14 +5,17 @@ import os
 import re
 import sys
 
-# Mock the agent_engines module before importing
-mock_engine = MagicMock()
-mock_agent_engines = MagicMock()
-mock_agent_engines.get.return_value = mock_engine
+# The agent engine client is created on first use, so importing needs no credentials.
+from module.agent import create_answer, _get_or_create_session_id, _remove_mention_string
 
-with patch.dict(sys.modules, {'vertexai.agent_engines': mock_agent_engines}):
-    with patch.dict(os.environ, {'AGENT_ENGINE_RESOURCE': 'test-resource'}):
-        from module.agent import create_answer, _get_or_create_session_id, _remove_mention_string
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    """Start every test without cached sessions."""
+    from module import agent
+    agent._session_cache.clear()
+    yield
+    agent._session_cache.clear()
 
 
 class TestCreateAnswer:
@@ -55,7 +58,7 @@ class TestCreateAnswer:
             session_id="session-123",
             message="Hello bot"
         )
-        mock_converter.convert.assert_called_once_with("Hello world!")
+        mock_converter.convert.assert_called_once_with("Hello \nworld!")
         assert result == "Converted response"
     
     @patch('module.agent.agent_engine')
@@ -148,6 +151,68 @@ class TestGetOrCreateSessionId:
         assert result == "new-session-789"
 
 
+class TestSessionCache:
+    """Tests for the thread-to-session cache."""
+
+    @patch('module.agent.agent_engine')
+    def test_session_id_is_cached(self, mock_agent_engine):
+        """Test that the remote lookup runs once per thread."""
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+
+        assert _get_or_create_session_id("thread-123") == "session-123"
+        assert _get_or_create_session_id("thread-123") == "session-123"
+
+        mock_agent_engine.list_sessions.assert_called_once_with(user_id="thread-123")
+
+    @patch('module.agent.agent_engine')
+    def test_concurrent_new_thread_creates_one_session(self, mock_agent_engine):
+        """Test that concurrent first messages in a thread create a single session."""
+        import threading
+        import time
+
+        def slow_create_session(user_id):
+            time.sleep(0.05)
+            return {"id": "new-session"}
+
+        mock_agent_engine.list_sessions.return_value = {"sessions": []}
+        mock_agent_engine.create_session.side_effect = slow_create_session
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(_get_or_create_session_id("thread-new")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ["new-session"] * 5
+        mock_agent_engine.create_session.assert_called_once_with(user_id="thread-new")
+
+    @patch('module.agent.agent_engine')
+    @patch('module.agent.SlackMarkdownConverter')
+    def test_gone_session_is_invalidated(self, mock_converter_class, mock_agent_engine):
+        """Test that a cached session reported as gone is looked up again."""
+        mock_converter_class.return_value.convert.side_effect = lambda text: text
+        mock_agent_engine.list_sessions.side_effect = [
+            {"sessions": [{"id": "old-session"}]},
+            {"sessions": []},
+        ]
+        mock_agent_engine.create_session.return_value = {"id": "new-session"}
+        _get_or_create_session_id("thread-123")
+
+        def stream_query(user_id, session_id, message):
+            if session_id == "old-session":
+                raise Exception("Session not found: old-session")
+            yield {"content": {"parts": [{"text": "Hello!"}]}}
+
+        mock_agent_engine.stream_query.side_effect = stream_query
+
+        assert create_answer("thread-123", "Hello bot") == "Hello!"
+        assert _get_or_create_session_id("thread-123") == "new-session"
+
+
 class TestRemoveMentionString:
     """Tests for _remove_mention_string function."""
     
@@ -185,4 +250,177 @@ class TestRemoveMentionString:
         """Test text that becomes empty after mention removal."""
         text = "<@U08QRHY4R42>"
         result = _remove_mention_string(text)
-        assert result == ""
\ No newline at end of file
+        assert result == ""
+
+class TestStageMetrics:
+    """Tests for the stage timings recorded while answering."""
+
+    @patch('module.agent.agent_engine')
+    def test_stages_recorded(self, mock_agent_engine):
+        """Test that session, first event, stream and conversion are timed."""
+        from module import metrics
+        stages = ["session", "first_event", "stream", "convert"]
+        before = {stage: metrics.STAGE_SECONDS.count(stage=stage) for stage in stages}
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.return_value = iter(
+            [{"content": {"parts": [{"text": "Hello"}]}}]
+        )
+
+        create_answer("thread-123", "Hello bot")
+
+        for stage in stages:
+            assert metrics.STAGE_SECONDS.count(stage=stage) == before[stage] + 1
+
+    @patch('module.agent.agent_engine')
+    def test_stream_error_counted(self, mock_agent_engine):
+        """Test that agent failures are counted by error class."""
+        from module import metrics
+        before = metrics.ERRORS.get(stage="stream", error="RuntimeError")
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.side_effect = RuntimeError("boom")
+
+        create_answer("thread-123", "Hello bot")
+
+        assert metrics.ERRORS.get(stage="stream", error="RuntimeError") == before + 1
+
+    @patch('module.agent.agent_engine')
+    def test_tokens_recorded(self, mock_agent_engine):
+        """Test that the tokens of the model calls of an answer are summed."""
+        from module import metrics
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.return_value = iter([
+            {"content": {"parts": [{"function_call": {"name": "map"}}]},
+             "usage_metadata": {"prompt_token_count": 1200, "candidates_token_count": 10}},
+            {"content": {"parts": [{"function_response": {"name": "map"}}]}},
+            {"content": {"parts": [{"text": "Hello"}]},
+             "usage_metadata": {"prompt_token_count": 1500, "candidates_token_count": 40}},
+        ])
+
+        with patch.object(metrics.AGENT_TOKENS, "observe") as observe:
+            create_answer("thread-123", "Hello bot")
+
+        observe.assert_any_call(2700, kind="prompt")
+        observe.assert_any_call(50, kind="candidates")
+
+
+class TestRetriesAndHedging:
+    """Tests for retries and hedging around stream_query."""
+
+    @patch('module.resilience.backoff', return_value=0)
+    @patch('module.agent.agent_engine')
+    def test_transient_failure_retried(self, mock_agent_engine, _backoff):
+        """Test that a connection failure before the first event is tried again."""
+        from module import resilience
+        before = resilience.RETRIES.get(error="ConnectionError")
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.side_effect = [
+            ConnectionError("reset"), iter([{"content": {"parts": [{"text": "Hello"}]}}]),
+        ]
+
+        assert create_answer("thread-123", "Hello bot") == "Hello"
+        assert mock_agent_engine.stream_query.call_count == 2
+        assert resilience.RETRIES.get(error="ConnectionError") == before + 1
+
+    @patch('module.resilience.STREAM_RETRIES', 1)
+    @patch('module.resilience.backoff', return_value=0)
+    @patch('module.agent.agent_engine')
+    def test_retries_bounded(self, mock_agent_engine, _backoff):
+        """Test that the error is answered once the retries are used up."""
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.side_effect = ConnectionError("reset")
+
+        result = create_answer("thread-123", "Hello bot")
+
+        assert "reset" in result
+        assert mock_agent_engine.stream_query.call_count == 2
+
+    @patch('module.agent.agent_engine')
+    def test_other_failure_not_retried(self, mock_agent_engine):
+        """Test that errors that would fail again are not retried."""
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.side_effect = ValueError("bad request")
+
+        create_answer("thread-123", "Hello bot")
+
+        assert mock_agent_engine.stream_query.call_count == 1
+
+    @patch('module.resilience.HEDGE_AFTER', 0.1)
+    @patch('module.agent.agent_engine')
+    def test_first_turn_hedged(self, mock_agent_engine):
+        """Test that a late first turn is asked again in a new session that the thread keeps."""
+        import threading
+        import time
+        from module import agent
+        deleted = threading.Event()
+        mock_agent_engine.list_sessions.return_value = {"sessions": []}
+        mock_agent_engine.create_session.side_effect = [{"id": "primary"}, {"id": "hedge"}]
+        mock_agent_engine.delete_session.side_effect = lambda **kwargs: deleted.set()
+
+        def stream_query(user_id, session_id, message):
+            if session_id == "primary":
+                time.sleep(1)
+            yield {"content": {"parts": [{"text": f"from {session_id}"}]}}
+        mock_agent_engine.stream_query.side_effect = stream_query
+
+        assert create_answer("thread-123", "Hello bot", first_turn=True) == "from hedge"
+        assert agent._session_cache.get("thread-123") == "hedge"
+        assert deleted.wait(1)
+        mock_agent_engine.delete_session.assert_called_once_with(user_id="thread-123", session_id="primary")
+
+    @patch('module.resilience.HEDGE_AFTER', 0.1)
+    @patch('module.agent.agent_engine')
+    def test_later_turns_not_hedged(self, mock_agent_engine):
+        """Test that turns with history are never sent twice."""
+        import time
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+
+        def stream_query(user_id, session_id, message):
+            time.sleep(0.3)
+            yield {"content": {"parts": [{"text": "Hello"}]}}
+        mock_agent_engine.stream_query.side_effect = stream_query
+
+        assert create_answer("thread-123", "Hello bot") == "Hello"
+        assert mock_agent_engine.stream_query.call_count == 1
+        mock_agent_engine.create_session.assert_not_called()
+
+
+class TestGetAgentEngine:
+    """Tests for the lazily created agent engine client."""
+
+    def test_created_once(self):
+        """Test that concurrent first uses create a single client."""
+        import threading
+        import time
+        from module import agent
+
+        def slow_get(resource):
+            time.sleep(0.05)
+            return MagicMock(name=resource)
+
+        fake_vertexai = MagicMock()
+        fake_vertexai.agent_engines.get.side_effect = slow_get
+        results = []
+        with patch('module.agent.agent_engine', None), \
+             patch.dict(sys.modules, {'vertexai': fake_vertexai}):
+            threads = [
+                threading.Thread(target=lambda: results.append(agent.get_agent_engine()))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        fake_vertexai.agent_engines.get.assert_called_once_with("test-resource")
+        assert len({id(engine) for engine in results}) == 1
+
+    def test_warm_up_failure_is_logged(self, caplog):
+        """Test that a failed warm up leaves the client to be created on use."""
+        from module import agent
+
+        with patch('module.agent.agent_engine', None), \
+             patch('module.agent.get_agent_engine', side_effect=RuntimeError("no credentials")):
+            agent._warm_up()
+            assert agent.agent_engine is None
+
+        assert "failed to warm up" in caplog.text
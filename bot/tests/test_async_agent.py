@@ -0,0 +1,206 @@
+"""Tests for module/async_agent.py."""
+import asyncio
+import json
+import pytest
+from unittest.mock import patch, MagicMock
+
+from module import agent
+from module.async_agent import create_answer
+
+RESOURCE = "projects/p/locations/us-central1/reasoningEngines/1"
+# The operations an AdkApp deployed with an SDK older than 1.93 registers: no async_stream_query.
+ADK_OPERATIONS = [
+    {"api_mode": "", "name": "list_sessions"},
+    {"api_mode": "", "name": "create_session"},
+    {"api_mode": "", "name": "delete_session"},
+    {"api_mode": "stream", "name": "stream_query"},
+]
+
+
+class FakeExecutionAsyncClient:
+    """The async GAPIC execution client, streaming HttpBody chunks from stream_query(input)."""
+
+    def __init__(self, stream_query):
+        self.stream_query = stream_query
+        self.requests = []
+
+    async def stream_query_reasoning_engine(self, request):
+        from google.api import httpbody_pb2
+        self.requests.append(request)
+        events = self.stream_query(dict(request.input))
+
+        async def chunks():
+            async for event in events:
+                yield httpbody_pb2.HttpBody(
+                    content_type="application/json", data=json.dumps(event).encode()
+                )
+        return chunks()
+
+
+def real_engine(stream_query, sessions=({"id": "session-123"},)):
+    """A vertexai AgentEngine with the methods the SDK registers for ADK_OPERATIONS.
+
+    Only the GAPIC clients under it are fakes.
+    """
+    from google.cloud.aiplatform_v1 import types
+    from vertexai import agent_engines
+    from vertexai.agent_engines import _agent_engines
+
+    spec = types.ReasoningEngineSpec()
+    spec.class_methods.extend(ADK_OPERATIONS)
+    engine = agent_engines.AgentEngine.__new__(agent_engines.AgentEngine)
+    engine._gca_resource = types.ReasoningEngine(name=RESOURCE, spec=spec)
+    _agent_engines._register_api_methods_or_raise(engine)
+    engine.execution_api_client = MagicMock()
+    engine.execution_api_client.query_reasoning_engine.return_value = (
+        types.QueryReasoningEngineResponse(output={"sessions": list(sessions)})
+    )
+    engine.execution_async_client = FakeExecutionAsyncClient(stream_query)
+    return engine
+
+
+def async_events(events):
+    """Return a stream_query yielding events."""
+    async def stream_query(_input):
+        for event in events:
+            yield event
+    return stream_query
+
+
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    """Start every test without cached sessions."""
+    agent._session_cache.clear()
+    yield
+    agent._session_cache.clear()
+
+
+class TestAsyncCreateAnswer:
+    """Tests for the async create_answer."""
+
+    @pytest.mark.asyncio
+    async def test_create_answer_success(self):
+        """Test that streamed text parts are joined and converted."""
+        engine = real_engine(async_events([
+            {"content": {"parts": [{"text": "Hello"}]}},
+            {"content": {"parts": [{"function_call": {}}]}},
+            {"content": {"parts": [{"text": "**world**"}]}},
+        ]))
+
+        with patch('module.agent.agent_engine', engine):
+            result = await create_answer("thread-123", "<@U08QRHY4R42> Hello bot")
+
+        request, = engine.execution_async_client.requests
+        assert request.name == RESOURCE
+        assert request.class_method == "stream_query"
+        assert dict(request.input) == {
+            "user_id": "thread-123", "session_id": "session-123", "message": "Hello bot"
+        }
+        assert result == "Hello\n*world*"
+
+    @pytest.mark.asyncio
+    async def test_agent_without_async_stream_query(self):
+        """Test that an agent deployed without async_stream_query is answered."""
+        engine = real_engine(async_events([{"content": {"parts": [{"text": "Hi"}]}}]))
+        assert not hasattr(engine, "async_stream_query")
+
+        with patch('module.agent.agent_engine', engine):
+            assert await create_answer("thread-123", "Hello bot") == "Hi"
+
+    @pytest.mark.asyncio
+    async def test_stream_does_not_block_the_loop(self):
+        """Test that other tasks run while the agent is thinking."""
+        async def stream_query(_input):
+            await asyncio.sleep(0.2)
+            yield {"content": {"parts": [{"text": "Hi"}]}}
+        engine = real_engine(stream_query)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        with patch('module.agent.agent_engine', engine):
+            assert await create_answer("thread-123", "Hello bot") == "Hi"
+        ticker.cancel()
+        assert ticks >= 5
+
+    @pytest.mark.asyncio
+    async def test_cached_session_skips_lookup(self):
+        """Test that a cached session is used without a remote lookup."""
+        agent._session_cache.set("thread-123", "cached-session")
+        engine = real_engine(async_events([{"content": {"parts": [{"text": "Hi"}]}}]))
+
+        with patch('module.agent.agent_engine', engine):
+            assert await create_answer("thread-123", "Hello bot") == "Hi"
+        engine.execution_api_client.query_reasoning_engine.assert_not_called()
+        assert engine.execution_async_client.requests[0].input["session_id"] == "cached-session"
+
+    @pytest.mark.asyncio
+    async def test_tokens_recorded(self):
+        """Test that the tokens of the model calls of an answer are summed."""
+        from module import metrics
+        engine = real_engine(async_events([
+            {"content": {"parts": [{"function_call": {"name": "map"}}]},
+             "usage_metadata": {"prompt_token_count": 1200, "candidates_token_count": 10}},
+            {"content": {"parts": [{"function_response": {"name": "map"}}]}},
+            {"content": {"parts": [{"text": "Hello"}]},
+             "usage_metadata": {"prompt_token_count": 1500, "candidates_token_count": 40}},
+        ]))
+
+        with patch('module.agent.agent_engine', engine), \
+             patch.object(metrics.AGENT_TOKENS, "observe") as observe:
+            await create_answer("thread-123", "Hello bot")
+
+        observe.assert_any_call(2700, kind="prompt")
+        observe.assert_any_call(50, kind="candidates")
+
+    @pytest.mark.asyncio
+    async def test_create_answer_exception_handling(self):
+        """Test that failures become the error reply."""
+        engine = real_engine(async_events([]))
+        engine.execution_api_client.query_reasoning_engine.side_effect = Exception("API Error")
+
+        with patch('module.agent.agent_engine', engine):
+            result = await create_answer("thread-123", "Hello bot")
+
+        assert "メッセージを処理できませんでした" in result
+        assert "API Error" in result
+
+
+class TestAsyncRetries:
+    """Tests for retries around the async stream query."""
+
+    @pytest.mark.asyncio
+    @patch('module.resilience.backoff', return_value=0)
+    async def test_transient_failure_retried(self, _backoff):
+        """Test that a connection failure before the first event is tried again."""
+        calls = []
+
+        async def stream_query(input):
+            calls.append(input)
+            if len(calls) == 1:
+                raise ConnectionError("reset")
+            yield {"content": {"parts": [{"text": "Hello"}]}}
+
+        with patch('module.agent.agent_engine', real_engine(stream_query)):
+            assert await create_answer("thread-123", "Hello bot") == "Hello"
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    @patch('module.resilience.FIRST_EVENT_TIMEOUT', 0.1)
+    async def test_first_event_deadline(self):
+        """Test that a stalled stream is given up and answered with the error."""
+        async def stream_query(_input):
+            await asyncio.sleep(5)
+            yield {"content": {"parts": [{"text": "late"}]}}
+        engine = real_engine(stream_query)
+
+        with patch('module.agent.agent_engine', engine):
+            result = await create_answer("thread-123", "Hello bot")
+
+        assert "no first event within 0.1 seconds" in result
+        assert len(engine.execution_async_client.requests) == 1
@@ -0,0 +1,166 @@
+"""Tests for module/breaker.py."""
+import pytest
+from unittest.mock import patch
+
+from module import breaker as breaker_module
+from module.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def build(clock, **kwargs):
+    settings = dict(
+        window=60, min_calls=4, error_rate=0.5, slow_seconds=10, percentile=0.9,
+        open_seconds=30, trial_calls=1, enabled=True, clock=clock,
+    )
+    return CircuitBreaker(**{**settings, **kwargs})
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker."""
+
+    def test_opens_on_error_rate(self, clock):
+        """Test that half of the queries failing opens the circuit."""
+        breaker = build(clock)
+        for ok in (True, False, True):
+            breaker.record(ok, 1)
+        assert breaker.state == CLOSED
+
+        breaker.record(False)
+
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+    def test_needs_min_calls(self, clock):
+        """Test that a few failures alone do not open the circuit."""
+        breaker = build(clock)
+        for _ in range(3):
+            breaker.record(False)
+
+        assert breaker.state == CLOSED
+
+    def test_opens_on_slow_percentile(self, clock):
+        """Test that a slow 90th percentile of the first event opens the circuit."""
+        breaker = build(clock, min_calls=10)
+        for _ in range(8):
+            breaker.record(True, 1)
+        breaker.record(True, 20)
+        assert breaker.state == CLOSED
+
+        breaker.record(True, 20)
+
+        assert breaker.state == OPEN
+
+    def test_old_calls_forgotten(self, clock):
+        """Test that only the queries within the window count."""
+        breaker = build(clock)
+        for _ in range(3):
+            breaker.record(False)
+        clock.now = 61
+
+        breaker.record(False)
+
+        assert breaker.state == CLOSED
+
+    def test_half_open_trial_closes(self, clock):
+        """Test that a successful trial after the open period closes the circuit."""
+        breaker = build(clock)
+        for _ in range(4):
+            breaker.record(False)
+        clock.now = 30
+
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record(True, 1)
+
+        assert breaker.state == CLOSED
+        assert breaker.stats()["calls"] == 0
+
+    @pytest.mark.parametrize("ok, seconds", [(False, None), (True, 20)])
+    def test_half_open_trial_reopens(self, ok, seconds, clock):
+        """Test that a failed or slow trial opens the circuit for another period."""
+        breaker = build(clock)
+        for _ in range(4):
+            breaker.record(False)
+        clock.now = 30
+        assert breaker.allow()
+
+        breaker.record(ok, seconds)
+
+        assert breaker.state == OPEN
+        clock.now = 59
+        assert breaker.state == OPEN
+        clock.now = 60
+        assert breaker.state == HALF_OPEN
+
+    def test_abandoned_trial_released(self, clock):
+        """Test that a trial that ends without an outcome lets another one through."""
+        breaker = build(clock)
+        for _ in range(4):
+            breaker.record(False)
+        clock.now = 30
+        events = breaker.guard(iter(["a", "b"]))
+        next(events)
+
+        events.close()
+
+        assert breaker.allow()
+
+    def test_guard_records(self, clock):
+        """Test that guard records failures and successes of the stream."""
+        breaker = build(clock, min_calls=1)
+
+        assert list(breaker.guard(iter(["a"]))) == ["a"]
+        assert breaker.state == CLOSED
+
+        def failing():
+            yield "a"
+            raise ConnectionError()
+        with pytest.raises(ConnectionError):
+            list(breaker.guard(failing()))
+
+        assert breaker.stats()["errors"] == 1
+        assert breaker.state == OPEN
+
+    def test_disabled(self, clock):
+        """Test that a disabled breaker lets everything through."""
+        breaker = build(clock, enabled=False)
+        for _ in range(10):
+            breaker.record(False)
+
+        assert breaker.allow()
+        assert breaker.state == CLOSED
+
+
+class TestStreamAnswer:
+    """Tests for answers while the circuit is open."""
+
+    @patch('module.agent.agent_engine')
+    def test_open_circuit_fails_fast(self, mock_agent_engine):
+        """Test that the agent engine is not called while the circuit is open."""
+        from module.agent import UNAVAILABLE_LINES, create_answer
+        with patch.object(breaker_module.breaker, "allow", return_value=False):
+            result = create_answer("thread-123", "Hello bot")
+
+        assert result == "\n".join(UNAVAILABLE_LINES)
+        mock_agent_engine.stream_query.assert_not_called()
+        mock_agent_engine.list_sessions.assert_not_called()
+
+    @patch('module.agent.agent_engine')
+    def test_failures_open_circuit(self, mock_agent_engine):
+        """Test that failing answers open the circuit of the bot."""
+        from module.agent import create_answer
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "session-123"}]}
+        mock_agent_engine.stream_query.side_effect = ValueError("broken")
+
+        with patch.object(breaker_module.breaker, "min_calls", 3):
+            for _ in range(3):
+                create_answer("thread-123", "Hello bot")
+            create_answer("thread-123", "Hello bot")
+
+        assert breaker_module.breaker.state == OPEN
+        assert mock_agent_engine.stream_query.call_count == 3
+
+    def test_state_metric(self):
+        """Test that the state is exported."""
+        from module import metrics
+        assert "bot_agent_circuit_state 0" in metrics.render()
@@ -0,0 +1,53 @@
+"""Tests for module/cache.py TTL cache."""
+from module.cache import TTLCache
+
+
+class TestTTLCache:
+    """Tests for TTLCache."""
+
+    def test_get_and_set(self):
+        """Test storing and reading a value."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_entries_expire(self, clock):
+        """Test that entries disappear after their TTL."""
+        cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=100)
+        clock.now = 11
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+
+    def test_expire_drops_old_entries(self, clock):
+        """Test that expire() removes expired entries without reading them."""
+        cache = TTLCache(maxsize=5, ttl=10, timer=clock)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        clock.now = 5
+        cache.set("c", 3)
+        clock.now = 11
+        assert cache.expire() == 2
+        assert len(cache) == 1
+
+    def test_least_recently_used_is_evicted(self):
+        """Test LRU eviction when maxsize is exceeded."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_add_only_when_absent(self):
+        """Test that add() refuses existing keys."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        assert cache.add("a") is True
+        assert cache.add("a") is False
+        assert cache.pop("a") is True
+        assert cache.add("a") is True
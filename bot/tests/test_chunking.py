@@ -0,0 +1,109 @@
+"""Tests for module/chunking.py message splitting."""
+from unittest.mock import patch
+
+from module.chunking import MrkdwnChunker, message_payload, split_mrkdwn
+
+
+class TestSplitMrkdwn:
+    """Tests for split_mrkdwn."""
+
+    def test_short_text_is_one_chunk(self):
+        """Test that a text within the limit is left as it is."""
+        assert split_mrkdwn("*title*\n\nbody", 100) == ["*title*\n\nbody"]
+        assert split_mrkdwn("", 100) == []
+
+    def test_prefers_blank_lines(self):
+        """Test that paragraphs are kept together."""
+        text = "aaaa\nbbbb\n\ncccc\ndddd"
+
+        assert split_mrkdwn(text, 15) == ["aaaa\nbbbb", "cccc\ndddd"]
+
+    def test_list_is_not_split(self):
+        """Test that a list that fits in a chunk stays in one."""
+        text = "intro\n• one\n• two\n  more\n• three\nafter"
+
+        assert split_mrkdwn(text, 30) == ["intro", "• one\n• two\n  more\n• three", "after"]
+
+    def test_code_block_is_not_split(self):
+        """Test that a cut before a code block is chosen over one inside it."""
+        text = "intro\n```\nline 1\nline 2\n```\nafter"
+
+        assert split_mrkdwn(text, 22) == ["intro", "```\nline 1\nline 2\n```", "after"]
+
+    def test_long_code_block_is_closed_and_reopened(self):
+        """Test that every chunk of a code block longer than the limit is a code block."""
+        text = "```\n" + "\n".join(f"line {i}" for i in range(20)) + "\n```\nafter"
+
+        chunks = split_mrkdwn(text, 40)
+
+        assert all(len(chunk) <= 40 for chunk in chunks)
+        assert all(chunk.startswith("```\n") and chunk.endswith("\n```") for chunk in chunks[:-1])
+        assert chunks[-1] == "after"
+        lines = [line for chunk in chunks for line in chunk.split("\n") if line != "```"]
+        assert lines == [f"line {i}" for i in range(20)] + ["after"]
+
+    def test_long_line_is_wrapped_at_spaces(self):
+        """Test that a line longer than the limit is cut at a space, or anywhere without one."""
+        assert split_mrkdwn("aaaa bbbb cccc", 20) == ["aaaa bbbb cccc"]
+        assert split_mrkdwn("aaaaaaaaaa bbbbbbbbbb cccc", 20) == ["aaaaaaaaaa", "bbbbbbbbbb cccc"]
+        assert split_mrkdwn("x" * 45, 20) == ["x" * 20, "x" * 20, "x" * 5]
+
+
+class TestMrkdwnChunker:
+    """Tests for MrkdwnChunker."""
+
+    def test_feed_matches_split(self):
+        """Test that feeding fragments gives the chunks of the whole text."""
+        text = "\n\n".join(f"paragraph {i}\n• item\n• item" for i in range(30))
+        chunker = MrkdwnChunker(100)
+
+        chunks = []
+        for i in range(0, len(text), 7):
+            chunks.extend(chunker.feed(text[i:i + 7]))
+        chunks.extend(chunker.finish())
+
+        assert chunks == split_mrkdwn(text, 100)
+        assert len(chunks) > 1
+
+    def test_pending_is_the_unsent_text(self):
+        """Test that pending holds what has not been returned yet."""
+        chunker = MrkdwnChunker(20)
+
+        chunks = chunker.feed("aaaa\n\nbbbb\ncccc\ndddd eeee\nff")
+
+        assert chunks == ["aaaa"]
+        assert chunker.pending == "bbbb\ncccc\ndddd eeee\nff"
+
+
+class TestMessagePayload:
+    """Tests for message_payload."""
+
+    def test_text_only_by_default(self):
+        """Test that plain text is posted unless blocks are enabled."""
+        assert message_payload("hi") == {"text": "hi"}
+
+    @patch('module.chunking.REPLY_BLOCKS', True)
+    def test_blocks(self):
+        """Test that text is put in section blocks of at most 3000 characters."""
+        payload = message_payload("x" * 3500)
+
+        assert payload["text"] == "x" * 3500
+        assert [len(block["text"]["text"]) for block in payload["blocks"]] == [3000, 500]
+        assert payload["blocks"][0]["text"]["type"] == "mrkdwn"
+
+    @patch('module.chunking.REPLY_BLOCKS', True)
+    def test_sections_keep_code_blocks(self):
+        """Test that a code block cut between sections is closed and reopened."""
+        text = "```\n" + "\n".join(["x" * 99] * 40) + "\n```"
+        sections = [block["text"]["text"] for block in message_payload(text)["blocks"]]
+
+        assert sections == split_mrkdwn(text, 3000)
+        assert all(len(section) <= 3000 for section in sections)
+        assert all(section.count("```") == 2 for section in sections)
+
+    @patch('module.chunking.REPLY_BLOCKS', True)
+    def test_blocks_capped(self):
+        """Test that no more sections are posted than a message can hold."""
+        payload = message_payload("\n\n".join(["x" * 2999] * 60))
+
+        assert len(payload["blocks"]) == 50
@@ -0,0 +1,54 @@
+"""Tests for module/dedup.py event deduplication."""
+from unittest.mock import MagicMock
+
+from module.dedup import EventDeduplicator, MemoryDedupBackend, RedisDedupBackend
+
+
+class TestEventDeduplicator:
+    """Tests for EventDeduplicator."""
+
+    def test_retry_with_same_event_id_is_duplicate(self):
+        """Test that a Slack retry is detected."""
+        dedup = EventDeduplicator(MemoryDedupBackend())
+        event = {"channel": "C1", "ts": "1.0"}
+        assert dedup.is_duplicate(event, {"event_id": "Ev1"}) is False
+        assert dedup.is_duplicate(event, {"event_id": "Ev1"}) is True
+        assert dedup.stats() == {"hits": 1, "misses": 1}
+
+    def test_same_post_with_other_event_id_is_duplicate(self):
+        """Test that message.im and app_mention for one post are detected."""
+        dedup = EventDeduplicator(MemoryDedupBackend())
+        event = {"channel": "C1", "ts": "1.0"}
+        assert dedup.is_duplicate(event, {"event_id": "Ev1"}) is False
+        assert dedup.is_duplicate(event, {"event_id": "Ev2"}) is True
+
+    def test_other_posts_are_not_duplicate(self):
+        """Test that different posts pass."""
+        dedup = EventDeduplicator(MemoryDedupBackend())
+        assert dedup.is_duplicate({"channel": "C1", "ts": "1.0"}) is False
+        assert dedup.is_duplicate({"channel": "C1", "ts": "2.0"}) is False
+        assert dedup.is_duplicate({"channel": "C2", "ts": "1.0"}) is False
+
+    def test_forget_allows_reprocessing(self):
+        """Test that a forgotten event is processed again."""
+        dedup = EventDeduplicator(MemoryDedupBackend())
+        event = {"channel": "C1", "ts": "1.0"}
+        dedup.is_duplicate(event)
+        dedup.forget(event)
+        assert dedup.is_duplicate(event) is False
+
+
+class TestRedisDedupBackend:
+    """Tests for RedisDedupBackend."""
+
+    def test_claim_uses_set_nx(self):
+        """Test that claims are atomic SET NX with expiry."""
+        client = MagicMock()
+        client.set.return_value = True
+        backend = RedisDedupBackend(client)
+
+        assert backend.claim("ts:C1:1.0", 600) is True
+        client.set.assert_called_once_with("ai-bot:dedup:ts:C1:1.0", 1, nx=True, ex=600)
+
+        client.set.return_value = None
+        assert backend.claim("ts:C1:1.0", 600) is False
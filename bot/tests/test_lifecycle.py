@@ -0,0 +1,127 @@
+"""Tests for module/lifecycle.py."""
+import asyncio
+import signal
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from module import lifecycle
+from module.lifecycle import SLACK_INTERRUPTED_MESSAGE
+
+
+def event(ts):
+    return {"text": "Hello bot", "ts": ts, "channel": "C123456", "user": "U123456"}
+
+
+class TestDraining:
+    """Tests for the draining flag and the answers in progress."""
+
+    def test_signal_starts_draining_and_calls_previous_handler(self):
+        """Test that SIGTERM marks the instance draining before the server's handler runs."""
+        previous = MagicMock()
+        handler = lifecycle._chain(signal.SIGTERM, previous)
+
+        handler(signal.SIGTERM, None)
+
+        assert lifecycle.is_draining()
+        previous.assert_called_once_with(signal.SIGTERM, None)
+
+    def test_watch_signals_outside_main_thread(self):
+        """Test that signals are left alone on threads that cannot handle them."""
+        handler = signal.getsignal(signal.SIGTERM)
+        thread = threading.Thread(target=lifecycle.watch_signals)
+        thread.start()
+        thread.join()
+
+        assert signal.getsignal(signal.SIGTERM) is handler
+
+    def test_finished_answers_are_forgotten(self):
+        """Test that only answers not finished count as in progress."""
+        lifecycle.accept(event("1.1"), MagicMock())
+        lifecycle.accept(event("1.2"), MagicMock())
+        lifecycle.finish(event("1.1"))
+
+        assert lifecycle.in_progress() == 1
+
+
+@patch('module.lifecycle.flush_logs')
+@patch('module.lifecycle.answer_executor')
+class TestDrain:
+    """Tests for drain()."""
+
+    @pytest.mark.asyncio
+    async def test_waits_for_answers_to_finish(self, mock_executor, mock_flush):
+        """Test that an answer finishing within the grace period is not interrupted."""
+        say = MagicMock()
+        lifecycle.accept(event("1.1"), say)
+        asyncio.get_running_loop().call_later(0.05, lifecycle.finish, event("1.1"))
+
+        await lifecycle.drain(grace=5, poll=0.01)
+
+        assert lifecycle.is_draining()
+        say.assert_not_called()
+        mock_executor.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        mock_flush.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_interrupted_answers_are_told(self, mock_executor, mock_flush):
+        """Test that the threads of unfinished answers are told at the end of the grace period."""
+        say = MagicMock()
+        async_say = AsyncMock()
+        lifecycle.accept(event("1.1"), say)
+        lifecycle.accept(event("1.2"), async_say)
+        interrupted = lifecycle.DRAINED.get(outcome="interrupted")
+
+        await lifecycle.drain(grace=0.05, poll=0.01)
+
+        say.assert_called_once_with({"text": SLACK_INTERRUPTED_MESSAGE, "thread_ts": "1.1"})
+        async_say.assert_awaited_once_with({"text": SLACK_INTERRUPTED_MESSAGE, "thread_ts": "1.2"})
+        assert lifecycle.in_progress() == 0
+        assert lifecycle.DRAINED.get(outcome="interrupted") == interrupted + 2
+        mock_flush.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_failed_notice_does_not_stop_draining(self, mock_executor, mock_flush):
+        """Test that a notice Slack refuses is logged and the others still go out."""
+        failing = MagicMock(side_effect=Exception("channel_not_found"))
+        say = MagicMock()
+        lifecycle.accept(event("1.1"), failing)
+        lifecycle.accept(event("1.2"), say)
+
+        await lifecycle.drain(grace=0, poll=0.01)
+
+        say.assert_called_once()
+        mock_flush.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_claimed_answer_is_not_interrupted(self, mock_executor, mock_flush):
+        """Test that an answer already being posted gets no notice."""
+        say = MagicMock()
+        lifecycle.accept(event("1.1"), say)
+        assert lifecycle.claim([event("1.1")])
+
+        await lifecycle.drain(grace=0, poll=0.01)
+
+        say.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_interrupted_answer_is_not_posted(self, mock_executor, mock_flush):
+        """Test that an answer finishing after the notice may not post."""
+        lifecycle.accept(event("1.1"), MagicMock())
+        lifecycle.accept(event("1.2"), MagicMock())
+
+        await lifecycle.drain(grace=0, poll=0.01)
+
+        assert not lifecycle.claim([event("1.1"), event("1.2")])
+        assert lifecycle.claim([event("1.3")])
+
+    @pytest.mark.asyncio
+    async def test_queues_are_closed(self, mock_executor, mock_flush):
+        """Test that no further batch starts once the grace period is over."""
+        from module.app import answer_queue
+        from module.async_app import answer_queue as async_answer_queue
+
+        await lifecycle.drain(grace=0, poll=0.01)
+
+        assert not answer_queue.put("t1", (event("1.1"), MagicMock()))
+        assert not async_answer_queue.put("t1", (event("1.1"), AsyncMock()))
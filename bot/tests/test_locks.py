@@ -0,0 +1,38 @@
+"""Tests for module/locks.py keyed locks."""
+import threading
+import time
+
+from module.locks import KeyedLock
+
+
+class TestKeyedLock:
+    """Tests for KeyedLock."""
+
+    def test_same_key_is_serialized(self):
+        """Test that holders of one key never overlap."""
+        lock = KeyedLock()
+        active = []
+        overlaps = []
+
+        def work():
+            with lock("thread-1"):
+                active.append(1)
+                overlaps.append(len(active))
+                time.sleep(0.01)
+                active.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert max(overlaps) == 1
+
+    def test_unused_keys_are_dropped(self):
+        """Test that locks are removed once released."""
+        lock = KeyedLock()
+        with lock("thread-1"):
+            with lock("thread-2"):
+                assert len(lock) == 2
+        assert len(lock) == 0
@@ -0,0 +1,155 @@
+"""Tests for module/logs.py structured logging."""
+import json
+import logging
+import queue
+from unittest.mock import patch
+
+import pytest
+
+from module import logs
+
+
+def _text_event(text="hello"):
+    return {"author": "root_agent", "content": {"parts": [{"text": text}]}}
+
+
+@pytest.fixture
+def event_records():
+    """Capture records sent to the agent event logger."""
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logs.event_logger.addHandler(handler)
+    previous = logs.event_logger.level
+    logs.event_logger.setLevel(logging.INFO)
+    yield records
+    logs.event_logger.removeHandler(handler)
+    logs.event_logger.setLevel(previous)
+
+
+class TestParseRates:
+    """Tests for _parse_rates."""
+
+    def test_parse(self):
+        """Test parsing comma separated rates."""
+        assert logs._parse_rates("text=0.1, function_call=1") == {
+            "text": 0.1,
+            "function_call": 1.0,
+        }
+
+    def test_empty(self):
+        """Test that an empty value means no rates."""
+        assert logs._parse_rates("") == {}
+
+
+class TestJsonFormatter:
+    """Tests for JsonFormatter."""
+
+    def test_format(self):
+        """Test that records become Cloud Logging JSON with extra fields."""
+        record = logging.LogRecord("x", logging.WARNING, __file__, 1, "hi %s", ("you",), None)
+        record.json_fields = {"thread_id": "C1-1"}
+
+        payload = json.loads(logs.JsonFormatter().format(record))
+
+        assert payload["severity"] == "WARNING"
+        assert payload["message"] == "hi you"
+        assert payload["thread_id"] == "C1-1"
+
+
+class TestDroppingQueueHandler:
+    """Tests for DroppingQueueHandler."""
+
+    def test_drop_when_full(self):
+        """Test that a full queue drops records instead of blocking."""
+        handler = logs.DroppingQueueHandler(queue.Queue(1))
+        logger = logging.getLogger("test_logs.dropping")
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        logger.warning("one")
+        logger.warning("two")
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+
+
+class TestEventType:
+    """Tests for event_type."""
+
+    @pytest.mark.parametrize(
+        "part,expected",
+        [
+            ({"text": "a"}, "text"),
+            ({"function_call": {"name": "maps"}}, "function_call"),
+            ({"function_response": {"name": "maps"}}, "function_response"),
+            ({}, "other"),
+        ],
+    )
+    def test_event_type(self, part, expected):
+        """Test classification by the first part."""
+        assert logs.event_type({"content": {"parts": [part]}}) == expected
+
+    def test_no_content(self):
+        """Test events without content."""
+        assert logs.event_type({"actions": {}}) == "other"
+
+
+class TestLogAgentEvent:
+    """Tests for log_agent_event."""
+
+    def test_logged_with_fields(self, event_records):
+        """Test that unsampled types are always logged with their fields."""
+        with patch.dict(logs.EVENT_LOG_SAMPLE_RATES, {}, clear=True):
+            logs.log_agent_event(_text_event(), "C1-1")
+
+        fields = event_records[0].json_fields
+        assert fields["thread_id"] == "C1-1"
+        assert fields["event_type"] == "text"
+        assert json.loads(fields["event"])["content"]["parts"][0]["text"] == "hello"
+        assert fields["route"] is None
+
+    def test_route_logged(self, event_records):
+        """Test that the route tagged by the root agent is a field of its own."""
+        event = {**_text_event(), "custom_metadata": {"route": "map"}}
+        with patch.dict(logs.EVENT_LOG_SAMPLE_RATES, {}, clear=True):
+            logs.log_agent_event(event, "C1-1")
+
+        assert event_records[0].json_fields["route"] == "map"
+
+    def test_sampled_out(self, event_records):
+        """Test that a zero rate drops the event."""
+        with patch.dict(logs.EVENT_LOG_SAMPLE_RATES, {"text": 0.0}, clear=True):
+            for _ in range(20):
+                logs.log_agent_event(_text_event(), "C1-1")
+
+        assert event_records == []
+
+    def test_sampling_rate(self, event_records):
+        """Test that the rate is applied with random()."""
+        with patch.dict(logs.EVENT_LOG_SAMPLE_RATES, {"text": 0.5}, clear=True), \
+             patch("module.logs.random.random", side_effect=[0.2, 0.7]):
+            logs.log_agent_event(_text_event(), "C1-1")
+            logs.log_agent_event(_text_event(), "C1-1")
+
+        assert len(event_records) == 1
+
+    def test_truncated(self, event_records):
+        """Test that long payloads are truncated."""
+        with patch.dict(logs.EVENT_LOG_SAMPLE_RATES, {}, clear=True), \
+             patch("module.logs.EVENT_LOG_MAX_CHARS", 50):
+            logs.log_agent_event(_text_event("x" * 500), "C1-1")
+
+        event = event_records[0].json_fields["event"]
+        assert event.startswith('{"author"')
+        assert len(event) < 100
+        assert event.endswith("chars)")
+
+    def test_disabled_level(self, event_records):
+        """Test that nothing is serialized when INFO is disabled."""
+        logs.event_logger.setLevel(logging.WARNING)
+        with patch("module.logs.json.dumps") as dumps:
+            logs.log_agent_event(_text_event(), "C1-1")
+
+        dumps.assert_not_called()
+        assert event_records == []
@@ -0,0 +1,135 @@
+"""Tests for module/metrics.py."""
+import os
+import pytest
+from unittest.mock import patch
+
+from module import metrics
+
+
+@pytest.fixture
+def registry():
+    """A registry separate from the one served on /metrics."""
+    return metrics.Registry()
+
+
+class TestCounter:
+    """Tests for Counter."""
+
+    def test_inc(self, registry):
+        """Test counting per label set."""
+        counter = metrics.Counter("c_total", "help", ["stage"], registry=registry)
+        counter.inc(stage="a")
+        counter.inc(2, stage="a")
+        counter.inc(stage="b")
+
+        assert counter.get(stage="a") == 3
+        assert counter.get(stage="b") == 1
+        assert 'c_total{stage="a"} 3' in registry.render()
+
+    def test_wrong_labels(self, registry):
+        """Test that label names are checked."""
+        counter = metrics.Counter("c_total", "help", ["stage"], registry=registry)
+        with pytest.raises(ValueError):
+            counter.inc(kind="a")
+
+
+class TestGauge:
+    """Tests for Gauge."""
+
+    def test_track_inprogress(self, registry):
+        """Test that the gauge counts the block while it runs."""
+        gauge = metrics.Gauge("g", "help", ["kind"], registry=registry)
+        with gauge.track_inprogress(kind="answer"):
+            assert gauge.get(kind="answer") == 1
+        assert gauge.get(kind="answer") == 0
+
+    def test_set_function(self, registry):
+        """Test that a function gauge is read when rendered."""
+        gauge = metrics.Gauge("g", "help", registry=registry)
+        gauge.set_function(lambda: 7)
+        assert "\ng 7\n" in registry.render()
+
+
+class TestHistogram:
+    """Tests for Histogram."""
+
+    def test_render_buckets(self, registry):
+        """Test cumulative buckets, sum and count."""
+        histogram = metrics.Histogram(
+            "h_seconds", "help", ["stage"], buckets=(0.1, 1.0), registry=registry
+        )
+        histogram.observe(0.05, stage="x")
+        histogram.observe(0.1, stage="x")
+        histogram.observe(5, stage="x")
+
+        text = registry.render()
+        assert "# TYPE h_seconds histogram" in text
+        assert 'h_seconds_bucket{stage="x",le="0.1"} 2' in text
+        assert 'h_seconds_bucket{stage="x",le="1.0"} 2' in text
+        assert 'h_seconds_bucket{stage="x",le="+Inf"} 3' in text
+        assert 'h_seconds_sum{stage="x"} 5.15' in text
+        assert 'h_seconds_count{stage="x"} 3' in text
+
+    def test_time(self, registry):
+        """Test that time() observes even when the block raises."""
+        histogram = metrics.Histogram("h_seconds", "help", ["stage"], registry=registry)
+        with pytest.raises(RuntimeError):
+            with histogram.time(stage="x"):
+                raise RuntimeError
+        assert histogram.count(stage="x") == 1
+
+
+class TestSpan:
+    """Tests for span."""
+
+    def test_error_counted(self):
+        """Test that a failing span is timed and counted by error class."""
+        before = metrics.ERRORS.get(stage="test_span", error="KeyError")
+        with pytest.raises(KeyError):
+            with metrics.span("test_span"):
+                raise KeyError("x")
+
+        assert metrics.ERRORS.get(stage="test_span", error="KeyError") == before + 1
+        assert metrics.STAGE_SECONDS.count(stage="test_span") >= 1
+
+
+class TestStats:
+    """Tests for cache stats."""
+
+    def test_render_stats(self, registry):
+        """Test that stats() of caches are rendered with a cache label."""
+        registry.register_stats("session", lambda: {"hits": 3, "misses": 1, "size": 2})
+        registry.register_stats("dedup", lambda: {"hits": 5, "misses": 9})
+
+        text = registry.render()
+        assert 'bot_cache_hits_total{cache="session"} 3' in text
+        assert 'bot_cache_hits_total{cache="dedup"} 5' in text
+        assert 'bot_cache_size{cache="session"} 2' in text
+        assert text.count("# TYPE bot_cache_hits_total counter") == 1
+
+    def test_label_escaping(self, registry):
+        """Test that label values are escaped."""
+        counter = metrics.Counter("c_total", "help", ["error"], registry=registry)
+        counter.inc(error='a"b')
+        assert 'c_total{error="a\\"b"} 1' in registry.render()
+
+
+class TestWorkers:
+    """Tests for the worker label."""
+
+    def test_no_label_with_one_worker(self, registry):
+        """Test that a single worker renders the samples without a worker label."""
+        counter = metrics.Counter("c_total", "help", registry=registry)
+        counter.inc()
+        assert "c_total 1" in registry.render()
+
+    @patch('module.metrics.WORKERS', 2)
+    def test_samples_labeled_per_worker(self, registry):
+        """Test that with several workers every sample names the worker that served it."""
+        counter = metrics.Counter("c_total", "help", ["stage"], registry=registry)
+        counter.inc(stage="a")
+        registry.register_stats("session", lambda: {"hits": 3})
+
+        text = registry.render()
+        assert f'c_total{{stage="a",worker="{os.getpid()}"}} 1' in text
+        assert f'bot_cache_hits_total{{cache="session",worker="{os.getpid()}"}} 3' in text
@@ -0,0 +1,84 @@
+"""Tests for module/mrkdwn.py incremental converter."""
+import pytest
+from markdown_to_mrkdwn import SlackMarkdownConverter
+
+from module.mrkdwn import IncrementalMrkdwnConverter
+
+SAMPLE = """
+
+# 渋谷駅からのルート
+
+**結論**: 徒歩で *約10分* です。
+
+1. ハチ公口を出る
+2. `道玄坂` を上る
+   - 左手に ~~旧~~ 新しいビル
+   - [地図](https://maps.example.com)
+
+| 手段 | 所要時間 |
+|------|----------|
+| 徒歩 | 10分 |
+| バス | 5分 |
+
+```python
+# **そのまま**
+print("| not | a | table |")
+```
+
+> 天気は ***晴れ*** です
+
+---
+最後の行   
+
+"""
+
+
+def convert_in_chunks(text, size):
+    """Feed text in chunks of size and return the concatenated output."""
+    converter = IncrementalMrkdwnConverter()
+    output = []
+    for i in range(0, len(text), size):
+        output.append(converter.feed(text[i:i + size]))
+    output.append(converter.finish())
+    return converter, "".join(output)
+
+
+class TestIncrementalMrkdwnConverter:
+    """Tests for IncrementalMrkdwnConverter."""
+
+    @pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 64, 10000])
+    def test_matches_whole_string_conversion(self, size):
+        """Test that any chunking gives the same result as convert()."""
+        expected = SlackMarkdownConverter().convert(SAMPLE)
+        converter, output = convert_in_chunks(SAMPLE, size)
+        assert output == expected
+        assert converter.text == expected
+
+    def test_emitted_prefix_is_stable(self):
+        """Test that text already emitted is never rewritten."""
+        converter = IncrementalMrkdwnConverter()
+        emitted = ""
+        for char in SAMPLE:
+            emitted += converter.feed(char)
+            assert converter.text.startswith(emitted)
+        emitted += converter.finish()
+        assert emitted == converter.text
+
+    def test_code_fence_state_spans_fragments(self):
+        """Test that an open code fence keeps lines unconverted."""
+        converter = IncrementalMrkdwnConverter()
+        assert converter.feed("```\n**bold**") == "```"
+        assert converter.feed("\n```\n**bold**\n") == "\n**bold**\n```\n*bold*"
+
+    def test_preview_of_incomplete_line(self):
+        """Test that the incomplete line is shown converted but not emitted."""
+        converter = IncrementalMrkdwnConverter()
+        assert converter.feed("**Hello** wor") == ""
+        assert converter.text == "*Hello* wor"
+
+    def test_empty_input(self):
+        """Test that whitespace-only input converts to nothing."""
+        converter = IncrementalMrkdwnConverter()
+        assert converter.feed("  \n\n ") == ""
+        assert converter.finish() == ""
+        assert converter.text == ""
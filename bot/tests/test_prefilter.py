@@ -0,0 +1,65 @@
+"""Tests for module/prefilter.py."""
+import json
+
+import pytest
+from unittest.mock import patch
+
+from module.common import SLACK_BOT_USER_ID
+from module.prefilter import drop_reason
+
+JSON = "application/json"
+
+
+def _body(event, **payload):
+    return json.dumps({"type": "event_callback", "event": event, **payload}).encode()
+
+
+def _message(**fields):
+    return {"type": "message", "user": "U1", "text": "hi", "channel_type": "im", **fields}
+
+
+class TestDropReason:
+    """Tests for drop_reason."""
+
+    @pytest.mark.parametrize("event, reason", [
+        (_message(), None),
+        (_message(subtype="file_share"), None),
+        (_message(channel_type="channel"), "not_im"),
+        (_message(channel_type="group"), "not_im"),
+        (_message(channel_type="mpim"), "not_im"),
+        (_message(user=SLACK_BOT_USER_ID), "own_message"),
+        (_message(subtype="bot_message", bot_id="B1"), "bot_message"),
+        (_message(bot_id="B1"), "bot_message"),
+        (_message(subtype="message_changed"), "edited"),
+        (_message(subtype="message_deleted"), "edited"),
+        (_message(subtype="channel_join", channel_type="channel"), "subtype"),
+        ({"type": "app_mention", "user": "U1", "text": "<@U0> hi"}, None),
+        ({"type": "reaction_added", "user": "U1"}, None),
+    ])
+    def test_events(self, event, reason):
+        """Test that only messages the bot never answers are dropped."""
+        assert drop_reason(_body(event), JSON) == reason
+
+    def test_own_message_of_another_workspace(self):
+        """Test that the bot user of the authorization is recognized."""
+        body = _body(
+            _message(user="UBOT2"),
+            authorizations=[{"user_id": "UBOT2", "is_bot": True}],
+        )
+
+        assert drop_reason(body, JSON) == "own_message"
+
+    @pytest.mark.parametrize("body, content_type", [
+        (b"command=%2Fgemini&text=help", "application/x-www-form-urlencoded"),
+        (b'{"type": "url_verification", "challenge": "x"}', JSON),
+        (b"not json", JSON),
+        (b"[]", JSON),
+    ])
+    def test_other_requests_pass(self, body, content_type):
+        """Test that commands, verification and unparsable bodies are left to Bolt."""
+        assert drop_reason(body, content_type) is None
+
+    def test_disabled(self):
+        """Test that BOT_PREFILTER=false lets every event through."""
+        with patch("module.prefilter.PREFILTER_ENABLED", False):
+            assert drop_reason(_body(_message(channel_type="channel")), JSON) is None
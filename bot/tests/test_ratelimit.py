@@ -0,0 +1,101 @@
+"""Tests for module/ratelimit.py admission control."""
+from module.ratelimit import ConcurrencyLimit, RateLimiter, _parse_limits, limit_keys
+
+
+class TestRateLimiter:
+    """Tests for RateLimiter."""
+
+    def test_burst_then_refill(self, clock):
+        """Test that count messages pass at once and tokens come back over time."""
+        limiter = RateLimiter({"user": (2, 60)}, 100, timer=clock)
+        keys = {"user": "U1"}
+
+        assert limiter.acquire(keys) is None
+        assert limiter.acquire(keys) is None
+        assert limiter.acquire(keys) == "user"
+
+        clock.now = 30
+        assert limiter.acquire(keys) is None
+        assert limiter.acquire(keys) == "user"
+
+    def test_keys_are_independent(self, clock):
+        """Test that one user's bucket does not affect another's."""
+        limiter = RateLimiter({"user": (1, 60)}, 100, timer=clock)
+
+        assert limiter.acquire({"user": "U1"}) is None
+        assert limiter.acquire({"user": "U2"}) is None
+        assert limiter.acquire({"user": "U1"}) == "user"
+
+    def test_rejection_takes_no_token(self, clock):
+        """Test that a message refused by the channel keeps the user's token."""
+        limiter = RateLimiter({"user": (2, 60), "channel": (1, 60)}, 100, timer=clock)
+
+        assert limiter.acquire({"user": "U1", "channel": "C1"}) is None
+        assert limiter.acquire({"user": "U1", "channel": "C1"}) == "channel"
+        assert limiter.acquire({"user": "U1", "channel": "C2"}) is None
+
+    def test_unknown_scope_and_missing_key_ignored(self, clock):
+        """Test that scopes without a limit or an id are not counted."""
+        limiter = RateLimiter({"user": (1, 60)}, 100, timer=clock)
+
+        for _ in range(3):
+            assert limiter.acquire({"user": None, "channel": "C1"}) is None
+        assert len(limiter) == 0
+
+    def test_idle_buckets_are_evicted(self, clock):
+        """Test that buckets are dropped once they would be full again."""
+        limiter = RateLimiter({"user": (2, 60)}, 100, timer=clock)
+        limiter.acquire({"user": "U1"})
+        limiter.acquire({"user": "U2"})
+        assert len(limiter) == 2
+
+        clock.now = 31
+        limiter.acquire({"user": "U3"})
+
+        assert len(limiter) == 1
+
+    def test_maxsize_bounds_memory(self, clock):
+        """Test that the number of buckets never exceeds maxsize."""
+        limiter = RateLimiter({"user": (5, 60)}, 3, timer=clock)
+        for i in range(10):
+            limiter.acquire({"user": f"U{i}"})
+
+        assert len(limiter) == 3
+
+
+class TestConcurrencyLimit:
+    """Tests for ConcurrencyLimit."""
+
+    def test_refuses_beyond_limit(self):
+        """Test that a slot is refused while all are held and freed afterwards."""
+        slots = ConcurrencyLimit(1)
+        with slots.slot() as first:
+            with slots.slot() as second:
+                assert first and not second
+        with slots.slot() as third:
+            assert third
+        assert slots.active == 0
+
+    def test_zero_means_unlimited(self):
+        """Test that a limit of 0 admits everything."""
+        slots = ConcurrencyLimit(0)
+        with slots.slot() as first, slots.slot() as second:
+            assert first and second
+
+
+class TestHelpers:
+    """Tests for the settings parser and the keys of an event."""
+
+    def test_parse_limits(self):
+        """Test parsing BOT_RATE_LIMITS."""
+        assert _parse_limits("user=10/60, channel=30/60") == {
+            "user": (10.0, 60.0),
+            "channel": (30.0, 60.0),
+        }
+        assert _parse_limits("") == {}
+
+    def test_limit_keys(self):
+        """Test that the workspace comes from the envelope when there is one."""
+        event = {"user": "U1", "channel": "C1", "team": "T-event"}
+        assert limit_keys(event, {"team_id": "T1"}) == {"user": "U1", "channel": "C1", "team": "T1"}
+        assert limit_keys(event)["team"] == "T-event"
@@ -0,0 +1,176 @@
+"""Tests for module/resilience.py deadlines, retries and hedging."""
+import asyncio
+import time
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from module import resilience
+from module.resilience import Deadlines, StreamTimeout, guard_async_stream, guard_stream
+
+
+def slow_events(events, delays):
+    """A stream yielding each event after its delay."""
+    def stream():
+        for event, delay in zip(events, delays):
+            time.sleep(delay)
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    return stream
+
+
+def async_slow_events(events, delays):
+    """The async counterpart of slow_events."""
+    async def stream():
+        for event, delay in zip(events, delays):
+            await asyncio.sleep(delay)
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    return stream
+
+
+class TestGuardStream:
+    """Tests for guard_stream."""
+
+    def test_events_pass(self):
+        """Test that a stream within its deadlines is passed through."""
+        assert list(guard_stream(slow_events(["a", "b"], [0, 0]))) == ["a", "b"]
+
+    def test_error_raised(self):
+        """Test that the error of the stream is raised after its events."""
+        events = []
+        with pytest.raises(ValueError):
+            for event in guard_stream(slow_events(["a", ValueError("boom")], [0, 0])):
+                events.append(event)
+        assert events == ["a"]
+
+    @pytest.mark.parametrize("delays, deadlines, stage", [
+        ([1], Deadlines(first_event=0.1), "first_event"),
+        ([0, 1], Deadlines(gap=0.1), "event_gap"),
+        ([0, 0.1, 0.1, 0.1, 0.1], Deadlines(gap=0.5, total=0.25), "total"),
+    ])
+    def test_deadlines(self, delays, deadlines, stage):
+        """Test that a stream missing a deadline is given up at that deadline."""
+        before = resilience.TIMEOUTS.get(stage=stage)
+        start = time.perf_counter()
+
+        with pytest.raises(StreamTimeout) as raised:
+            list(guard_stream(slow_events(["x"] * len(delays), delays), deadlines=deadlines))
+
+        assert raised.value.stage == stage
+        assert time.perf_counter() - start < 0.5
+        assert resilience.TIMEOUTS.get(stage=stage) == before + 1
+
+    def test_hedge_answers_first(self):
+        """Test that a late first event starts a hedge, whose answer is used."""
+        on_hedge = MagicMock()
+        before = resilience.HEDGES.get(winner="hedge")
+
+        events = list(guard_stream(
+            slow_events(["primary"], [1]), slow_events(["hedge"], [0]),
+            hedge_after=0.1, on_hedge=on_hedge,
+        ))
+
+        assert events == ["hedge"]
+        on_hedge.assert_called_once_with("hedge")
+        assert resilience.HEDGES.get(winner="hedge") == before + 1
+
+    def test_primary_answers_after_hedge(self):
+        """Test that the primary stream is still used when it answers first."""
+        on_hedge = MagicMock()
+
+        events = list(guard_stream(
+            slow_events(["primary", "more"], [0.2, 0]), slow_events(["hedge"], [1]),
+            hedge_after=0.1, on_hedge=on_hedge,
+        ))
+
+        assert events == ["primary", "more"]
+        on_hedge.assert_called_once_with("primary")
+
+    def test_no_hedge_when_on_time(self):
+        """Test that no hedge is opened for a first event on time."""
+        open_hedge = MagicMock()
+
+        assert list(guard_stream(slow_events(["a"], [0]), open_hedge, hedge_after=0.5)) == ["a"]
+        open_hedge.assert_not_called()
+
+    def test_failed_primary_waits_for_hedge(self):
+        """Test that a failure of one stream leaves the answer to the other."""
+        events = list(guard_stream(
+            slow_events([ConnectionError()], [0.2]), slow_events(["hedge"], [0.2]),
+            hedge_after=0.1,
+        ))
+
+        assert events == ["hedge"]
+
+
+class TestGuardAsyncStream:
+    """Tests for guard_async_stream."""
+
+    @pytest.mark.asyncio
+    async def test_events_pass(self):
+        """Test that a stream within its deadlines is passed through."""
+        events = [event async for event in guard_async_stream(async_slow_events(["a", "b"], [0, 0]))]
+        assert events == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_deadline(self):
+        """Test that the pending read is cancelled at the deadline."""
+        start = time.perf_counter()
+
+        with pytest.raises(StreamTimeout) as raised:
+            async for _ in guard_async_stream(
+                async_slow_events(["a", "b"], [0, 5]), deadlines=Deadlines(gap=0.1)
+            ):
+                pass
+
+        assert raised.value.stage == "event_gap"
+        assert time.perf_counter() - start < 0.5
+
+    @pytest.mark.asyncio
+    async def test_hedge_answers_first(self):
+        """Test that the hedge is used and the late primary stream closed."""
+        on_hedge = MagicMock()
+
+        events = [event async for event in guard_async_stream(
+            async_slow_events(["primary"], [5]), async_slow_events(["hedge", "more"], [0, 0]),
+            hedge_after=0.1, on_hedge=on_hedge,
+        )]
+
+        assert events == ["hedge", "more"]
+        on_hedge.assert_called_once_with("hedge")
+
+    @pytest.mark.asyncio
+    async def test_error_raised(self):
+        """Test that the error of the stream is raised."""
+        with pytest.raises(ValueError):
+            async for _ in guard_async_stream(async_slow_events([ValueError()], [0])):
+                pass
+
+
+class TestRetryPolicy:
+    """Tests for is_transient and backoff."""
+
+    @pytest.mark.parametrize("error, transient", [
+        (ConnectionError(), True),
+        (TimeoutError(), True),
+        (StreamTimeout("first_event", 1), False),
+        (ValueError(), False),
+        (type("ServiceUnavailable", (Exception,), {"code": 503})(), True),
+        (type("NotFound", (Exception,), {"code": 404})(), False),
+        (type("ChunkedEncodingError", (OSError,), {})(), True),
+    ])
+    def test_is_transient(self, error, transient):
+        """Test that connection failures, rate limits and 5xx are retried."""
+        assert resilience.is_transient(error) is transient
+
+    def test_backoff_jitter(self):
+        """Test that the backoff is random up to the capped exponential."""
+        with patch("module.resilience.RETRY_BACKOFF", 1), patch("module.resilience.RETRY_BACKOFF_MAX", 3):
+            delays = [resilience.backoff(attempt) for attempt in (0, 1, 5) for _ in range(50)]
+
+        assert all(0 <= delay <= 1 for delay in delays[:50])
+        assert all(0 <= delay <= 3 for delay in delays[100:])
+        assert max(delays[100:]) > 1
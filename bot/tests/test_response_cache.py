@@ -0,0 +1,113 @@
+"""Tests for module/response_cache.py first-turn answer cache."""
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from module.agent import create_answer
+from module.response_cache import ResponseCache, normalize, response_cache
+
+
+def make_cache(**kwargs):
+    options = dict(enabled=True, maxsize=10, ttl=60, tool_ttl=60, bypass_marker="#nocache")
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+class TestNormalize:
+    """Tests for normalize."""
+
+    def test_width_case_spacing_and_punctuation(self):
+        """Test that trivially different questions share a key."""
+        assert normalize("ＧＣＰ  とは？") == normalize("gcp とは")
+
+    def test_inner_text_kept(self):
+        """Test that only trailing punctuation is removed."""
+        assert normalize("コーヒー.豆") == "コーヒー.豆"
+
+
+class TestResponseCache:
+    """Tests for ResponseCache."""
+
+    def test_disabled(self):
+        """Test that a disabled cache passes the message through untouched."""
+        cache = make_cache(enabled=False)
+        assert cache.lookup("t1", "hi #nocache", True) == ("hi #nocache", None, False)
+
+    def test_miss_then_hit(self):
+        """Test that a stored first-turn answer is returned for the same question."""
+        cache = make_cache()
+        assert cache.lookup("t1", "What is GCP?", True) == ("What is GCP?", None, True)
+        cache.set("What is GCP?", ["Google", "Cloud"], used_tool=False)
+
+        assert cache.lookup("t2", "what is gcp", True) == ("what is gcp", ["Google", "Cloud"], False)
+        assert cache.stats()["hits"] == 1
+
+    def test_not_first_turn(self):
+        """Test that messages inside a thread are neither looked up nor stored."""
+        cache = make_cache()
+        cache.set("hi", ["hello"], used_tool=False)
+        assert cache.lookup("t1", "hi", False) == ("hi", None, False)
+
+    def test_bypass(self):
+        """Test that the bypass marker skips the lookup but refreshes the entry."""
+        cache = make_cache()
+        cache.set("hi", ["old"], used_tool=False)
+        assert cache.lookup("t1", "hi #nocache", True) == ("hi", None, True)
+
+    def test_tool_answers_use_tool_ttl(self):
+        """Test that answers that used a tool are kept for tool_ttl."""
+        cache = make_cache(tool_ttl=0)
+        cache.set("weather", ["sunny"], used_tool=True)
+        assert cache.lookup("t1", "weather", True)[1] is None
+
+    def test_lru_bound(self):
+        """Test that maxsize bounds the number of answers."""
+        cache = make_cache(maxsize=1)
+        cache.set("a", ["1"], used_tool=False)
+        cache.set("b", ["2"], used_tool=False)
+        assert cache.stats()["size"] == 1
+
+    def test_cached_turn_sent_with_next_message(self):
+        """Test that a thread answered from the cache tells the agent what was said."""
+        cache = make_cache()
+        cache.set("hi", ["hello"], used_tool=False)
+        cache.lookup("t1", "hi", True)
+
+        message, _, _ = cache.lookup("t1", "and?", False)
+
+        assert message == "（これまでの会話）\nユーザー: hi\nあなた: hello\n\nand?"
+        assert cache.lookup("t1", "more", False)[0] == "more"
+
+
+class TestCreateAnswerWithCache:
+    """Tests for the response cache in agent.create_answer."""
+
+    @pytest.fixture(autouse=True)
+    def enabled_cache(self):
+        response_cache._answers.clear()
+        response_cache._turns.clear()
+        with patch.object(response_cache, "enabled", True):
+            yield
+
+    @patch('module.agent.agent_engine')
+    def test_second_first_turn_skips_agent(self, mock_agent_engine):
+        """Test that the same question in a new thread is answered without the agent."""
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "s"}]}
+        mock_agent_engine.stream_query.side_effect = lambda **kwargs: iter(
+            [{"content": {"parts": [{"text": "Hello!"}]}}]
+        )
+
+        assert create_answer("t1", "<@U08QRHY4R42> Hi", first_turn=True) == "Hello!"
+        assert create_answer("t2", "<@U08QRHY4R42> hi!", first_turn=True) == "Hello!"
+
+        assert mock_agent_engine.stream_query.call_count == 1
+
+    @patch('module.agent.agent_engine')
+    def test_failed_answer_not_cached(self, mock_agent_engine):
+        """Test that an error is never served from the cache."""
+        mock_agent_engine.list_sessions.return_value = {"sessions": [{"id": "s"}]}
+        mock_agent_engine.stream_query.side_effect = Exception("boom")
+
+        create_answer("t1", "Hi", first_turn=True)
+
+        assert response_cache.lookup("t2", "Hi", True)[1] is None
@@ -0,0 +1,190 @@
+"""Tests for module/shared_state.py."""
+import multiprocessing
+import os
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from module.cache import TTLCache
+from module.dedup import EventDeduplicator, MemoryDedupBackend
+from module.locks import KeyedLock
+from module.ratelimit import RateLimiter
+from module.shared_state import (
+    SharedKeyedLock, SharedLock, SharedTTLCache, new_cache, new_keyed_lock, new_lock, offload,
+)
+
+
+@pytest.fixture
+def shared(tmp_path):
+    """Share the caches created inside the test through a database under tmp_path."""
+    path = str(tmp_path / "state.db")
+    with patch('module.shared_state.SHARED_STATE', 'true'), \
+         patch('module.shared_state.SHARED_STATE_PATH', path):
+        yield path
+
+
+def claim(path, key, results):
+    results.put(SharedTTLCache("dedup", 100, 60, path=path).add(key))
+
+
+class SlowEngine:
+    """Agent engine on which a new session is not listed yet while another worker creates it."""
+
+    def list_sessions(self, user_id):
+        return {"sessions": []}
+
+    def create_session(self, user_id):
+        time.sleep(0.2)
+        return {"id": f"session-{os.getpid()}"}
+
+
+def load_session(path, results):
+    from module import agent
+    with patch.object(agent, "agent_engine", SlowEngine()), \
+         patch.object(agent, "_session_cache", SharedTTLCache("session", 100, 60, path=path)), \
+         patch.object(agent, "_session_locks", SharedKeyedLock(f"{path}.session.lock")):
+        results.put(agent._load_session_id("thread-1"))
+
+
+def run_processes(target, args, count=4):
+    """Run target(*args, results) in count processes and return what they put."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=target, args=(*args, results)) for _ in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    return [results.get(timeout=5) for _ in processes]
+
+
+class TestSharedTTLCache:
+    """Tests for SharedTTLCache."""
+
+    def test_behaves_like_ttl_cache(self, tmp_path, clock):
+        """Test get, set, add, pop and expiry against the shared database."""
+        cache = SharedTTLCache("test", 10, 60, path=str(tmp_path / "state.db"), timer=clock)
+
+        cache.set("a", {"session": "s1"})
+        assert cache.get("a") == {"session": "s1"}
+        assert cache.add("a") is False
+        assert cache.add(("user", "U1"), (1.0, 2.0)) is True
+        assert cache.get(("user", "U1")) == (1.0, 2.0)
+        assert len(cache) == 2
+
+        clock.now += 61
+        assert cache.get("a") is None
+        assert cache.add("a") is True
+        assert cache.pop("a") is True
+        assert cache.pop("a", "gone") == "gone"
+        assert cache.stats() == {"hits": 3, "misses": 3, "size": 0}
+
+    def test_caches_are_separate_by_name(self, tmp_path):
+        """Test that two caches in one database do not see each other's keys."""
+        path = str(tmp_path / "state.db")
+        SharedTTLCache("session", 10, 60, path=path).set("k", 1)
+
+        assert SharedTTLCache("dedup", 10, 60, path=path).get("k") is None
+
+    @patch('module.shared_state.TRIM_EVERY', 1)
+    def test_trimmed_to_maxsize(self, tmp_path):
+        """Test that the entries closest to expiry are dropped beyond maxsize."""
+        cache = SharedTTLCache("test", 2, 60, path=str(tmp_path / "state.db"))
+        for i, ttl in enumerate([30, 10, 20]):
+            cache.set(i, i, ttl=ttl)
+
+        assert cache.get(1) is None
+        assert cache.get(0) == 0
+        assert cache.get(2) == 2
+
+    def test_one_process_claims_a_key(self, tmp_path):
+        """Test that of several processes adding one key, exactly one succeeds."""
+        results = run_processes(claim, (str(tmp_path / "state.db"), "ts:C1:1.0"))
+
+        assert sorted(results) == [False, False, False, True]
+
+
+class TestSharedKeyedLock:
+    """Tests for SharedKeyedLock."""
+
+    def test_one_session_per_thread_across_processes(self, tmp_path):
+        """Test that workers loading the session of one new thread create it once."""
+        results = run_processes(load_session, (str(tmp_path / "state.db"),))
+
+        assert len(set(results)) == 1
+
+    def test_threads_of_a_process_exclude_each_other(self, tmp_path):
+        """Test that the record lock, which belongs to the process, also serializes its threads."""
+        lock = SharedKeyedLock(str(tmp_path / "state.db.lock"), stripes=1)
+        inside = []
+        overlaps = []
+
+        def hold(key):
+            with lock(key):
+                inside.append(key)
+                overlaps.append(len(inside))
+                threading.Event().wait(0.01)
+                inside.remove(key)
+
+        threads = [threading.Thread(target=hold, args=(f"t{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert overlaps == [1, 1, 1, 1]
+
+
+class TestSelection:
+    """Tests for choosing between the process-local and the shared backends."""
+
+    def test_local_by_default(self):
+        """Test that a single worker keeps its caches in process."""
+        with patch('module.shared_state.SHARED_STATE', 'auto'), \
+             patch('module.shared_state.WORKERS', 1):
+            assert isinstance(new_cache("test", 10, 60), TTLCache)
+            assert not isinstance(new_lock("test"), SharedLock)
+            assert isinstance(new_keyed_lock("test"), KeyedLock)
+
+    def test_shared_with_several_workers(self, tmp_path):
+        """Test that the caches are shared when uvicorn runs several workers."""
+        with patch('module.shared_state.SHARED_STATE', 'auto'), \
+             patch('module.shared_state.WORKERS', 4), \
+             patch('module.shared_state.SHARED_STATE_PATH', str(tmp_path / "state.db")):
+            assert isinstance(new_cache("test", 10, 60), SharedTTLCache)
+            assert isinstance(new_lock("test"), SharedLock)
+            assert isinstance(new_keyed_lock("test"), SharedKeyedLock)
+
+    def test_retry_on_another_worker_is_duplicate(self, shared):
+        """Test that a Slack retry reaching another worker is not answered again."""
+        worker1 = EventDeduplicator(MemoryDedupBackend())
+        worker2 = EventDeduplicator(MemoryDedupBackend())
+        event = {"channel": "C1", "ts": "1.0"}
+
+        assert worker1.is_duplicate(event, {"event_id": "Ev1"}) is False
+        assert worker2.is_duplicate(event, {"event_id": "Ev1"}) is True
+
+    def test_rate_limits_span_workers(self, shared, clock):
+        """Test that the workers take their tokens from the same buckets."""
+        worker1 = RateLimiter({"user": (2, 60)}, 100, timer=clock)
+        worker2 = RateLimiter({"user": (2, 60)}, 100, timer=clock)
+
+        assert worker1.acquire({"user": "U1"}) is None
+        assert worker2.acquire({"user": "U1"}) is None
+        assert worker1.acquire({"user": "U1"}) == "user"
+        assert len(worker2) == 1
+
+
+class TestOffload:
+    """Tests for offload()."""
+
+    @pytest.mark.asyncio
+    async def test_shared_state_off_the_loop(self, shared):
+        """Test that calls into the shared state run on another thread."""
+        assert await offload(threading.get_ident) != threading.get_ident()
+
+    @pytest.mark.asyncio
+    async def test_local_state_inline(self):
+        """Test that the in-process state is called directly."""
+        assert await offload(threading.get_ident) == threading.get_ident()
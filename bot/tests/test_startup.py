@@ -0,0 +1,29 @@
+"""Tests for module/startup.py startup timings."""
+import pytest
+
+from module import startup
+
+
+class TestStartupReport:
+    """Tests for timed and report."""
+
+    def test_timed_phase_is_reported(self, caplog):
+        """Test that a timed block shows up in the report and the gauge."""
+        caplog.set_level("INFO", logger="module.startup")
+        with startup.timed("test_phase"):
+            pass
+
+        timings = startup.report()
+
+        assert "test_phase" in timings
+        assert timings["total"] >= timings["test_phase"]
+        assert startup.STARTUP_SECONDS.get(phase="test_phase") >= 0
+        assert caplog.records[-1].json_fields["startup_seconds"] == timings
+
+    def test_timed_records_on_error(self):
+        """Test that a failing phase is still recorded."""
+        with pytest.raises(ValueError):
+            with startup.timed("failing_phase"):
+                raise ValueError
+
+        assert "failing_phase" in startup.report()
@@ -0,0 +1,193 @@
+"""Tests for module/streaming.py progressive replies."""
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from slack_sdk.errors import SlackApiError
+
+from module.streaming import (
+    EMPTY_ANSWER_TEXT,
+    PLACEHOLDER_TEXT,
+    AsyncStreamingReply,
+    FlushScheduler,
+    StreamingReply,
+)
+
+
+def rate_limited_error(retry_after="2"):
+    """SlackApiError as raised for HTTP 429."""
+    response = MagicMock(status_code=429, headers={"Retry-After": retry_after})
+    return SlackApiError("ratelimited", response)
+
+
+def slack_error(error="no_text"):
+    """SlackApiError as raised for an API error other than rate limiting."""
+    response = MagicMock(status_code=200, headers={})
+    response.get.return_value = error
+    return SlackApiError(error, response)
+
+
+class TestFlushScheduler:
+    """Tests for FlushScheduler."""
+
+    def test_flush_after_interval(self, clock):
+        """Test that pending text is flushed once the interval passed."""
+        scheduler = FlushScheduler(interval=1.0, min_chars=100, min_gap=0.3, timer=clock)
+        assert scheduler.should_flush(10) is False
+        clock.now += 1.0
+        assert scheduler.should_flush(10) is True
+        assert scheduler.should_flush(0) is False
+
+    def test_flush_on_size_respects_min_gap(self, clock):
+        """Test that large batches flush early, but not back to back."""
+        scheduler = FlushScheduler(interval=1.0, min_chars=100, min_gap=0.3, timer=clock)
+        clock.now += 0.5
+        assert scheduler.should_flush(100) is True
+        scheduler.flushed()
+        clock.now += 0.1
+        assert scheduler.should_flush(500) is False
+
+    def test_rate_limit_holds_updates(self, clock):
+        """Test that Retry-After blocks updates until it expires."""
+        scheduler = FlushScheduler(interval=1.0, min_chars=100, min_gap=0.3, timer=clock)
+        scheduler.rate_limited(5)
+        clock.now += 2
+        assert scheduler.should_flush(1000) is False
+        assert scheduler.wait_time() == 3
+        clock.now += 3
+        assert scheduler.should_flush(1000) is True
+
+
+class TestStreamingReply:
+    """Tests for StreamingReply."""
+
+    def test_placeholder_updates_and_final_reconciliation(self, clock):
+        """Test the post, batched update and final update sequence."""
+        client = MagicMock()
+        client.chat_postMessage.return_value = {"ts": "2.0"}
+        reply = StreamingReply(
+            client, "C1", "1.0",
+            FlushScheduler(interval=1.0, min_chars=100, min_gap=0.3, timer=clock),
+        )
+
+        reply.start()
+        reply.append("Hello")
+        clock.now += 1.0
+        reply.append("**world**")
+        reply.append("!")
+        reply.finish()
+
+        client.chat_postMessage.assert_called_once_with(
+            channel="C1", thread_ts="1.0", text=PLACEHOLDER_TEXT
+        )
+        texts = [c.kwargs["text"] for c in client.chat_update.call_args_list]
+        assert texts == ["Hello\n*world*", "Hello\n*world*\n!"]
+        assert all(c.kwargs["ts"] == "2.0" for c in client.chat_update.call_args_list)
+
+    @patch('module.streaming.time.sleep')
+    def test_final_update_waits_out_rate_limit(self, mock_sleep):
+        """Test that the final update retries after Retry-After."""
+        client = MagicMock()
+        client.chat_postMessage.return_value = {"ts": "2.0"}
+        client.chat_update.side_effect = [rate_limited_error("2"), None]
+        reply = StreamingReply(client, "C1", "1.0")
+
+        reply.start()
+        reply.append("Hello")
+        reply.finish()
+
+        assert client.chat_update.call_count == 2
+        assert mock_sleep.call_args_list[-1].args[0] > 1.5
+
+    @patch('module.streaming.time.sleep')
+    def test_other_errors_not_retried(self, mock_sleep):
+        """Test that the final update is tried once when Slack refuses it for another reason."""
+        client = MagicMock()
+        client.chat_postMessage.return_value = {"ts": "2.0"}
+        client.chat_update.side_effect = slack_error("msg_too_long")
+        reply = StreamingReply(client, "C1", "1.0")
+
+        reply.start()
+        reply.append("Hello")
+        reply.finish()
+
+        assert client.chat_update.call_count == 1
+
+    def test_empty_answer_replaces_placeholder(self):
+        """Test that an answer without text leaves a fallback line, not the placeholder."""
+        client = MagicMock()
+        client.chat_postMessage.return_value = {"ts": "2.0"}
+        reply = StreamingReply(client, "C1", "1.0")
+
+        reply.start()
+        reply.finish()
+
+        client.chat_update.assert_called_once_with(channel="C1", ts="2.0", text=EMPTY_ANSWER_TEXT)
+
+    def test_long_answer_continues_in_new_messages(self):
+        """Test that a full message is finished and the answer goes on in the next one."""
+        client = MagicMock()
+        client.chat_postMessage.side_effect = [{"ts": "2.0"}, {"ts": "3.0"}, {"ts": "4.0"}]
+        reply = StreamingReply(client, "C1", "1.0", limit=20)
+
+        reply.start()
+        reply.append("aaaa bbbb\n\ncccc dddd")
+        reply.append("eeee ffff\n\ngggg")
+        reply.append("hhhh")
+        reply.finish()
+
+        posts = [c.kwargs["text"] for c in client.chat_postMessage.call_args_list]
+        assert len(posts) == 3
+        assert posts[-1] == "gggg\nhhhh"
+        finals = {}
+        for c in client.chat_update.call_args_list:
+            finals[c.kwargs["ts"]] = c.kwargs["text"]
+        assert finals == {"2.0": "aaaa bbbb", "3.0": "cccc dddd\neeee ffff"}
+
+
+class TestAsyncStreamingReply:
+    """Tests for AsyncStreamingReply."""
+
+    @pytest.mark.asyncio
+    async def test_final_update_writes_full_answer(self):
+        """Test that the full answer is written when the stream ends."""
+        client = AsyncMock()
+        client.chat_postMessage.return_value = {"ts": "2.0"}
+        reply = AsyncStreamingReply(client, "C1", "1.0")
+
+        await reply.start()
+        await reply.append("Hello")
+        await reply.append("world")
+        await reply.finish()
+
+        client.chat_update.assert_awaited_with(channel="C1", ts="2.0", text="Hello\nworld")
+
+    @pytest.mark.asyncio
+    async def test_long_answer_continues_in_new_messages(self):
+        """Test that the chunks of a long answer are posted in order."""
+        client = AsyncMock()
+        client.chat_postMessage.side_effect = [{"ts": "2.0"}, {"ts": "3.0"}]
+        reply = AsyncStreamingReply(client, "C1", "1.0", limit=20)
+
+        await reply.start()
+        await reply.append("aaaa bbbb\n\ncccc dddd\n\neeee")
+        await reply.finish()
+
+        client.chat_update.assert_awaited_once_with(channel="C1", ts="2.0", text="aaaa bbbb")
+        client.chat_postMessage.assert_awaited_with(
+            channel="C1", thread_ts="1.0", text="cccc dddd\n\neeee"
+        )
+
+    @pytest.mark.asyncio
+    @patch('module.streaming.asyncio.sleep')
+    async def test_final_update_waits_out_rate_limit(self, mock_sleep):
+        """Test that the final update waits for Retry-After before trying again."""
+        client = AsyncMock()
+        client.chat_postMessage.return_value = {"ts": "2.0"}
+        client.chat_update.side_effect = [rate_limited_error("2"), None]
+        reply = AsyncStreamingReply(client, "C1", "1.0")
+
+        await reply.start()
+        await reply.finish()
+
+        assert client.chat_update.await_count == 2
+        assert client.chat_update.await_args.kwargs["text"] == EMPTY_ANSWER_TEXT
+        assert mock_sleep.call_args_list[-1].args[0] > 1.5
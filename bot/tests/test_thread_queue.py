@@ -0,0 +1,235 @@
+"""Tests for module/thread_queue.py per-thread work queues."""
+import asyncio
+import threading
+
+import pytest
+
+from module.common import merge_events
+from module.thread_queue import AsyncThreadQueue, ThreadQueue
+from module.worker import BoundedExecutor
+
+
+class TestThreadQueue:
+    """Tests for ThreadQueue."""
+
+    def test_one_thread_is_serialized_and_batched(self):
+        """Test that messages arriving during a turn are answered together next."""
+        executor = BoundedExecutor(4, 4)
+        started = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def handler(key, items):
+            batches.append((key, items))
+            started.set()
+            release.wait(1)
+
+        queue = ThreadQueue(handler, executor, max_pending=10)
+        assert queue.put("t1", "a")
+        started.wait(1)
+        assert queue.put("t1", "b")
+        assert queue.put("t1", "c")
+        release.set()
+        executor.shutdown()
+
+        assert batches == [("t1", ["a"]), ("t1", ["b", "c"])]
+        assert len(queue) == 0
+
+    def test_first_message_does_not_wait(self):
+        """Test that the first message of a thread is handled without a coalescing delay."""
+        executor = BoundedExecutor(2, 2)
+        handled = threading.Event()
+        queue = ThreadQueue(lambda key, items: handled.set(), executor, max_pending=10)
+
+        assert queue.put("t1", "a")
+
+        assert handled.wait(0.05)
+        executor.shutdown()
+
+    def test_threads_run_concurrently(self):
+        """Test that different threads do not wait for each other."""
+        executor = BoundedExecutor(2, 2)
+        barrier = threading.Barrier(2, timeout=1)
+        queue = ThreadQueue(lambda key, items: barrier.wait(), executor, max_pending=10)
+
+        assert queue.put("t1", "a")
+        assert queue.put("t2", "b")
+        executor.shutdown()
+
+        assert not barrier.broken
+
+    def test_rejected_when_executor_is_full(self):
+        """Test that a new thread is refused when the executor is saturated."""
+        executor = BoundedExecutor(1, 0)
+        release = threading.Event()
+        queue = ThreadQueue(lambda key, items: release.wait(1), executor, max_pending=10)
+
+        assert queue.put("t1", "a")
+        assert not queue.put("t2", "b")
+        assert len(queue) == 1
+        release.set()
+        executor.shutdown()
+
+    def test_rejected_when_thread_queue_is_full(self):
+        """Test that max_pending bounds the messages waiting in one thread."""
+        executor = BoundedExecutor(1, 0)
+        release = threading.Event()
+        started = threading.Event()
+
+        def handler(key, items):
+            started.set()
+            release.wait(1)
+
+        queue = ThreadQueue(handler, executor, max_pending=1)
+        assert queue.put("t1", "a")
+        started.wait(1)
+        assert queue.put("t1", "b")
+        assert not queue.put("t1", "c")
+        release.set()
+        executor.shutdown()
+
+    def test_handler_error_does_not_stop_thread(self):
+        """Test that a failing batch does not drop the following ones."""
+        executor = BoundedExecutor(1, 1)
+        started = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def handler(key, items):
+            batches.append(items)
+            if items == ["a"]:
+                started.set()
+                release.wait(1)
+                raise RuntimeError("boom")
+
+        queue = ThreadQueue(handler, executor, max_pending=10)
+        queue.put("t1", "a")
+        started.wait(1)
+        queue.put("t1", "b")
+        release.set()
+        executor.shutdown()
+
+        assert batches == [["a"], ["b"]]
+
+    def test_closed_queue_starts_nothing_more(self):
+        """Test that a closed queue refuses items and leaves the waiting ones unhandled."""
+        executor = BoundedExecutor(1, 1)
+        started = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def handler(key, items):
+            batches.append(items)
+            started.set()
+            release.wait(1)
+
+        queue = ThreadQueue(handler, executor, max_pending=10)
+        queue.put("t1", "a")
+        started.wait(1)
+        queue.put("t1", "b")
+        queue.close()
+        assert not queue.put("t2", "c")
+        release.set()
+        executor.shutdown()
+
+        assert batches == [["a"]]
+        assert len(queue) == 0
+
+
+class TestAsyncThreadQueue:
+    """Tests for AsyncThreadQueue."""
+
+    @pytest.mark.asyncio
+    async def test_messages_during_a_turn_are_one_batch(self):
+        """Test that messages arriving while a turn runs are handled next, together and in order."""
+        batches = []
+        release = asyncio.Event()
+
+        async def handler(key, items):
+            batches.append(items)
+            await release.wait()
+
+        queue = AsyncThreadQueue(handler, max_pending=10, max_active=10)
+        assert queue.put("t1", "a")
+        await asyncio.sleep(0)
+        for item in ["b", "c"]:
+            assert queue.put("t1", item)
+        release.set()
+        await queue.join()
+
+        assert batches == [["a"], ["b", "c"]]
+        assert len(queue) == 0
+
+    @pytest.mark.asyncio
+    async def test_serialized_per_thread(self):
+        """Test that one thread never runs two batches at once."""
+        running = []
+        overlaps = []
+
+        async def handler(key, items):
+            running.append(key)
+            overlaps.append(running.count(key))
+            await asyncio.sleep(0.01)
+            running.remove(key)
+
+        queue = AsyncThreadQueue(handler, max_pending=10, max_active=10)
+        queue.put("t1", "a")
+        await asyncio.sleep(0)
+        queue.put("t1", "b")
+        queue.put("t2", "c")
+        await queue.join()
+
+        assert max(overlaps) == 1
+
+    @pytest.mark.asyncio
+    async def test_max_active(self):
+        """Test that new threads are refused beyond max_active."""
+        async def handler(key, items):
+            await asyncio.sleep(0.01)
+
+        queue = AsyncThreadQueue(handler, max_pending=10, max_active=1)
+        assert queue.put("t1", "a")
+        assert queue.put("t1", "b")
+        assert not queue.put("t2", "c")
+        await queue.join()
+
+    @pytest.mark.asyncio
+    async def test_closed_queue_starts_nothing_more(self):
+        """Test that a closed queue refuses items and leaves the waiting ones unhandled."""
+        batches = []
+
+        async def handler(key, items):
+            batches.append(items)
+            await asyncio.sleep(0.01)
+
+        queue = AsyncThreadQueue(handler, max_pending=10, max_active=10)
+        queue.put("t1", "a")
+        await asyncio.sleep(0)
+        queue.put("t1", "b")
+        queue.close()
+        assert not queue.put("t2", "c")
+        await queue.join()
+
+        assert batches == [["a"]]
+
+
+class TestMergeEvents:
+    """Tests for merge_events."""
+
+    def test_single_event_unchanged(self):
+        """Test that a lone event is passed through."""
+        event = {"text": "<@U08QRHY4R42> hi", "ts": "1.0"}
+        assert merge_events([event]) is event
+
+    def test_merged_into_last(self):
+        """Test that texts are joined without mentions and the last ts is kept."""
+        events = [
+            {"text": "<@U08QRHY4R42> 東京の", "ts": "1.0", "thread_ts": "0.5"},
+            {"text": "<@U08QRHY4R42> 天気は?", "ts": "2.0", "thread_ts": "0.5"},
+        ]
+
+        merged = merge_events(events)
+
+        assert merged["text"] == "東京の\n天気は?"
+        assert merged["ts"] == "2.0"
+        assert merged["thread_ts"] == "0.5"
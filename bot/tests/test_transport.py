@@ -0,0 +1,101 @@
+"""Tests for module/transport.py and module/async_transport.py pooled clients."""
+from unittest.mock import patch, MagicMock
+
+import pytest
+from slack_bolt.context import BoltContext
+from slack_sdk import WebClient
+
+from benchmarks.fakes import StubSlackServer
+from module import async_transport, transport
+from module.async_transport import PooledAsyncWebClient
+from module.transport import PooledWebClient, keep_agent_engine_client
+
+
+@pytest.fixture
+def stub():
+    server = StubSlackServer().start()
+    yield server
+    server.stop()
+
+
+class TestPooledWebClient:
+    """Tests for PooledWebClient."""
+
+    def test_connection_is_reused(self, stub):
+        """Test that clients share kept-alive connections."""
+        opened = transport.CONNECTIONS_OPENED.get(client="slack")
+        for _ in range(3):
+            client = PooledWebClient(token="xoxb-test", base_url=stub.base_url)
+            client.chat_postMessage(channel="C123456", text="hi")
+
+        assert len(stub.posts) == 3
+        assert stub.connections == 1
+        assert transport.CONNECTIONS_OPENED.get(client="slack") - opened <= 1
+
+    def test_idle_connection_is_closed(self, stub):
+        """Test that a connection idle longer than the keep-alive is not reused."""
+        client = PooledWebClient(token="xoxb-test", base_url=stub.base_url)
+        with patch.object(transport, "HTTP_KEEPALIVE", 0):
+            client.chat_postMessage(channel="C123456", text="hi")
+            client.chat_postMessage(channel="C123456", text="hi")
+
+        assert stub.connections == 2
+
+    def test_from_client_keeps_settings(self):
+        """Test that the settings Bolt gives a per-request client are carried over."""
+        client = WebClient(token="xoxb-test", base_url="http://localhost/api/", team_id="T1")
+
+        pooled = PooledWebClient.from_client(client)
+
+        assert pooled.token == "xoxb-test"
+        assert pooled.base_url == "http://localhost/api/"
+        assert pooled.default_params["team_id"] == "T1"
+
+    def test_middleware_replaces_client_and_say(self):
+        """Test that the app middleware hands listeners a pooled client."""
+        from module.app import use_pooled_client
+
+        context = BoltContext(client=WebClient(token="xoxb-test"), channel_id="C123456")
+        stale_say = context.say
+        next_ = MagicMock()
+
+        use_pooled_client(context, next_)
+
+        assert isinstance(context.client, PooledWebClient)
+        assert context.say is not stale_say
+        assert context.say.client is context.client
+        next_.assert_called_once()
+
+
+class TestPooledAsyncWebClient:
+    """Tests for PooledAsyncWebClient."""
+
+    @pytest.mark.asyncio
+    async def test_session_is_shared(self, stub):
+        """Test that clients on one loop post over a single pooled session."""
+        clients = [
+            PooledAsyncWebClient(token="xoxb-test", base_url=stub.base_url) for _ in range(3)
+        ]
+        for client in clients:
+            await client.chat_postMessage(channel="C123456", text="hi")
+
+        assert clients[0].session is clients[2].session
+        assert stub.connections == 1
+        await async_transport.shared_session().close()
+
+    def test_no_session_outside_loop(self):
+        """Test that nothing is created before an event loop runs."""
+        assert PooledAsyncWebClient(token="xoxb-test").session is None
+
+
+class TestKeepAgentEngineClient:
+    """Tests for keep_agent_engine_client."""
+
+    def test_fake_engine_untouched(self):
+        """Test that engines not built by the SDK are left as they are."""
+        engine = MagicMock()
+        client = engine.execution_api_client
+
+        keep_agent_engine_client(engine)
+
+        assert engine.execution_api_client is client
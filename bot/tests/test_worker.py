@@ -0,0 +1,41 @@
+"""Tests for module/worker.py bounded executor."""
+import threading
+
+from module.worker import BoundedExecutor
+
+
+class TestBoundedExecutor:
+    """Tests for BoundedExecutor."""
+
+    def test_submit_runs_task(self):
+        """Test that submitted work runs and returns its result."""
+        executor = BoundedExecutor(max_workers=1, queue_size=0)
+        future = executor.submit(lambda x: x * 2, 21)
+        assert future.result(timeout=1) == 42
+        executor.shutdown()
+
+    def test_rejects_when_saturated(self):
+        """Test that work beyond workers + queue size is refused."""
+        executor = BoundedExecutor(max_workers=1, queue_size=1)
+        release = threading.Event()
+
+        first = executor.submit(release.wait)
+        second = executor.submit(release.wait)
+        third = executor.submit(release.wait)
+
+        assert first is not None
+        assert second is not None
+        assert third is None
+        assert executor.pending == 2
+
+        release.set()
+        first.result(timeout=1)
+        second.result(timeout=1)
+        executor.shutdown()
+
+    def test_slot_released_after_completion(self):
+        """Test that finished tasks free their slot."""
+        executor = BoundedExecutor(max_workers=1, queue_size=0)
+        executor.submit(lambda: None).result(timeout=1)
+        executor.shutdown(wait=True)
+        assert executor.pending == 0